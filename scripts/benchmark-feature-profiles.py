@@ -0,0 +1,98 @@
+import math
+import sys
+import time
+
+import numpy as np
+
+from catalogue.FeatureProfileComputation import FeatureProfileComputation
+from database.Database import Database
+from database.Execution import Execution
+from database.IndexAdvisor import IndexAdvisor
+from entities.Feature import Feature
+from entities.Record import Record
+from entities.Resource import Resource
+from enums.DataTypes import DataTypes
+from enums.Profile import Profile
+from enums.ProfileEngines import ProfileEngines
+from enums.TableNames import TableNames
+from utils.setup_logger import log
+
+# compares the time to compute the feature profiles of a synthetic Record table:
+# - before: one MongoDB aggregation pipeline per profile statistic (ProfileEngines.AGGREGATIONS)
+# - after: a single read of the records, partitioned by feature (ProfileEngines.SINGLE_PASS)
+# this requires a running MongoDB server (the one of the .env configuration), whose database is dropped
+# usage (from the project root): PYTHONPATH=src:. python scripts/benchmark-feature-profiles.py [nb_records]
+
+NB_DATASETS = 4
+NB_PATIENTS = 100000
+FEATURE_TYPES = [DataTypes.INTEGER, DataTypes.FLOAT, DataTypes.CATEGORY, DataTypes.BOOLEAN, DataTypes.DATE]
+CATEGORIES = [{"system": "http://snomed.info/sct", "code": f"24815{i}002"} for i in range(6)]
+STATISTICS = ["min_value", "max_value", "mean_value", "median_value", "std_value", "ema", "skewness", "kurtosis",
+              "imbalance", "constancy", "mode", "uniqueness", "entropy", "values_and_counts"]
+
+
+def generate_records(database: Database, nb_records: int, batch_size: int = 100000) -> None:
+    rng = np.random.default_rng(seed=42)
+    database.insert_many_tuples(table_name=TableNames.FEATURE, tuples=[{Resource.IDENTIFIER_: i + 1, Feature.DT_: data_type} for i, data_type in enumerate(FEATURE_TYPES)])
+    for start in range(0, nb_records, batch_size):
+        size = min(batch_size, nb_records - start)
+        features = rng.integers(1, len(FEATURE_TYPES) + 1, size=size)
+        datasets = rng.integers(1, NB_DATASETS + 1, size=size)
+        patients = rng.integers(1, NB_PATIENTS + 1, size=size)
+        integers = rng.integers(0, 100, size=size)
+        floats = rng.normal(loc=70, scale=15, size=size).round(2)
+        records = []
+        for i in range(size):
+            data_type = FEATURE_TYPES[features[i] - 1]
+            if data_type == DataTypes.INTEGER:
+                value = int(integers[i])
+            elif data_type == DataTypes.FLOAT:
+                value = float(floats[i])
+            elif data_type == DataTypes.CATEGORY:
+                value = CATEGORIES[integers[i] % len(CATEGORIES)]
+            elif data_type == DataTypes.BOOLEAN:
+                value = bool(integers[i] % 2)
+            else:
+                value = f"19{integers[i]:02d}-01-01"
+            records.append({Resource.IDENTIFIER_: start + i + 1, Record.DATASET_: int(datasets[i]), Record.INSTANTIATES_: int(features[i]),
+                            Record.SUBJECT_: int(patients[i]), Record.VALUE_: value, Resource.ENTITY_TYPE_: f"{Profile.PHENOTYPIC}{TableNames.RECORD}"})
+        database.insert_many_tuples(table_name=TableNames.RECORD, tuples=records, acknowledged=True)
+    for columns in IndexAdvisor.RECORD_INDEXES:
+        database.create_non_unique_index(table_name=TableNames.RECORD, columns=columns)
+
+
+def compute_profiles(database: Database, engine: str) -> tuple[float, dict]:
+    start = time.time()
+    FeatureProfileComputation(database=database, engine=engine).compute_features_profiles()
+    elapsed_time = time.time() - start
+    profiles = database.find_operation(table_name=TableNames.FEATURE_PROFILE, filter_dict={}, projection={"_id": 0})
+    return elapsed_time, {(profile[Record.DATASET_], profile[Record.INSTANTIATES_]): profile for profile in profiles}
+
+
+def same_value(value1, value2) -> bool:
+    if isinstance(value1, list) and isinstance(value2, list):
+        # the aggregations do not order the values and counts
+        return sorted(value1, key=str) == sorted(value2, key=str)
+    elif isinstance(value1, float) and isinstance(value2, (int, float)):
+        return math.isclose(value1, value2, rel_tol=1e-6, abs_tol=1e-9)
+    return value1 == value2
+
+
+if __name__ == '__main__':
+    nb_records = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+    execution = Execution()
+    execution.internals_set_up()
+    database = Database(execution=execution)
+    database.drop_db()
+    generate_records(database=database, nb_records=nb_records)
+
+    before_time, before_profiles = compute_profiles(database=database, engine=ProfileEngines.AGGREGATIONS)
+    after_time, after_profiles = compute_profiles(database=database, engine=ProfileEngines.SINGLE_PASS)
+
+    log.info(f"{nb_records} records, {len(after_profiles)} feature profiles")
+    log.info(f"aggregations: {before_time:.2f}s")
+    log.info(f"single pass: {after_time:.2f}s")
+    log.info(f"speedup: {before_time / after_time:.2f}x")
+    for statistic in STATISTICS:
+        nb_different = sum(1 for key, profile in before_profiles.items() if statistic in profile and not same_value(profile[statistic], after_profiles.get(key, {}).get(statistic)))
+        log.info(f"{statistic}: {nb_different} different profiles")
@@ -0,0 +1,68 @@
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+import pyarrow
+
+from constants.structure import DOCKER_FOLDER_TEST
+from enums.MetadataColumns import MetadataColumns
+from enums.TheTestFiles import TheTestFiles
+from utils.file_utils import read_tabular_file_as_arrow, read_tabular_file_as_string
+from utils.setup_logger import log
+
+# compares the time and the memory to read and normalize the test data files (repeated to get larger files):
+# - per cell: one Python str per cell, normalized with MetadataColumns.normalize_value() on each cell
+# - vectorized: one Python str per cell, normalized with MetadataColumns.normalize_values() (IngestionBackends.PANDAS)
+# - arrow: Arrow string columns, normalized with Arrow compute kernels (IngestionBackends.ARROW)
+# the memory is the peak of Python allocations (tracemalloc) plus the peak of Arrow allocations
+# usage (from the project root): PYTHONPATH=src:. python scripts/benchmark-ingestion.py [nb_copies]
+
+DATA_FILES = [TheTestFiles.ORIG_PHENOTYPIC_PATH, TheTestFiles.ORIG_CLINICAL_PATH, TheTestFiles.ORIG_DIAGNOSIS_PATH, TheTestFiles.ORIG_GENOMICS_PATH]
+
+
+def repeat_data_file(filepath: str, nb_copies: int, directory: str) -> str:
+    data = read_tabular_file_as_string(filepath=filepath)
+    repeated_filepath = os.path.join(directory, os.path.basename(filepath))
+    pd.concat([data] * nb_copies, ignore_index=True).to_csv(repeated_filepath, index=False)
+    return repeated_filepath
+
+
+def read_and_normalize(filepath: str, mode: str) -> pd.DataFrame:
+    data = read_tabular_file_as_arrow(filepath=filepath) if mode == "arrow" else read_tabular_file_as_string(filepath=filepath)
+    for column in data:
+        if mode == "arrow":
+            data[column] = MetadataColumns.normalize_values_with_arrow(values=data[column])
+        elif mode == "vectorized":
+            data.loc[:, column] = MetadataColumns.normalize_values(values=data[column])
+        else:
+            data.loc[:, column] = data[column].apply(lambda x: MetadataColumns.normalize_value(column_value=x))
+    return data
+
+
+def measure(filepath: str, mode: str) -> tuple[pd.DataFrame, float, float]:
+    pool = pyarrow.default_memory_pool()
+    pool.release_unused()
+    tracemalloc.start()
+    start = time.time()
+    data = read_and_normalize(filepath=filepath, mode=mode)
+    elapsed_time = time.time() - start
+    _, peak_python = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return data, elapsed_time, (peak_python + pool.max_memory()) / (1000 * 1000)
+
+
+if __name__ == '__main__':
+    nb_copies = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    with tempfile.TemporaryDirectory() as directory:
+        for data_file in DATA_FILES:
+            filepath = repeat_data_file(filepath=os.path.join(DOCKER_FOLDER_TEST, data_file), nb_copies=nb_copies, directory=directory)
+            per_cell_data, per_cell_time, per_cell_memory = measure(filepath=filepath, mode="per_cell")
+            log.info(f"{data_file}: {len(per_cell_data)} rows, {os.path.getsize(filepath) / (1000 * 1000):.1f} MB")
+            log.info(f"per cell: {per_cell_time:.2f}s ({len(per_cell_data) / per_cell_time:.0f} rows/s), peak memory {per_cell_memory:.1f} MB")
+            for mode in ["vectorized", "arrow"]:
+                data, elapsed_time, memory = measure(filepath=filepath, mode=mode)
+                log.info(f"{mode}: {elapsed_time:.2f}s ({len(data) / elapsed_time:.0f} rows/s), peak memory {memory:.1f} MB, "
+                         f"speedup {per_cell_time / elapsed_time:.2f}x, same data: {per_cell_data.equals(data)}")
@@ -0,0 +1,129 @@
+import math
+import sys
+import time
+
+import numpy as np
+
+from catalogue.FeatureProfileComputation import FeatureProfileComputation
+from database.Database import Database
+from database.Execution import Execution
+from database.IndexAdvisor import IndexAdvisor
+from database.RecordBuckets import RecordBuckets
+from entities.Feature import Feature
+from entities.Record import Record
+from entities.Resource import Resource
+from enums.DataTypes import DataTypes
+from enums.Profile import Profile
+from enums.RecordLayouts import RecordLayouts
+from enums.TableNames import TableNames
+from utils.setup_logger import log
+
+# compares the storage, load time and profile time of a synthetic set of records in both record layouts:
+# - documents: one document per record in the Record table (RecordLayouts.DOCUMENTS)
+# - buckets: one document per (dataset, feature, chunk of records) in the RecordBucket table, with parallel arrays (RecordLayouts.BUCKETS)
+# this requires a running MongoDB server (the one of the .env configuration), whose database is dropped
+# usage (from the project root): PYTHONPATH=src:. python scripts/benchmark-record-layouts.py [nb_records]
+
+NB_DATASETS = 4
+NB_PATIENTS = 100000
+NB_FEATURES = 50
+FEATURE_TYPES = [DataTypes.INTEGER, DataTypes.FLOAT, DataTypes.CATEGORY, DataTypes.BOOLEAN, DataTypes.DATE]
+CATEGORIES = [{"system": "http://snomed.info/sct", "code": f"24815{i}002"} for i in range(6)]
+BATCH_SIZE = 100000
+
+
+def generate_records(nb_records: int) -> list:
+    rng = np.random.default_rng(seed=42)
+    features = rng.integers(1, NB_FEATURES + 1, size=nb_records)
+    datasets = rng.integers(1, NB_DATASETS + 1, size=nb_records)
+    patients = rng.integers(1, NB_PATIENTS + 1, size=nb_records)
+    integers = rng.integers(0, 100, size=nb_records)
+    floats = rng.normal(loc=70, scale=15, size=nb_records).round(2)
+    records = []
+    for i in range(nb_records):
+        data_type = FEATURE_TYPES[features[i] % len(FEATURE_TYPES)]
+        if data_type == DataTypes.INTEGER:
+            value = int(integers[i])
+        elif data_type == DataTypes.FLOAT:
+            value = float(floats[i])
+        elif data_type == DataTypes.CATEGORY:
+            value = CATEGORIES[integers[i] % len(CATEGORIES)]
+        elif data_type == DataTypes.BOOLEAN:
+            value = bool(integers[i] % 2)
+        else:
+            value = f"19{integers[i]:02d}-01-01"
+        records.append({Resource.IDENTIFIER_: i + 1, Record.DATASET_: int(datasets[i]), Record.INSTANTIATES_: int(features[i]),
+                        Record.SUBJECT_: int(patients[i]), Record.VALUE_: value, Resource.ENTITY_TYPE_: f"{Profile.PHENOTYPIC}{TableNames.RECORD}"})
+    return records
+
+
+def generate_buckets(records: list) -> list:
+    # as the Transform does, the records of a (dataset, feature) pair are grouped in buckets of at most BUCKET_SIZE records
+    records_per_feature = {}
+    for record in records:
+        records_per_feature.setdefault((record[Record.DATASET_], record[Record.INSTANTIATES_]), []).append(record)
+    buckets = []
+    for feature_records in records_per_feature.values():
+        for start in range(0, len(feature_records), RecordBuckets.BUCKET_SIZE):
+            chunk = feature_records[start:start + RecordBuckets.BUCKET_SIZE]
+            bucket = {field: chunk[0][field] for field in RecordBuckets.SHARED_FIELDS if field in chunk[0]}
+            bucket[RecordBuckets.BUCKET_ID_] = chunk[0][Resource.IDENTIFIER_]
+            for field in RecordBuckets.ARRAY_FIELDS:
+                bucket[field] = [record[field] for record in chunk]
+            buckets.append(bucket)
+    return buckets
+
+
+def load(database: Database, table_name: str, tuples: list, indexes: list) -> float:
+    start = time.time()
+    for i in range(0, len(tuples), BATCH_SIZE):
+        database.insert_many_tuples(table_name=table_name, tuples=tuples[i:i + BATCH_SIZE], acknowledged=True)
+    for columns in indexes:
+        database.create_non_unique_index(table_name=table_name, columns=columns)
+    return time.time() - start
+
+
+def compute_profiles(database: Database, record_layout: str) -> tuple[float, dict]:
+    database.drop_table(table_name=TableNames.FEATURE_PROFILE)
+    start = time.time()
+    FeatureProfileComputation(database=database, record_layout=record_layout).compute_features_profiles()
+    elapsed_time = time.time() - start
+    profiles = database.find_operation(table_name=TableNames.FEATURE_PROFILE, filter_dict={}, projection={"_id": 0, Resource.TIMESTAMP_: 0})
+    return elapsed_time, {(profile[Record.DATASET_], profile[Record.INSTANTIATES_]): profile for profile in profiles}
+
+
+def same_value(value1, value2) -> bool:
+    # records are not read in the same order in both layouts, thus floating-point sums may slightly differ
+    if isinstance(value1, dict) and isinstance(value2, dict):
+        return value1.keys() == value2.keys() and all(same_value(value1[key], value2[key]) for key in value1)
+    elif isinstance(value1, list) and isinstance(value2, list):
+        return len(value1) == len(value2) and all(same_value(element1, element2) for element1, element2 in zip(sorted(value1, key=str), sorted(value2, key=str)))
+    elif isinstance(value1, float) and isinstance(value2, (int, float)):
+        return math.isclose(value1, value2, rel_tol=1e-6, abs_tol=1e-9)
+    return value1 == value2
+
+
+if __name__ == '__main__':
+    nb_records = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+    execution = Execution()
+    execution.internals_set_up()
+    database = Database(execution=execution)
+    database.drop_db()
+    database.insert_many_tuples(table_name=TableNames.FEATURE, tuples=[{Resource.IDENTIFIER_: i + 1, Feature.DT_: FEATURE_TYPES[(i + 1) % len(FEATURE_TYPES)]} for i in range(NB_FEATURES)])
+    records = generate_records(nb_records=nb_records)
+    buckets = generate_buckets(records=records)
+
+    # insert_many adds an _id to each tuple, thus buckets are generated before
+    documents_load_time = load(database=database, table_name=TableNames.RECORD, tuples=records, indexes=IndexAdvisor.RECORD_INDEXES)
+    buckets_load_time = load(database=database, table_name=TableNames.RECORD_BUCKET, tuples=buckets, indexes=IndexAdvisor.RECORD_BUCKET_INDEXES)
+    documents_profile_time, documents_profiles = compute_profiles(database=database, record_layout=RecordLayouts.DOCUMENTS)
+    buckets_profile_time, buckets_profiles = compute_profiles(database=database, record_layout=RecordLayouts.BUCKETS)
+
+    log.info(f"{nb_records} records, {len(buckets)} buckets, {len(buckets_profiles)} feature profiles")
+    for layout, table_name, load_time, profile_time in [(RecordLayouts.DOCUMENTS, TableNames.RECORD, documents_load_time, documents_profile_time),
+                                                        (RecordLayouts.BUCKETS, TableNames.RECORD_BUCKET, buckets_load_time, buckets_profile_time)]:
+        coll_stats = database.db.command("collStats", table_name)
+        log.info(f"{layout}: data size {coll_stats['size'] / 1e6:.1f} MB, storage size {coll_stats['storageSize'] / 1e6:.1f} MB, "
+                 f"index size {coll_stats['totalIndexSize'] / 1e6:.1f} MB, load {load_time:.2f}s, profiles {profile_time:.2f}s")
+    nb_different = sum(1 for key, profile in documents_profiles.items() if not same_value(profile, buckets_profiles.get(key)))
+    log.info(f"{nb_different} different profiles")
@@ -0,0 +1,100 @@
+import sys
+import time
+
+import numpy as np
+from pandas import DataFrame
+
+from constants.defaults import NO_ID
+from database.Execution import Execution
+from entities.PhenotypicRecord import PhenotypicRecord
+from enums.DataTypes import DataTypes
+from enums.Profile import Profile
+from enums.Visibility import Visibility
+from etl.Transform import Transform
+from statistics.QualityStatistics import QualityStatistics
+from utils.setup_logger import log
+
+# compares the throughput (rows/second) of the record creation in Transform:
+# - before: one Record instance per cell (row by row, column by column), serialized with to_json()
+# - after: column-wise creation with Transform.generate_records()
+# usage (from the project root): PYTHONPATH=src:. python scripts/benchmark-transform-records.py [nb_rows]
+
+SEX = {"f": {"system": "http://snomed.info/sct", "code": "248152002", "label": "Female"},
+       "m": {"system": "http://snomed.info/sct", "code": "248153007", "label": "Male"}}
+
+
+def generate_data(nb_rows: int) -> DataFrame:
+    rng = np.random.default_rng(seed=42)
+    return DataFrame({
+        "id": [str(i) for i in range(nb_rows)],
+        "sex": rng.choice(["f", "m", "", "x"], size=nb_rows, p=[0.45, 0.45, 0.05, 0.05]),
+        "age": rng.choice([f"{i}" for i in range(100)] + ["12 years", ""], size=nb_rows),
+        "weight": rng.choice([f"{i}.5" for i in range(40, 120)] + ["80 kg", ""], size=nb_rows),
+        "diabetes": rng.choice(["1", "0", "0.0", "yes", ""], size=nb_rows),
+        "date_of_birth": rng.choice([f"19{i:02d}-0{(i % 9) + 1}-1{i % 10}" for i in range(100)] + [""], size=nb_rows),
+        "ethnicity": rng.choice(["white", "black", "asian", ""], size=nb_rows),
+    })
+
+
+def create_transform(data: DataFrame) -> Transform:
+    transform = Transform(database=None, execution=Execution(), data=data, metadata=DataFrame(),
+                          mapping_column_to_categorical_value={"sex": SEX},
+                          mapping_column_to_unit={"weight": "kg"}, mapping_column_to_domain={},
+                          mapping_column_to_type={"sex": DataTypes.CATEGORY, "age": DataTypes.INTEGER,
+                                                  "weight": DataTypes.FLOAT, "diabetes": DataTypes.BOOLEAN,
+                                                  "date_of_birth": DataTypes.DATE, "ethnicity": DataTypes.STRING},
+                          profile=Profile.PHENOTYPIC, dataset_id=1, dataset_key=None, load_patients=False,
+                          quality_stats=QualityStatistics(record_stats=True))
+    transform.mapping_column_to_visibility = {"date_of_birth": Visibility.ANONYMIZED}
+    transform.patient_ids_mapping = {pid: i + 1 for i, pid in enumerate(data["id"])}
+    return transform
+
+
+def per_cell_records(transform: Transform, mapping_column_to_feature_id: dict, hospital_id: int) -> list:
+    # the record creation as it was done before, kept here as a reference
+    records = []
+    columns = transform.data.columns
+    for row in transform.data.itertuples(index=False):
+        for column_name in columns:
+            value = row[columns.get_loc(column_name)]
+            if value == "":
+                transform.quality_stats.count_empty_cell_for_column(column_name=column_name)
+            elif column_name in mapping_column_to_feature_id:
+                patient_id = transform.patient_ids_mapping[row[columns.get_loc(transform.execution.patient_id_column_name)]]
+                fairified_value = transform.fairify_value(column_name=column_name, value=value)
+                anonymized_value, is_anonymized = transform.anonymize_value(column_name=column_name, fairified_value=fairified_value)
+                if is_anonymized:
+                    fairified_value = anonymized_value
+                records.append(PhenotypicRecord(identifier=NO_ID, instantiates=mapping_column_to_feature_id[column_name],
+                                                has_subject=patient_id, registered_by=hospital_id, value=fairified_value,
+                                                counter=transform.counter, dataset=None).to_json())
+    return records
+
+
+def without_timestamps(records: list) -> list:
+    return [{key: value for key, value in record.items() if key != "timestamp"} for record in records]
+
+
+if __name__ == '__main__':
+    nb_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    data = generate_data(nb_rows=nb_rows)
+    mapping_column_to_feature_id = {column_name: i + 1 for i, column_name in enumerate(data.columns) if column_name != "id"}
+
+    before_transform = create_transform(data=data)
+    start = time.time()
+    before_records = per_cell_records(transform=before_transform, mapping_column_to_feature_id=mapping_column_to_feature_id, hospital_id=1)
+    before_time = time.time() - start
+
+    after_transform = create_transform(data=data)
+    start = time.time()
+    after_records = []
+    for batch_of_records in after_transform.generate_records(mapping_column_to_feature_id=mapping_column_to_feature_id, hospital_id=1):
+        after_records.extend(batch_of_records)
+    after_time = time.time() - start
+
+    log.info(f"{nb_rows} rows, {len(after_records)} records")
+    log.info(f"per-cell records: {before_time:.2f}s ({nb_rows / before_time:.0f} rows/s)")
+    log.info(f"column-wise records: {after_time:.2f}s ({nb_rows / after_time:.0f} rows/s)")
+    log.info(f"speedup: {before_time / after_time:.2f}x")
+    log.info(f"same records: {without_timestamps(before_records) == without_timestamps(after_records)}")
+    log.info(f"same quality statistics: {before_transform.quality_stats.to_json() | {'timestamp': None} == after_transform.quality_stats.to_json() | {'timestamp': None}}")
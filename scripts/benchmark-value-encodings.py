@@ -0,0 +1,84 @@
+import sys
+import time
+
+import numpy as np
+
+from catalogue.FeatureProfileComputation import FeatureProfileComputation
+from database.Database import Database
+from database.Execution import Execution
+from database.IndexAdvisor import IndexAdvisor
+from entities.Feature import Feature
+from entities.Record import Record
+from entities.Resource import Resource
+from enums.DataTypes import DataTypes
+from enums.Profile import Profile
+from enums.TableNames import TableNames
+from enums.ValueEncodings import ValueEncodings
+from utils.setup_logger import log
+
+# compares the size of a synthetic Record table of categorical values, and the time to compute its feature profiles, in both value encodings:
+# - verbose: each categorical value is an ontology resource, i.e., an object with a system, a code and a label (ValueEncodings.VERBOSE)
+# - compact: each categorical value is the index of its category in the categories of the Feature (ValueEncodings.COMPACT)
+# this requires a running MongoDB server (the one of the .env configuration), whose database is dropped
+# usage (from the project root): PYTHONPATH=src:. python scripts/benchmark-value-encodings.py [nb_records]
+
+NB_DATASETS = 4
+NB_PATIENTS = 100000
+NB_FEATURES = 20
+NB_CATEGORIES = 8
+BATCH_SIZE = 100000
+
+
+def get_categories(feature_id: int) -> list:
+    return [{"system": "http://snomed.info/sct", "code": f"{feature_id}{i:03d}002", "label": f"category {i} of feature {feature_id}"} for i in range(NB_CATEGORIES)]
+
+
+def generate_records(database: Database, nb_records: int, value_encoding: str) -> float:
+    rng = np.random.default_rng(seed=42)
+    for table_name in [TableNames.FEATURE, TableNames.RECORD, TableNames.FEATURE_PROFILE]:
+        database.drop_table(table_name=table_name)
+    database.insert_many_tuples(table_name=TableNames.FEATURE, tuples=[{Resource.IDENTIFIER_: i + 1, Feature.DT_: DataTypes.CATEGORY, Feature.CATEGORIES_: get_categories(feature_id=i + 1)}
+                                                                       for i in range(NB_FEATURES)])
+    categories_per_feature = {i + 1: get_categories(feature_id=i + 1) for i in range(NB_FEATURES)}
+    start = time.time()
+    for batch_start in range(0, nb_records, BATCH_SIZE):
+        size = min(BATCH_SIZE, nb_records - batch_start)
+        features = rng.integers(1, NB_FEATURES + 1, size=size)
+        datasets = rng.integers(1, NB_DATASETS + 1, size=size)
+        patients = rng.integers(1, NB_PATIENTS + 1, size=size)
+        indexes = rng.integers(0, NB_CATEGORIES, size=size)
+        records = []
+        for i in range(size):
+            value = int(indexes[i]) if value_encoding == ValueEncodings.COMPACT else categories_per_feature[int(features[i])][indexes[i]]
+            records.append({Resource.IDENTIFIER_: batch_start + i + 1, Record.DATASET_: int(datasets[i]), Record.INSTANTIATES_: int(features[i]),
+                            Record.SUBJECT_: int(patients[i]), Record.VALUE_: value, Resource.ENTITY_TYPE_: f"{Profile.PHENOTYPIC}{TableNames.RECORD}"})
+        database.insert_many_tuples(table_name=TableNames.RECORD, tuples=records, acknowledged=True)
+    for columns in IndexAdvisor.RECORD_INDEXES:
+        database.create_non_unique_index(table_name=TableNames.RECORD, columns=columns)
+    return time.time() - start
+
+
+def compute_profiles(database: Database, value_encoding: str) -> tuple[float, dict]:
+    start = time.time()
+    FeatureProfileComputation(database=database, value_encoding=value_encoding).compute_features_profiles()
+    elapsed_time = time.time() - start
+    profiles = database.find_operation(table_name=TableNames.FEATURE_PROFILE, filter_dict={}, projection={"_id": 0, Resource.TIMESTAMP_: 0})
+    return elapsed_time, {(profile[Record.DATASET_], profile[Record.INSTANTIATES_]): profile for profile in profiles}
+
+
+if __name__ == '__main__':
+    nb_records = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+    execution = Execution()
+    execution.internals_set_up()
+    database = Database(execution=execution)
+    database.drop_db()
+
+    all_profiles = {}
+    for value_encoding in [ValueEncodings.VERBOSE, ValueEncodings.COMPACT]:
+        load_time = generate_records(database=database, nb_records=nb_records, value_encoding=value_encoding)
+        profile_time, all_profiles[value_encoding] = compute_profiles(database=database, value_encoding=value_encoding)
+        coll_stats = database.db.command("collStats", TableNames.RECORD)
+        log.info(f"{value_encoding}: data size {coll_stats['size'] / 1e6:.1f} MB, storage size {coll_stats['storageSize'] / 1e6:.1f} MB, "
+                 f"load {load_time:.2f}s, profiles {profile_time:.2f}s")
+    nb_different = sum(1 for key, profile in all_profiles[ValueEncodings.VERBOSE].items() if profile != all_profiles[ValueEncodings.COMPACT].get(key))
+    log.info(f"{nb_records} records, {len(all_profiles[ValueEncodings.COMPACT])} feature profiles, {nb_different} different profiles")
@@ -1,19 +1,26 @@
 import copy
 import dataclasses
 import json
+from datetime import datetime
+from typing import Any, Iterator
 
 import numpy as np
 
+from catalogue.NumericSketch import NumericSketch
 from constants.defaults import DEFAULT_NAN_VALUE, PRINT_QUERIES
 from constants.methods import factory
 from database.Database import Database
+from database.RecordReader import RecordReader
 from entities.Dataset import Dataset
 from entities.Feature import Feature
 from entities.Record import Record
 from entities.Resource import Resource
 from enums.DataTypes import DataTypes
 from enums.Profile import Profile
+from enums.ProfileEngines import ProfileEngines
+from enums.RecordLayouts import RecordLayouts
 from enums.TableNames import TableNames
+from enums.ValueEncodings import ValueEncodings
 from database.Operators import Operators
 from utils.setup_logger import log
 
@@ -21,35 +28,28 @@ from utils.setup_logger import log
 @dataclasses.dataclass(kw_only=True)
 class FeatureProfileComputation:
     database: Database
+    engine: str = ProfileEngines.AGGREGATIONS  # the default engine of the ETL, see Execution.profile_engine
+    datasets: list | None = None  # the global identifiers of the datasets whose profiles are (re)computed, None for all datasets
+    record_layout: str = RecordLayouts.DOCUMENTS  # how records are stored, they are read with the reader of that layout
+    value_encoding: str = ValueEncodings.VERBOSE  # how categorical values are stored, compact values being indexes in the Feature categories
+    approximate: bool = False  # whether to summarize numeric values with sketches (stored in the profiles and merged with new records), with the single-pass engine
+    rank_error: float = 0.01  # the normalized rank error of the quantile sketches, in approximate mode
 
-    def __post_init__(self):
-        # store, for each dataset, the total number of patients to compute the missing percentage
-        operations = [
-            Operators.match(field=None, value={Resource.ENTITY_TYPE_: {"$ne": f"{Profile.CLINICAL}{TableNames.RECORD}"}}, is_regex=False),
-            Operators.group_by(group_key={Record.DATASET_: Record.DATASET__, Record.SUBJECT_: Record.SUBJECT__}, groups=[{"name": "nb_patients", "operator": "$sum", "field": 1}]),
-            Operators.group_by(group_key={Record.DATASET_: Record.DATASET___}, groups=[{"name": "distinct_nb_patients", "operator": "$sum", "field": 1}]),
-            Operators.write_to_table(table_name=TableNames.COUNTS_PATIENTS)
-        ]
-        if PRINT_QUERIES:
-            log.info(operations)
-        _ = self.database.db[TableNames.RECORD].aggregate(operations)
-
-        # store, for each clinical dataset, the total number of samples to compute the missing percentage for clinical data
-        operations = [
-            Operators.match(field=None, value={Resource.ENTITY_TYPE_: {"$eq": f"{Profile.CLINICAL}{TableNames.RECORD}"}}, is_regex=False),
-            Operators.group_by(group_key={Record.DATASET_: Record.DATASET__, Record.BASE_ID_: Record.BASE_ID__}, groups=[{"name": "nb_samples", "operator": "$sum", "field": 1}]),
-            Operators.group_by(group_key={Record.DATASET_: Record.DATASET___}, groups=[{"name": "distinct_nb_samples", "operator": "$sum", "field": 1}]),
-            Operators.write_to_table(table_name=TableNames.COUNTS_SAMPLES)
-        ]
-        if PRINT_QUERIES:
-            log.info(operations)
-        _ = self.database.db[TableNames.RECORD].aggregate(operations)
+    PEARSON_BLOCK_ELEMENTS = 2 ** 21  # the Pearson sums are computed by blocks of features, of about that many elements (16 MB per matrix)
 
+    def __post_init__(self):
+        # the single pass groups compact values as they are (small integers), and expands only the distinct values
+        # while the aggregations read expanded values
+        self.records = RecordReader(database=self.database, layout=self.record_layout,
+                                    expand_values=self.value_encoding == ValueEncodings.COMPACT and self.engine == ProfileEngines.AGGREGATIONS)
         # compute the list of Feature identifiers for each Profile data type (numeric, category, date)
         # the filter {"datasets": self.dataset_gid} means that the array "datasets" contains the element self.dataset_gid
-        cursor = self.database.find_operation(table_name=TableNames.FEATURE, filter_dict={}, projection={Resource.IDENTIFIER_: 1, Feature.DT_: 1, "_id": 0})
+        cursor = self.database.find_operation(table_name=TableNames.FEATURE, filter_dict={}, projection={Resource.IDENTIFIER_: 1, Feature.DT_: 1, Feature.CATEGORIES_: 1, "_id": 0})
         map_feature_datatype = {}
+        self.categories_per_feature = {}  # { feature id: categories }, for features having categories
         for element in cursor:
+            if Feature.CATEGORIES_ in element:
+                self.categories_per_feature[element[Resource.IDENTIFIER_]] = element[Feature.CATEGORIES_]
             if element[Feature.DT_] not in map_feature_datatype:
                 map_feature_datatype[element[Feature.DT_]] = []
             map_feature_datatype[element[Feature.DT_]].append(element[Resource.IDENTIFIER_])
@@ -68,10 +68,41 @@ class FeatureProfileComputation:
         self.all_features = self.numeric_features + self.categorical_features + self.date_features
 
     def compute_features_profiles(self) -> None:
-        # clear FeatureProfile table and create a unique index on <dataset, instantiates>
-        # because merge requires a unique index on the merge keys
-        self.database.drop_table(TableNames.FEATURE_PROFILE)
+        stored_profiles = {}
+        if self.approximate and self.engine == ProfileEngines.SINGLE_PASS:
+            # the sketches of the profiles to recompute may be merged with the new records of their dataset
+            stored_profiles = self.get_profiles_with_sketch()
+        elif self.approximate:
+            log.info("The aggregation engine computes exact profiles only.")
+        if self.datasets is None:
+            # clear FeatureProfile table
+            self.database.drop_table(TableNames.FEATURE_PROFILE)
+        else:
+            # only clear the profiles of the datasets to recompute, the profiles of the other datasets are left in place
+            self.database.delete_many_tuples(table_name=TableNames.FEATURE_PROFILE, filter_dict=self.datasets_filter())
+        # create a unique index on <dataset, instantiates> because merge requires a unique index on the merge keys
         self.database.create_unique_index(TableNames.FEATURE_PROFILE, columns={Record.DATASET_: 1, Record.INSTANTIATES_: 1})
+        if self.engine == ProfileEngines.AGGREGATIONS:
+            self.compute_features_profiles_with_aggregations()
+        else:
+            self.compute_features_profiles_in_single_pass(stored_profiles=stored_profiles)
+            self.compute_pearson_correlations_with_matrix()
+
+    def compute_features_profiles_with_aggregations(self) -> None:
+        # each profile feature is computed with its own aggregation pipeline over the records of the datasets to (re)compute,
+        # and merged into the FeatureProfile table
+
+        # store, for each dataset, the total number of patients to compute the missing percentage
+        operations = self.counts_patients_query()
+        if PRINT_QUERIES:
+            log.info(operations)
+        _ = self.aggregate_records(pipeline=operations)
+
+        # store, for each clinical dataset, the total number of samples to compute the missing percentage for clinical data
+        operations = self.counts_samples_query()
+        if PRINT_QUERIES:
+            log.info(operations)
+        _ = self.aggregate_records(pipeline=operations)
 
         # NUMERIC FEATURES
         match_numeric_values = [Operators.match(field=None, value=Operators.or_operator([
@@ -87,7 +118,7 @@ class FeatureProfileComputation:
         operators.extend(self.finalize_query(include_value=False))
         if PRINT_QUERIES:
             log.info(operators)
-        self.database.db[TableNames.RECORD].aggregate(operators)
+        self.aggregate_records(pipeline=operators)
 
         # 2. compute the Median Absolute Deviation
         operators = copy.deepcopy(match_numeric_values)
@@ -95,7 +126,7 @@ class FeatureProfileComputation:
         operators.extend(self.finalize_query(include_value=False))
         if PRINT_QUERIES:
             log.info(operators)
-        self.database.db[TableNames.RECORD].aggregate(operators)
+        self.aggregate_records(pipeline=operators)
 
         # 3. compute skewness and kurtosis for numerical features
         operators = copy.deepcopy(match_numeric_values)
@@ -103,7 +134,7 @@ class FeatureProfileComputation:
         operators.extend(self.finalize_query(include_value=False))
         if PRINT_QUERIES:
             log.info(operators)
-        self.database.db[TableNames.RECORD].aggregate(operators)
+        self.aggregate_records(pipeline=operators)
 
         # 4. compute IQR for numerical features
         operators = copy.deepcopy(match_numeric_values)
@@ -111,15 +142,10 @@ class FeatureProfileComputation:
         operators.extend(self.finalize_query(include_value=False))
         if PRINT_QUERIES:
             log.info(operators)
-        self.database.db[TableNames.RECORD].aggregate(operators)
+        self.aggregate_records(pipeline=operators)
 
         # 5. compute Pearson correlation coefficients
-        operators = copy.deepcopy(match_numeric_values)
-        operators.extend(self.pearson_correlation_query(features_ids=self.numeric_features, database=self.database))
-        operators.extend(self.finalize_query(include_value=False))
-        if PRINT_QUERIES:
-            log.info(operators)
-        self.database.db[TableNames.PAIRS_FEATURES].aggregate(operators)
+        self.compute_pearson_correlations_with_matrix()
 
         # DATE FEATURES
         match_date_values = [Operators.match(field=None, value=Operators.or_operator([
@@ -133,7 +159,7 @@ class FeatureProfileComputation:
         operators.extend(self.finalize_query(include_value=False))
         if PRINT_QUERIES:
             log.info(operators)
-        # self.database.db[TableNames.RECORD].aggregate(operators)
+        # self.aggregate_records(pipeline=operators)
 
         # 2. compute IQR for numerical features
         operators = copy.deepcopy(match_date_values)
@@ -141,7 +167,7 @@ class FeatureProfileComputation:
         operators.extend(self.finalize_query(include_value=False))
         if PRINT_QUERIES:
             log.info(operators)
-        # self.database.db[TableNames.RECORD].aggregate(operators)
+        # self.aggregate_records(pipeline=operators)
 
         # CATEGORICAL FEATURES
         match_categorical_values = [Operators.match(field=None, value=Operators.or_operator([
@@ -154,7 +180,7 @@ class FeatureProfileComputation:
         operators.extend(self.finalize_query(include_value=False))
         if PRINT_QUERIES:
             log.info(operators)
-        self.database.db[TableNames.RECORD].aggregate(operators)
+        self.aggregate_records(pipeline=operators)
 
         # 2. compute constancy for categorical features
         operators = copy.deepcopy(match_categorical_values)
@@ -162,7 +188,7 @@ class FeatureProfileComputation:
         operators.extend(self.finalize_query(include_value=False))
         if PRINT_QUERIES:
             log.info(operators)
-        self.database.db[TableNames.RECORD].aggregate(operators)
+        self.aggregate_records(pipeline=operators)
 
         # 3. compute mode for categorical features
         operators = copy.deepcopy(match_categorical_values)
@@ -170,7 +196,7 @@ class FeatureProfileComputation:
         operators.extend(self.finalize_query(include_value=False))
         if PRINT_QUERIES:
             log.info(operators)
-        self.database.db[TableNames.RECORD].aggregate(operators)
+        self.aggregate_records(pipeline=operators)
 
         # SHARED PROFILE FEATURES
         # uniqueness
@@ -178,40 +204,413 @@ class FeatureProfileComputation:
         operators.extend(self.finalize_query(include_value=False))
         if PRINT_QUERIES:
             log.info(operators)
-        self.database.db[TableNames.RECORD].aggregate(operators)
+        self.aggregate_records(pipeline=operators)
 
         # entropy
         operators = self.entropy_query(features_ids=self.all_features)
         operators.extend(self.finalize_query(include_value=False))
         if PRINT_QUERIES:
             log.info(operators)
-        self.database.db[TableNames.RECORD].aggregate(operators)
+        self.aggregate_records(pipeline=operators)
 
         # density
         operators = self.density_query(features_ids=self.all_features)
         operators.extend(self.finalize_query(include_value=False))
         if PRINT_QUERIES:
             log.info(operators)
-        self.database.db[TableNames.RECORD].aggregate(operators)
+        self.aggregate_records(pipeline=operators)
 
         # values and counts
         operators = self.values_and_counts_query(features_ids=self.all_features)
         operators.extend(self.finalize_query(include_value=True))
         if PRINT_QUERIES:
             log.info(operators)
-        self.database.db[TableNames.RECORD].aggregate(operators)
+        self.aggregate_records(pipeline=operators)
 
         operators = self.missing_percentage_query_non_clinical(features_ids=self.all_features)
         operators.extend(self.finalize_query(include_value=False))
         if PRINT_QUERIES:
             log.info(operators)
-        self.database.db[TableNames.RECORD].aggregate(operators)
+        self.aggregate_records(pipeline=operators)
 
         operators = self.missing_percentage_query_clinical(features_ids=self.all_features)
         operators.extend(self.finalize_query(include_value=False))
         if PRINT_QUERIES:
             log.info(operators)
-        self.database.db[TableNames.RECORD].aggregate(operators)
+        self.aggregate_records(pipeline=operators)
+
+    def aggregate_records(self, pipeline: list):
+        # the pipeline only reads the records of the datasets to (re)compute, with a first $match on their dataset
+        if self.datasets is not None:
+            pipeline = [Operators.match(field=None, value=self.datasets_filter(), is_regex=False)] + pipeline
+        return self.records.aggregate(pipeline=pipeline)
+
+    def counts_patients_query(self) -> list:
+        return [
+            Operators.match(field=None, value={Resource.ENTITY_TYPE_: {"$ne": f"{Profile.CLINICAL}{TableNames.RECORD}"}}, is_regex=False),
+            Operators.group_by(group_key={Record.DATASET_: Record.DATASET__, Record.SUBJECT_: Record.SUBJECT__}, groups=[{"name": "nb_patients", "operator": "$sum", "field": 1}]),
+            Operators.group_by(group_key={Record.DATASET_: Record.DATASET___}, groups=[{"name": "distinct_nb_patients", "operator": "$sum", "field": 1}]),
+            Operators.write_to_table(table_name=TableNames.COUNTS_PATIENTS)
+        ]
+
+    def counts_samples_query(self) -> list:
+        return [
+            Operators.match(field=None, value={Resource.ENTITY_TYPE_: {"$eq": f"{Profile.CLINICAL}{TableNames.RECORD}"}}, is_regex=False),
+            Operators.group_by(group_key={Record.DATASET_: Record.DATASET__, Record.BASE_ID_: Record.BASE_ID__}, groups=[{"name": "nb_samples", "operator": "$sum", "field": 1}]),
+            Operators.group_by(group_key={Record.DATASET_: Record.DATASET___}, groups=[{"name": "distinct_nb_samples", "operator": "$sum", "field": 1}]),
+            Operators.write_to_table(table_name=TableNames.COUNTS_SAMPLES)
+        ]
+
+    def compute_features_profiles_in_single_pass(self, stored_profiles: dict | None = None) -> None:
+        # the Record table is read once, one feature at a time (with the index on instantiates),
+        # and all the profile features of each pair <dataset, feature> are computed in memory with NumPy,
+        # thus only the values of a single feature are in memory
+        # in approximate mode, the values of numeric features are summarized in sketches while they are read (instead of being kept),
+        # and the sketch of a stored profile is merged with the sketch of the new records of its dataset, see get_mergeable_profiles()
+        stored_profiles = {} if stored_profiles is None else stored_profiles
+        numeric_features = set(self.numeric_features)
+        categorical_features = set(self.categorical_features)
+        last_update = datetime.now()  # the same for all the profiles computed in this pass
+        patients_per_dataset = {}  # { dataset: set of patient ids }, for non-clinical records
+        samples_per_dataset = {}  # { dataset: set of sample ids }, for clinical records
+        merged_datasets = set()  # the datasets of which some records have not been read again
+        profiles = []
+        for feature_id in self.all_features:
+            approximate = self.approximate and feature_id in numeric_features
+            mergeable_profiles = self.get_mergeable_profiles(feature_id=feature_id, stored_profiles=stored_profiles) if approximate else {}
+            merged_datasets.update(mergeable_profiles.keys())
+            values_per_dataset = {}  # { dataset: [values] }, or { dataset: { hashable value: [value, count] } } in approximate mode
+            sketch_per_dataset = {}  # { dataset: NumericSketch }, in approximate mode
+            nb_records_per_dataset = {}
+            last_identifier_per_dataset = {}
+            nb_clinical_records_per_dataset = {}
+            for dataset in mergeable_profiles:
+                # the profile is written again, even if the dataset has no new records
+                values_per_dataset[dataset], sketch_per_dataset[dataset] = {}, NumericSketch(rank_error=self.rank_error)
+                nb_records_per_dataset[dataset], last_identifier_per_dataset[dataset], nb_clinical_records_per_dataset[dataset] = 0, 0, 0
+            cursor = self.records.find(filter_dict=self.feature_records_filter(feature_id=feature_id, mergeable_profiles=mergeable_profiles),
+                                       projection={Record.DATASET_: 1, Record.VALUE_: 1, Resource.ENTITY_TYPE_: 1, Record.SUBJECT_: 1, Record.BASE_ID_: 1, Resource.IDENTIFIER_: 1, "_id": 0})
+            for record in cursor:
+                dataset = record.get(Record.DATASET_)
+                if dataset not in nb_records_per_dataset:
+                    values_per_dataset[dataset] = {} if approximate else []
+                    if approximate:
+                        sketch_per_dataset[dataset] = NumericSketch(rank_error=self.rank_error)
+                    nb_records_per_dataset[dataset], last_identifier_per_dataset[dataset], nb_clinical_records_per_dataset[dataset] = 0, 0, 0
+                nb_records_per_dataset[dataset] += 1
+                last_identifier_per_dataset[dataset] = max(last_identifier_per_dataset[dataset], record.get(Resource.IDENTIFIER_, 0))
+                if Record.VALUE_ in record and approximate:
+                    FeatureProfileComputation.count_value(value_counts=values_per_dataset[dataset], value=record[Record.VALUE_])
+                    if FeatureProfileComputation.is_numeric_value(value=record[Record.VALUE_]):
+                        sketch_per_dataset[dataset].add(value=record[Record.VALUE_])
+                elif Record.VALUE_ in record:
+                    values_per_dataset[dataset].append(record[Record.VALUE_])
+                if record.get(Resource.ENTITY_TYPE_) == f"{Profile.CLINICAL}{TableNames.RECORD}":
+                    nb_clinical_records_per_dataset[dataset] += 1
+                    samples_per_dataset.setdefault(dataset, set()).add(record.get(Record.BASE_ID_))
+                else:
+                    patients_per_dataset.setdefault(dataset, set()).add(record.get(Record.SUBJECT_))
+            categories = self.categories_per_feature.get(feature_id, None) if self.value_encoding == ValueEncodings.COMPACT else None
+            for dataset, values in values_per_dataset.items():
+                profile = {Record.DATASET_: dataset, Record.INSTANTIATES_: feature_id, Resource.TIMESTAMP_: last_update}
+                if approximate:
+                    sketch = sketch_per_dataset[dataset]
+                    if dataset in mergeable_profiles:
+                        # the stored sketch and values summarize the former records, the others the new ones
+                        stored_profile = mergeable_profiles[dataset]
+                        sketch = NumericSketch.from_json(the_json=stored_profile["sketch"])
+                        sketch.merge(other=sketch_per_dataset[dataset])
+                        for value_and_count in stored_profile["values_and_counts"]:
+                            FeatureProfileComputation.count_value(value_counts=values, value=value_and_count[Record.VALUE_], count=value_and_count["count"])
+                        nb_records_per_dataset[dataset] += stored_profile["sketch"]["nb_records"]
+                        last_identifier_per_dataset[dataset] = max(last_identifier_per_dataset[dataset], stored_profile["sketch"]["last_identifier"])
+                        nb_clinical_records_per_dataset[dataset] += stored_profile["sketch"]["nb_clinical_records"]
+                    profile.update(self.numeric_profile_from_sketch(sketch=sketch))
+                    if "sketch" in profile:
+                        # the records summarized by the sketch, to know whether it can be merged with the next records of the dataset
+                        profile["sketch"].update({"nb_records": nb_records_per_dataset[dataset], "last_identifier": last_identifier_per_dataset[dataset],
+                                                  "nb_clinical_records": nb_clinical_records_per_dataset[dataset]})
+                    distinct_values, counts = FeatureProfileComputation.distinct_values_and_counts(value_counts=values, categories=categories)
+                    profile.update(FeatureProfileComputation.shared_profile_from_counts(distinct_values=distinct_values, counts=counts))
+                else:
+                    if feature_id in numeric_features:
+                        profile.update(self.numeric_profile(values=values))
+                    elif feature_id in categorical_features:
+                        profile.update(self.categorical_profile(values=values, categories=categories))
+                    profile.update(self.shared_profile(values=values, categories=categories))
+                # the missing percentage is computed once the numbers of patients and samples of each dataset are known
+                profile["nb_clinical_records"] = nb_clinical_records_per_dataset[dataset]
+                profiles.append(profile)
+
+        clinical_record = f"{Profile.CLINICAL}{TableNames.RECORD}"
+        for dataset in merged_datasets:
+            # the patients and samples of the records that have not been read again are counted in the database
+            patients_per_dataset[dataset] = set(self.records.find_distinct(key=Record.SUBJECT_, filter_dict={Record.DATASET_: dataset, Resource.ENTITY_TYPE_: {"$ne": clinical_record}}))
+            samples_per_dataset[dataset] = set(self.records.find_distinct(key=Record.BASE_ID_, filter_dict={Record.DATASET_: dataset, Resource.ENTITY_TYPE_: clinical_record}))
+        for profile in profiles:
+            nb_clinical_records = profile.pop("nb_clinical_records")
+            nb_records = sum(value_and_count["count"] for value_and_count in profile["values_and_counts"])
+            if nb_clinical_records > 0:
+                nb_expected_records = len(samples_per_dataset[profile[Record.DATASET_]])
+            else:
+                nb_expected_records = len(patients_per_dataset.get(profile[Record.DATASET_], []))
+            profile["missing_percentage"] = 0 if nb_expected_records == 0 else 1 - nb_records / nb_expected_records
+        if len(profiles) > 0:
+            self.database.insert_many_tuples(table_name=TableNames.FEATURE_PROFILE, tuples=profiles, acknowledged=True)
+
+    def get_profiles_with_sketch(self) -> dict:
+        # { (dataset, feature): profile }, the stored profiles of the datasets to recompute that have a sketch
+        cursor = self.database.find_operation(table_name=TableNames.FEATURE_PROFILE, filter_dict={"sketch": {"$exists": True}} | self.datasets_filter(),
+                                              projection={Record.DATASET_: 1, Record.INSTANTIATES_: 1, "sketch": 1, "values_and_counts": 1, "_id": 0})
+        return {(profile[Record.DATASET_], profile[Record.INSTANTIATES_]): profile for profile in cursor}
+
+    def get_mergeable_profiles(self, feature_id: int, stored_profiles: dict) -> dict:
+        # { dataset: profile }, the stored profiles of the feature whose sketch can be merged with the new records of their dataset:
+        # the records summarized by the sketch are still there and unchanged, i.e., the records up to its last identifier are the same number
+        # (records that are written again get new identifiers, e.g., when their value changes with the diff load, and when datasets are loaded without it)
+        mergeable_profiles = {}
+        for (dataset, one_feature_id), profile in stored_profiles.items():
+            if one_feature_id == feature_id and profile["sketch"]["rank_error"] <= self.rank_error:
+                filter_dict = {Record.INSTANTIATES_: feature_id, Record.DATASET_: dataset, Resource.IDENTIFIER_: {"$lte": profile["sketch"]["last_identifier"]}}
+                if self.records.count(filter_dict=filter_dict) == profile["sketch"]["nb_records"]:
+                    mergeable_profiles[dataset] = profile
+        return mergeable_profiles
+
+    def feature_records_filter(self, feature_id: int, mergeable_profiles: dict | None = None) -> dict:
+        # the records of the feature in the datasets to (re)compute, and only the new records of the datasets whose profile is merged
+        if not mergeable_profiles:
+            return {Record.INSTANTIATES_: feature_id} | self.datasets_filter()
+        if self.datasets is None:
+            other_datasets = {Record.DATASET_: {"$nin": list(mergeable_profiles.keys())}}
+        else:
+            other_datasets = {Record.DATASET_: {"$in": [dataset for dataset in self.datasets if dataset not in mergeable_profiles]}}
+        return {Record.INSTANTIATES_: feature_id, "$or": [other_datasets] + [
+            {Record.DATASET_: dataset, Resource.IDENTIFIER_: {"$gt": profile["sketch"]["last_identifier"]}} for dataset, profile in mergeable_profiles.items()
+        ]}
+
+    def datasets_filter(self) -> dict:
+        # the filter on the records (and profiles) of the datasets to (re)compute
+        return {} if self.datasets is None else {Record.DATASET_: {"$in": self.datasets}}
+
+    @classmethod
+    def get_numeric_values(cls, values: list) -> list:
+        return [value for value in values if FeatureProfileComputation.is_numeric_value(value=value)]
+
+    @classmethod
+    def is_numeric_value(cls, value: Any) -> bool:
+        # same as the numeric queries: only int and float values that are not NaN are considered (bool is an int in Python, not in MongoDB)
+        return type(value) in [int, float] and value == value
+
+    @classmethod
+    def numeric_profile(cls, values: list) -> dict:
+        numeric_values = FeatureProfileComputation.get_numeric_values(values=values)
+        if len(numeric_values) == 0:
+            return {}
+        x = np.array(numeric_values, dtype=np.float64)
+        n = len(x)
+        median = float(np.median(x))
+        profile = {
+            "min_value": min(numeric_values),
+            "max_value": max(numeric_values),
+            "mean_value": float(np.mean(x)),
+            "median_value": median,
+            "std_value": float(np.std(x)),  # population standard deviation, as $stdDevPop
+            "ema": float(np.median(np.abs(x - median)))  # median absolute deviation
+        }
+        # skewness and kurtosis use the sample standard deviation (as $stdDevSamp)
+        std_samp = float(np.std(x, ddof=1)) if n > 1 else 0
+        sum_cubes, sum_quads = 0, 0
+        if std_samp != 0:
+            standardized = (x - np.mean(x)) / std_samp
+            sum_cubes = float(np.sum(standardized ** 3))
+            sum_quads = float(np.sum(standardized ** 4))
+        profile.update(FeatureProfileComputation.skewness_and_kurtosis(n=n, sum_cubes=sum_cubes, sum_quads=sum_quads))
+        # IQR: the difference between the medians of the values above and below the median
+        lower_values = x[x < median]
+        upper_values = x[x > median]
+        profile["iqr"] = float(np.median(upper_values) - np.median(lower_values)) if len(lower_values) > 0 and len(upper_values) > 0 else None
+        return profile
+
+    @classmethod
+    def numeric_profile_from_sketch(cls, sketch: NumericSketch) -> dict:
+        # the moments are exact (up to rounding errors), while the median, absolute deviation and IQR are estimated with the quantile sketch
+        sketch.flush()
+        moments, quantiles = sketch.moments, sketch.quantiles
+        if moments.n == 0:
+            return {}
+        median = quantiles.quantile(q=0.5)
+        profile = {
+            "min_value": quantiles.min,
+            "max_value": quantiles.max,
+            "mean_value": moments.mean,
+            "median_value": median,
+            "std_value": moments.std_pop(),
+            "ema": quantiles.median_absolute_deviation(center=median),
+            "iqr": quantiles.quantile(q=0.75) - quantiles.quantile(q=0.25),
+            "rank_error": sketch.rank_error,  # the normalized rank error of median_value, ema and iqr
+            "sketch": sketch.to_json()
+        }
+        std_samp = moments.std_samp()
+        sum_cubes = moments.m3 / std_samp ** 3 if std_samp != 0 else 0
+        sum_quads = moments.m4 / std_samp ** 4 if std_samp != 0 else 0
+        profile.update(FeatureProfileComputation.skewness_and_kurtosis(n=moments.n, sum_cubes=sum_cubes, sum_quads=sum_quads))
+        return profile
+
+    @classmethod
+    def skewness_and_kurtosis(cls, n: int, sum_cubes: float, sum_quads: float) -> dict:
+        # sum_cubes and sum_quads are the sums of the cubes and fourth powers of the values standardized with the sample standard deviation,
+        # skewness and kurtosis are 0 when they are not defined
+        return {
+            "skewness": 0 if n < 3 else n / ((n - 1) * (n - 2)) * sum_cubes,
+            "kurtosis": 0 if n < 4 else n * (n + 1) / ((n - 1) * (n - 2) * (n - 3)) * sum_quads - 3 * (n - 1) ** 2 / ((n - 2) * (n - 3))
+        }
+
+    @classmethod
+    def categorical_profile(cls, values: list, categories: list | None = None) -> dict:
+        # same as the categorical queries: only object values (i.e., CodeableConcepts, or compact values indexing the given categories) are considered
+        distinct_values, counts = FeatureProfileComputation.count_values(values=[value for value in values if isinstance(value, dict) or FeatureProfileComputation.is_category_index(value=value, categories=categories)],
+                                                                         categories=categories)
+        if len(counts) == 0:
+            return {}
+        return {
+            "imbalance": max(counts) / min(counts),
+            "constancy": 1.0,  # as in constancy_query(), the most frequent value is divided by itself
+            "mode": distinct_values[int(np.argmax(counts))]  # the first of the most frequent values
+        }
+
+    @classmethod
+    def shared_profile(cls, values: list, categories: list | None = None) -> dict:
+        distinct_values, counts = FeatureProfileComputation.count_values(values=values, categories=categories)
+        return FeatureProfileComputation.shared_profile_from_counts(distinct_values=distinct_values, counts=counts)
+
+    @classmethod
+    def shared_profile_from_counts(cls, distinct_values: list, counts: list) -> dict:
+        counts = np.array(counts, dtype=np.float64)
+        probabilities = counts / counts.sum() if len(counts) > 0 else counts
+        return {
+            "uniqueness": len(distinct_values) / counts.sum() if len(counts) > 0 else 0,
+            "entropy": abs(float(np.sum(probabilities * np.log2(probabilities)))),
+            "density": float(np.sum(np.abs(probabilities - probabilities.mean())) / len(probabilities)) if len(probabilities) > 0 else 0,
+            "values_and_counts": [{Record.VALUE_: None if value != value else value, "count": int(count)} for value, count in zip(distinct_values, counts)]
+        }
+
+    @classmethod
+    def count_values(cls, values: list, categories: list | None = None) -> tuple[list, list]:
+        # group the values as MongoDB does: numbers are equal whatever their type (but booleans are not numbers), all NaNs are equal,
+        # and objects are equal if they have the same fields and values
+        # if categories are given, (compact) values indexing them are grouped, then replaced by their category
+        value_counts = {}
+        for value in values:
+            FeatureProfileComputation.count_value(value_counts=value_counts, value=value)
+        return FeatureProfileComputation.distinct_values_and_counts(value_counts=value_counts, categories=categories)
+
+    @classmethod
+    def count_value(cls, value_counts: dict, value: Any, count: int = 1) -> None:
+        # value_counts is { hashable value: [first value, count] }, in the order of the first occurrence of each value
+        key = FeatureProfileComputation.hashable_value(value=value)
+        if key not in value_counts:
+            value_counts[key] = [value, count]
+        else:
+            value_counts[key][1] += count
+
+    @classmethod
+    def distinct_values_and_counts(cls, value_counts: dict, categories: list | None = None) -> tuple[list, list]:
+        distinct_values = [value for value, _ in value_counts.values()]
+        counts = [count for _, count in value_counts.values()]
+        if categories is not None:
+            distinct_values = [categories[value] if FeatureProfileComputation.is_category_index(value=value, categories=categories) else value for value in distinct_values]
+        return distinct_values, counts
+
+    @classmethod
+    def is_category_index(cls, value: Any, categories: list | None) -> bool:
+        return categories is not None and type(value) is int and 0 <= value < len(categories)
+
+    @classmethod
+    def hashable_value(cls, value: Any) -> Any:
+        if isinstance(value, bool):
+            return "bool", value
+        elif isinstance(value, float) and value != value:
+            return "nan",
+        elif isinstance(value, dict):
+            return "object", tuple((key, FeatureProfileComputation.hashable_value(value=element)) for key, element in value.items())
+        elif isinstance(value, list):
+            return "array", tuple(FeatureProfileComputation.hashable_value(value=element) for element in value)
+        else:
+            return value
+
+    def compute_pearson_correlations_with_matrix(self) -> None:
+        # the numeric values of each dataset are pivoted in a matrix with one row per patient (or sample) and one column per numeric feature,
+        # then the coefficients of all the pairs of features are computed at once, each on the rows having a value for both features
+        # the datasets are read and pivoted one at a time, thus only the values of a single dataset are in memory
+        numeric_features = sorted(self.numeric_features)
+        if len(numeric_features) == 0:
+            return
+        column_of_feature = {feature_id: column for column, feature_id in enumerate(numeric_features)}
+        numeric_filter = {Record.INSTANTIATES_: {"$in": numeric_features}}
+        datasets = self.datasets if self.datasets is not None else self.records.find_distinct(key=Record.DATASET_, filter_dict=numeric_filter)
+        for dataset in datasets:
+            row_of_key, rows, columns, values = {}, [], [], []  # { (patient, sample): row }, and the row, column and value of each observation
+            cursor = self.records.find(filter_dict=numeric_filter | {Record.DATASET_: dataset},
+                                       projection={Record.INSTANTIATES_: 1, Record.SUBJECT_: 1, Record.BASE_ID_: 1, Record.VALUE_: 1, "_id": 0})
+            for record in cursor:
+                value = record.get(Record.VALUE_)
+                if FeatureProfileComputation.is_numeric_value(value=value):
+                    rows.append(row_of_key.setdefault((record.get(Record.SUBJECT_), record.get(Record.BASE_ID_)), len(row_of_key)))
+                    columns.append(column_of_feature[record[Record.INSTANTIATES_]])
+                    values.append(value)
+            if len(values) == 0:
+                continue
+            matrix = np.full((len(row_of_key), len(numeric_features)), np.nan)
+            matrix[rows, columns] = values
+            del row_of_key, rows, columns, values
+            # the coefficients are computed and written by blocks of features, so that only a few rows of the F x F matrices are in memory
+            for first_feature, coefficients, counts in FeatureProfileComputation.pearson_blocks(matrix=matrix):
+                profiles = []
+                for row in range(coefficients.shape[0]):
+                    feat_a = first_feature + row
+                    pearson = {str(numeric_features[feat_b]): {"coefficient": float(coefficients[row, feat_b])}
+                               for feat_b in range(feat_a + 1, len(numeric_features)) if counts[row, feat_b] >= 2}
+                    if len(pearson) > 0:
+                        profiles.append({Record.DATASET_: dataset, Record.INSTANTIATES_: numeric_features[feat_a], "pearson": pearson})
+                if len(profiles) > 0:
+                    self.database.upsert_one_batch_of_tuples(table_name=TableNames.FEATURE_PROFILE, unique_variables=[Record.DATASET_, Record.INSTANTIATES_], the_batch=profiles, ordered=False)
+
+    @classmethod
+    def pearson_blocks(cls, matrix: np.ndarray, block_size: int | None = None, chunk_size: int = 100000) -> Iterator[tuple[int, np.ndarray, np.ndarray]]:
+        # Pearson coefficients of all pairs of columns, with pairwise-complete observations (NaN being missing values),
+        # and the number of observations of each pair, yielded by blocks of columns: (first column of the block, block_size x F coefficients, block_size x F counts)
+        # the sums are accumulated over chunks of rows to bound the size of temporary matrices
+        present = ~np.isnan(matrix)
+        # centering the columns does not change the coefficients, but avoids cancellation errors
+        column_means = np.nansum(matrix, axis=0) / np.maximum(present.sum(axis=0), 1)
+        centered = np.where(present, matrix - column_means, 0.0)
+        present = present.astype(np.float64)
+        nb_columns = matrix.shape[1]
+        if block_size is None:
+            block_size = max(1, FeatureProfileComputation.PEARSON_BLOCK_ELEMENTS // max(nb_columns, 1))
+        for first_column in range(0, nb_columns, block_size):
+            block = slice(first_column, min(first_column + block_size, nb_columns))
+            # for a in the block and b in all columns, sums_a[a, b] is the sum of the values of a on the rows where b has a value,
+            # and sums_b[a, b] the sum of the values of b on the rows where a has a value
+            counts, sums_a, sums_b, sums_squares_a, sums_squares_b, sums_products = (np.zeros((block.stop - block.start, nb_columns)) for _ in range(6))
+            for start in range(0, matrix.shape[0], chunk_size):
+                chunk, chunk_present = centered[start:start + chunk_size], present[start:start + chunk_size]
+                block_chunk, block_present = chunk[:, block], chunk_present[:, block]
+                counts += block_present.T @ chunk_present
+                sums_a += block_chunk.T @ chunk_present
+                sums_b += block_present.T @ chunk
+                sums_squares_a += (block_chunk ** 2).T @ chunk_present
+                sums_squares_b += block_present.T @ (chunk ** 2)
+                sums_products += block_chunk.T @ chunk
+            with np.errstate(divide="ignore", invalid="ignore"):
+                covariances = sums_products - sums_a * sums_b / counts
+                variances_a = sums_squares_a - sums_a ** 2 / counts
+                variances_b = sums_squares_b - sums_b ** 2 / counts
+                coefficients = np.clip(covariances / np.sqrt(variances_a * variances_b), -1, 1)
+            # as in the aggregation, the coefficient is 0 if one of the features is constant (on the rows of the pair)
+            constant = (variances_a <= 1e-9 * sums_squares_a) | (variances_a <= 0) | (variances_b <= 1e-9 * sums_squares_b) | (variances_b <= 0)
+            coefficients[constant | (counts < 2)] = 0
+            yield first_column, coefficients, counts
 
     def min_max_mean_median_std_query(self, features_ids: list, compute_min: bool, compute_max: bool, compute_mean: bool, compute_median: bool, compute_std: bool) -> list:
         groups = []
@@ -384,135 +783,6 @@ class FeatureProfileComputation:
             Operators.unset_variables(["thevalues", "q1", "q3"])
         ]
 
-    def pearson_correlation_query(self, features_ids: list, database: Database) -> list:
-        # drop existing temporary tables
-        database.drop_table(TableNames.TOP10_FEATURES)
-        database.drop_table(TableNames.PAIRS_FEATURES)
-        # first part: create pairs of features for which pearson coefficient will be computed
-        # we only take the top-10 of numeric features, i.e.,
-        # the 10 numeric features with most values (if tied, take the ones with the lowest ID)
-        top_10_features = [
-            Operators.match(field=Record.INSTANTIATES_, value={"$in": features_ids}, is_regex=False),
-            Operators.group_by(group_key={Record.DATASET_: Record.DATASET__, Record.INSTANTIATES_: Record.INSTANTIATES__}, groups=[
-                {"name": "frequency", "operator": "$sum", "field": 1}
-            ]),
-            Operators.sort(field=f"_id.{Record.DATASET_}", sort_order=-1),
-            Operators.sort(field="frequency", sort_order=-1),
-            Operators.sort(field=f"_id.{Record.INSTANTIATES_}", sort_order=1),
-            Operators.group_by(group_key={Record.DATASET_: Record.DATASET___}, groups=[
-                {"name": "orderedfeatures", "operator": "$push", "field": Record.INSTANTIATES___}
-            ]),
-            Operators.set_variables(variables=[
-                {"name": "top10", "operation": Operators.filter_array(input_array_name="$orderedfeatures", element="item", cond={}, limit=10)}
-            ]),
-            # Operators.limit(10),
-            Operators.project(field=None, projected_value={
-                Record.DATASET_: Record.DATASET___,
-                "top10": 1,
-                "_id": 0
-            }),
-            Operators.unwind(field="top10"),
-            Operators.project(field=None, projected_value={Record.INSTANTIATES_: "$top10", Record.DATASET_: 1}),
-            Operators.write_to_table(table_name=TableNames.TOP10_FEATURES)
-        ]
-        log.info(top_10_features)
-        database.db[TableNames.RECORD].aggregate(top_10_features)
-
-        pairs_features = [
-            Operators.cartesian_product(join_table_name=TableNames.TOP10_FEATURES, lookup_field_name="features_b", filter_dict={}),
-            Operators.unwind(field="features_b"),
-            Operators.match(field=None, value={"$expr": {
-                "$and": [
-                    {"$eq": [Record.DATASET__, f"$features_b.{Record.DATASET_}"]},  # created pairs of features in a single dataset
-                    {"$lt": [Record.INSTANTIATES__, f"$features_b.{Record.INSTANTIATES_}"]}
-                ]
-            }}, is_regex=False),
-            Operators.project(field=None, projected_value={Record.DATASET_: Record.DATASET__, "feat_a": Record.INSTANTIATES__, "feat_b": f"$features_b.{Record.INSTANTIATES_}", "_id": 0}),  # this allows to not export the _id in the table (which contains duplicated due to unwind), and _id is regenerated when creating the table
-            Operators.write_to_table(TableNames.PAIRS_FEATURES)
-        ]
-        log.info(pairs_features)
-        database.db[TableNames.TOP10_FEATURES].aggregate(pairs_features)
-
-        # second part, compute the Pearson coefficient for each pair of features stored above within the collection
-        return [
-            Operators.lookup_with_condition(
-                join_table_name=TableNames.RECORD,
-                let_variables={"feat_a": "$feat_a", "a_dataset": Record.DATASET__},
-                pipeline=[Operators.match(field=None, value={"$expr": {"$and": [
-                    {"$eq": [Record.INSTANTIATES__, "$$feat_a"]},
-                    {"$eq": [Record.DATASET__, "$$a_dataset"]}
-                ]}}, is_regex=False)],
-                lookup_field_name="x"
-            ),
-            Operators.lookup_with_condition(
-                join_table_name=TableNames.RECORD,
-                let_variables={"feat_b": "$feat_b", "b_dataset": Record.DATASET__},
-                pipeline=[Operators.match(field=None, value={"$expr": {
-                    "$and": [
-                        {"$eq": [Record.INSTANTIATES__, "$$feat_b"]},
-                        {"$eq": [Record.DATASET__, "$$b_dataset"]}
-                    ]}}, is_regex=False)],
-                lookup_field_name="y"
-            ),
-            Operators.project(field=None, projected_value={"values": {"$zip": {"inputs": ["$x", "$y"]}}}),
-            Operators.unwind(field="values"),
-            Operators.project(field=None, projected_value={"x": {"$arrayElemAt": ["$values", 0]}, "y": {"$arrayElemAt": ["$values", 1]}}),
-            Operators.project(field=None, projected_value={"x": "$x.value", "y": f"$y.{Record.VALUE_}", "feat_a": f"$x.{Record.INSTANTIATES_}", "feat_b": f"$y.{Record.INSTANTIATES_}", Record.DATASET_: f"$x.{Record.DATASET_}"}),
-            Operators.group_by(group_key={"feat_a": "$feat_a", "feat_b": "$feat_b", Record.DATASET_: Record.DATASET__}, groups=[
-                {"name": "originalX", "operator": "$push", "field": "$x"},
-                {"name": "originalY", "operator": "$push", "field": "$y"},
-                {"name": "avgX", "operator": "$avg", "field": "$x"},
-                {"name": "avgY", "operator": "$avg", "field": "$y"},
-            ]),
-            Operators.project(field=None, projected_value={
-                # to subtract/map a number to each element of an array, the syntax is a bit more complex than "Xsubs": {"$subtract": ["$originalX", "$avgX"]}
-                # it requires a map
-                "subsX": {"$map": {"input": "$originalX", "as": "originalXval", "in": {"$subtract": ["$$originalXval", "$avgX"]}}},
-                "subsY": {"$map": {"input": "$originalY", "as": "originalYval", "in": {"$subtract": ["$$originalYval", "$avgY"]}}}
-            }),
-            Operators.project(field=None, projected_value={
-                "subsX": 1,
-                "subsY": 1,
-                "subsSquareX": {"$map": {"input": "$subsX", "as": "subsXVal", "in": {"$pow": ["$$subsXVal", 2]}}},
-                "subsSquareY": {"$map": {"input": "$subsY", "as": "subsYVal", "in": {"$pow": ["$$subsYVal", 2]}}},
-                "multXY": {"$map": {"input": {"$zip": {"inputs": ["$subsX", "$subsY"]}}, "as": "pair",
-                    "in": {"$multiply": [{"$arrayElemAt": ["$$pair", 0]}, {"$arrayElemAt": ["$$pair", 1]}]}
-                }}
-            }),
-            Operators.project(field=None, projected_value={
-                "sumXsubsSquare": {"$sum": "$subsSquareX"},  # no need to group by in this case (and the group by does not work)
-                "sumYsubsSquare": {"$sum": "$subsSquareY"},
-                "sumXY": {"$sum": "$multXY"}
-            }),
-            Operators.project(field=None, projected_value={
-                "pearson": {
-                    "$cond": {
-                        "if": {"$or": [{"$eq": ["$sumXsubsSquare", 0]}, {"$eq": ["$sumYsubsSquare", 0]}]},
-                        "then": 0,
-                        "else": {
-                            "$divide": ["$sumXY", {"$sqrt": {"$multiply": ["$sumXsubsSquare", "$sumYsubsSquare"]}}]
-                        }
-                    }
-                }
-            }),
-            # the last group by and project groups all features b within the feature a for easier profiles
-            Operators.group_by(group_key={Record.INSTANTIATES_: "$_id.feat_a", Record.DATASET_: Record.DATASET___}, groups=[
-                {"name": "feat_b_dict", "operator": "$push", "field": {"k": "$_id.feat_b", "v": "$pearson"}}
-            ]),
-            Operators.project(field=None, projected_value={
-                Record.INSTANTIATES_: 1,
-                "pearson": {
-                    "$arrayToObject": {
-                        "$map": {
-                            "input": "$feat_b_dict",
-                            "as": "item",
-                            "in": [{"$toString": "$$item.k"}, {"coefficient": "$$item.v"}]
-                        }
-                    }
-                }
-            })
-        ]
-
     def imbalance_query(self, features_ids: list) -> list:
         # Ratio between the number of appearances of the most frequent value and the least frequent value.
         return [
@@ -755,6 +1025,8 @@ class FeatureProfileComputation:
         else:
             last_fields = [{"$set": {Record.DATASET_: Record.DATASET___, Record.INSTANTIATES_: Record.INSTANTIATES___}}]
         last_fields.append({"$unset": ["_id"]})
+        # the last update of the profile
+        last_fields.append({"$set": {Resource.TIMESTAMP_: "$$NOW"}})
         # merge the profile into the profile table
         last_fields.append(
             Operators.merge(table_name=TableNames.FEATURE_PROFILE,
@@ -0,0 +1,54 @@
+import numpy as np
+
+from catalogue.QuantileSketch import QuantileSketch
+from catalogue.StreamingMoments import StreamingMoments
+
+
+class NumericSketch:
+    """
+    A summary of bounded size of the numeric values of a feature in a dataset: their moments (exact, see StreamingMoments)
+    and a KLL sketch of their quantiles (see QuantileSketch), built for a given normalized rank error.
+    Values are added one at a time and summarized by chunks, thus they are never all in memory.
+    Two summaries can be merged, e.g., the summary stored in a profile with the summary of the new records of its dataset.
+    """
+
+    CHUNK_SIZE = 1024  # the number of values summarized at once
+
+    def __init__(self, rank_error: float):
+        self.rank_error = rank_error
+        self.moments = StreamingMoments()
+        self.quantiles = QuantileSketch.for_rank_error(rank_error=rank_error)
+        self.chunk = []
+
+    def add(self, value: int | float) -> None:
+        self.chunk.append(value)
+        if len(self.chunk) >= NumericSketch.CHUNK_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        if len(self.chunk) > 0:
+            values = np.array(self.chunk, dtype=np.float64)
+            self.moments.update(values=values)
+            self.quantiles.update(values=values)
+            self.chunk = []
+
+    def merge(self, other: "NumericSketch") -> None:
+        self.flush()
+        other.flush()
+        self.moments.merge(other=other.moments)
+        self.quantiles.merge(other=other.quantiles)
+        self.rank_error = max(self.rank_error, other.rank_error)  # the error of the merged sketch is the one of the least precise sketch
+
+    def nb_values(self) -> int:
+        return self.moments.n + len(self.chunk)
+
+    def to_json(self) -> dict:
+        self.flush()
+        return {"rank_error": self.rank_error, "moments": self.moments.to_json(), "quantiles": self.quantiles.to_json()}
+
+    @classmethod
+    def from_json(cls, the_json: dict) -> "NumericSketch":
+        sketch = NumericSketch(rank_error=the_json["rank_error"])
+        sketch.moments = StreamingMoments.from_json(the_json=the_json["moments"])
+        sketch.quantiles = QuantileSketch.from_json(the_json=the_json["quantiles"])
+        return sketch
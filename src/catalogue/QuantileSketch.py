@@ -0,0 +1,123 @@
+import math
+import random
+
+import numpy as np
+
+
+class QuantileSketch:
+    """
+    A KLL quantile sketch (Karnin, Lang and Liberty, 2016) over numeric values: a hierarchy of compactors where level h
+    keeps a sample of values, each representing 2^h values. When the sketch is full, the lowest full level is sorted and
+    one value out of two (starting at a random offset) is promoted to the next level.
+    The size of the sketch depends on k only (not on the number of values), and two sketches can be merged.
+    The rank of any value is estimated with a normalized error of at most rank_error(k), with a 99% probability.
+    """
+
+    CAPACITY_RATIO = 2 / 3  # the capacity of each level, relatively to the level above
+
+    def __init__(self, k: int, seed: int = 0):
+        self.k = k
+        self.n = 0
+        self.min = None
+        self.max = None
+        self.levels = [np.empty(0, dtype=np.float64)]
+        self.random = random.Random(seed)  # the compaction offsets, seeded to have reproducible profiles
+
+    @classmethod
+    def for_rank_error(cls, rank_error: float) -> "QuantileSketch":
+        return QuantileSketch(k=QuantileSketch.compute_k(rank_error=rank_error))
+
+    @classmethod
+    def compute_k(cls, rank_error: float) -> int:
+        # empirical bound of the normalized rank error of KLL sketches (as in Apache DataSketches)
+        return max(8, math.ceil((2.296 / rank_error) ** (1 / 0.9723)))
+
+    @classmethod
+    def rank_error(cls, k: int) -> float:
+        return 2.296 / k ** 0.9723
+
+    def capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, math.ceil(self.k * QuantileSketch.CAPACITY_RATIO ** depth))
+
+    def size(self) -> int:
+        return sum(len(level) for level in self.levels)
+
+    def update(self, values: np.ndarray) -> None:
+        # add the values by chunks of k, so that the level 0 never grows much larger than its capacity
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+        self.n += len(values)
+        self.min = float(values.min()) if self.min is None else min(self.min, float(values.min()))
+        self.max = float(values.max()) if self.max is None else max(self.max, float(values.max()))
+        for start in range(0, len(values), self.k):
+            self.levels[0] = np.concatenate((self.levels[0], values[start:start + self.k]))
+            self.compress()
+
+    def merge(self, other: "QuantileSketch") -> None:
+        if other.n == 0:
+            return
+        self.k = min(self.k, other.k)  # the error of the merged sketch is the one of the least precise sketch
+        self.n += other.n
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0, dtype=np.float64))
+        for level, values in enumerate(other.levels):
+            self.levels[level] = np.concatenate((self.levels[level], values))
+        self.compress()
+
+    def compress(self) -> None:
+        while self.size() > sum(self.capacity(level) for level in range(len(self.levels))):
+            level = next(level for level in range(len(self.levels)) if len(self.levels[level]) >= self.capacity(level))
+            if level == len(self.levels) - 1:
+                self.levels.append(np.empty(0, dtype=np.float64))
+            values = np.sort(self.levels[level])
+            # with an odd number of values, the largest one stays in the level
+            kept = values[len(values) - 1:] if len(values) % 2 == 1 else values[:0]
+            values = values[:len(values) - len(kept)]
+            self.levels[level + 1] = np.concatenate((self.levels[level + 1], values[self.random.randint(0, 1)::2]))
+            self.levels[level] = kept
+
+    def weighted_values(self) -> tuple[np.ndarray, np.ndarray]:
+        # the values of the sketch with the number of values each of them represents
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(values), 2 ** level, dtype=np.float64) for level, values in enumerate(self.levels)])
+        return values, weights
+
+    def quantile(self, q: float) -> float | None:
+        if self.n == 0:
+            return None
+        elif q <= 0:
+            return self.min
+        elif q >= 1:
+            return self.max
+        values, weights = self.weighted_values()
+        return QuantileSketch.weighted_quantile(values=values, weights=weights, q=q)
+
+    def median_absolute_deviation(self, center: float) -> float | None:
+        # the median of the absolute deviations to the center, estimated on the values of the sketch
+        if self.n == 0:
+            return None
+        values, weights = self.weighted_values()
+        return QuantileSketch.weighted_quantile(values=np.abs(values - center), weights=weights, q=0.5)
+
+    @classmethod
+    def weighted_quantile(cls, values: np.ndarray, weights: np.ndarray, q: float) -> float:
+        order = np.argsort(values, kind="stable")
+        cumulated_weights = np.cumsum(weights[order])
+        position = int(np.searchsorted(cumulated_weights, q * cumulated_weights[-1]))
+        return float(values[order][min(position, len(values) - 1)])
+
+    def to_json(self) -> dict:
+        return {"k": self.k, "n": self.n, "min": self.min, "max": self.max, "levels": [level.tolist() for level in self.levels]}
+
+    @classmethod
+    def from_json(cls, the_json: dict) -> "QuantileSketch":
+        sketch = QuantileSketch(k=the_json["k"])
+        sketch.n = the_json["n"]
+        sketch.min = the_json["min"]
+        sketch.max = the_json["max"]
+        sketch.levels = [np.array(level, dtype=np.float64) for level in the_json["levels"]]
+        return sketch
@@ -0,0 +1,61 @@
+import numpy as np
+
+
+class StreamingMoments:
+    """
+    The count, mean and the sums of the powers (2 to 4) of the deviations to the mean of numeric values,
+    updated in one pass with the Welford algorithm generalized to batches of values (Chan et al.) and to higher moments (Pébay, 2008).
+    Two instances can be merged, which gives the same moments as computing them on all the values at once.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.m3 = 0.0
+        self.m4 = 0.0
+
+    def update(self, values: np.ndarray) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+        batch = StreamingMoments()
+        batch.n = len(values)
+        batch.mean = float(values.mean())
+        deviations = values - batch.mean
+        batch.m2 = float(np.sum(deviations ** 2))
+        batch.m3 = float(np.sum(deviations ** 3))
+        batch.m4 = float(np.sum(deviations ** 4))
+        self.merge(other=batch)
+
+    def merge(self, other: "StreamingMoments") -> None:
+        if other.n == 0:
+            return
+        elif self.n == 0:
+            self.n, self.mean, self.m2, self.m3, self.m4 = other.n, other.mean, other.m2, other.m3, other.m4
+            return
+        n_a, n_b = self.n, other.n
+        n = n_a + n_b
+        delta = other.mean - self.mean
+        m4 = (self.m4 + other.m4 + delta ** 4 * n_a * n_b * (n_a ** 2 - n_a * n_b + n_b ** 2) / n ** 3
+              + 6 * delta ** 2 * (n_a ** 2 * other.m2 + n_b ** 2 * self.m2) / n ** 2 + 4 * delta * (n_a * other.m3 - n_b * self.m3) / n)
+        m3 = self.m3 + other.m3 + delta ** 3 * n_a * n_b * (n_a - n_b) / n ** 2 + 3 * delta * (n_a * other.m2 - n_b * self.m2) / n
+        m2 = self.m2 + other.m2 + delta ** 2 * n_a * n_b / n
+        self.n = n
+        self.mean = self.mean + delta * n_b / n
+        self.m2, self.m3, self.m4 = m2, m3, m4
+
+    def std_pop(self) -> float:
+        return float(np.sqrt(self.m2 / self.n)) if self.n > 0 else 0.0
+
+    def std_samp(self) -> float:
+        return float(np.sqrt(self.m2 / (self.n - 1))) if self.n > 1 else 0.0
+
+    def to_json(self) -> dict:
+        return {"n": self.n, "mean": self.mean, "m2": self.m2, "m3": self.m3, "m4": self.m4}
+
+    @classmethod
+    def from_json(cls, the_json: dict) -> "StreamingMoments":
+        moments = StreamingMoments()
+        moments.n, moments.mean, moments.m2, moments.m3, moments.m4 = the_json["n"], the_json["mean"], the_json["m2"], the_json["m3"], the_json["m4"]
+        return moments
@@ -14,6 +14,10 @@ BATCH_SIZE = 10000
 MAX_FILE_SIZE = 15 * 1048576  # 10Mb = 10x 1024^2 (bytes) -- MongoDB is limited to 16Mo but our size estimate is usually lower than the real size so we stay at 10Mo to avoid creating files with a real size larger than 16Mo
 
 PATTERN_VALUE_UNIT = re.compile(r'^ *([0-9]+[.,]*[0-9]*) *([a-zA-Z_.-]+) *$')  # we add start and end delimiters (^ and $) to not process cells with multiples values inside
+# values matching those patterns can be cast column-wise by Pandas with exactly the same result as with the cast_utils methods
+PATTERN_INTEGER = re.compile(r'-?[0-9]{1,18}')  # at most 18 digits to fit in an int64
+PATTERN_FLOAT = re.compile(r'-?[0-9]+(\.[0-9]*)?')
+PATTERN_ISO_DATETIME = re.compile(r'[0-9]{4}-[0-9]{2}-[0-9]{2}([ Tt][0-9]{2}:[0-9]{2}(:[0-9]{2}(\.[0-9]{1,6})?)?)?')  # naive (no timezone) ISO dates and datetimes, up to microseconds
 
 SNOMED_OPERATORS_LIST = ["|", "(", ")", "{", "}", ",", ":", "=", "+"]
 SNOMED_OPERATORS_STR = "".join(SNOMED_OPERATORS_LIST)
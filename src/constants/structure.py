@@ -1,6 +1,8 @@
 import os
 
 WORKING_DIR = "working-dir"
+ONTOLOGY_LABEL_CACHE_FILE = "ontology-labels.sqlite"  # in the working dir, thus shared by all databases and executions
+EXCEL_CACHE_FOLDER = "excel-cache"  # in the working dir, the Excel sheets parsed as Parquet files (keyed by the hash of the Excel file)
 DEFAULT_DB_NAME = "better_default"
 # these constants have to exactly match the volume paths described in compose.yaml
 DOCKER_FOLDER = "/home/i-etl-deployed"
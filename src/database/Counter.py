@@ -10,21 +10,65 @@ from utils.setup_logger import log
 class Counter:
     resource_id: int = dataclasses.field(init=False, default=0)
 
+    def __post_init__(self):
+        # not declared as a field to not add it to asdict()
+        # when set, identifiers are reserved in the database, thus they are shared by all counters and all ETL processes
+        self.database = None
+        self.block_last_id = 0  # the last identifier of the block reserved with reserve_block(), handed out by increment()
+
     def increment(self) -> int:
-        self.resource_id = self.resource_id + 1
+        if self.database is not None and self.resource_id >= self.block_last_id:
+            self.resource_id = self.database.reserve_identifiers(nb_ids=1)
+        else:
+            # in memory, or the next identifier of the reserved block
+            self.resource_id = self.resource_id + 1
         return self.resource_id
 
+    def reserve(self, nb_ids: int) -> int:
+        # reserve a block of nb_ids consecutive identifiers and return the first one
+        # this is equivalent to calling increment() nb_ids times
+        if self.database is not None:
+            first_id = self.database.reserve_identifiers(nb_ids=nb_ids)
+        else:
+            first_id = self.resource_id + 1
+        self.resource_id = first_id + nb_ids - 1
+        self.block_last_id = 0
+        return first_id
+
+    def reserve_block(self, nb_ids: int) -> None:
+        # reserve a block of nb_ids consecutive identifiers in the database (in a single round trip),
+        # which are then handed out one by one by increment() (e.g., when creating resources one at a time)
+        if self.database is not None and nb_ids > 0:
+            first_id = self.database.reserve_identifiers(nb_ids=nb_ids)
+            self.resource_id = first_id - 1
+            self.block_last_id = first_id + nb_ids - 1
+
+    def skip_until(self, identifier: int) -> None:
+        # the identifiers up to the given one are already used (e.g., anonymized patient ids of a previous execution)
+        if self.database is not None:
+            self.database.skip_identifiers_until(identifier=identifier)
+        self.resource_id = max(self.resource_id, identifier)
+
     def set(self, new_value) -> None:
+        # the counter is now managed in memory only
+        self.database = None
         self.resource_id = new_value
+        self.block_last_id = 0
 
     def set_with_database(self, database: Database) -> None:
-        max_value = database.get_max_resource_counter_id() + 1  # start 1 after the current counter to avoid resources with the same ID
-        if max_value > -1:
-            self.set(max_value)
-            log.debug(f"The resource counter is now set to {self.resource_id}.")
+        # identifiers will be reserved in the database counter, which is created (once) after the current max identifier
+        self.database = database
+        if self.resource_id > 0:
+            # identifiers given by this counter (in memory) before should not be reserved again
+            database.skip_identifiers_until(identifier=self.resource_id)
+        self.resource_id = database.get_last_identifier()
+        self.block_last_id = 0
+        log.debug(f"The resource counter is now set to {self.resource_id}.")
 
     def reset(self) -> None:
+        self.database = None
         self.resource_id = 0
+        self.block_last_id = 0
 
     def to_json(self):
         return dataclasses.asdict(self, dict_factory=factory)
@@ -1,14 +1,18 @@
 import dataclasses
+import hashlib
 import json
 import os
 import re
+import threading
+import time
 
 import bson
 import pymongo
 from bson.json_util import loads
 from filesplit.split import Split
 from jsonlines import jsonlines
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument, WriteConcern
+from pymongo.errors import DuplicateKeyError
 from pymongo.command_cursor import CommandCursor
 from pymongo.cursor import Cursor
 
@@ -29,6 +33,12 @@ class Database:
     """
 
     SERVER_TIMEOUT = 5000
+    DELETE_BATCH_SIZE = 1000  # the number of delete operations sent at once
+    IDENTIFIER_COUNTER_ID = "resource_identifier"  # the _id of the (single) counter document
+    CONTENT_HASH_ = "content_hash"  # the hash of the content of a diff-loaded tuple, see diff_one_batch_of_tuples()
+    # the diff load compares the tuples of each dataset on their unique variables and value (as Record.DATASET_ and Record.VALUE_)
+    DIFF_LOAD_DATASET_ = "dataset"
+    DIFF_LOAD_VALUE_ = "value"
     execution: Execution
     # DO NOT DECLARE THOSE FIELDS HERE TO NOT ADD THEM TO ASDICT(),
     # because they are not thread-safe, thus are not pickable, thus cannot be jsonified
@@ -60,6 +70,22 @@ class Database:
         # if we reach this point, the MongoDB client runs correctly.
         log.info(f"The MongoDB client, located at {self.execution.db_connection}, could be accessed properly.")
 
+        # tables on which the unique index (for upserts) has already been created when loading in-memory tuples
+        self.tables_with_unique_index = set()
+        # whether the counter document, from which resource identifiers are reserved, is known to exist
+        self.has_identifier_counter = False
+        # with the fast initial load, the unique variables of the tables that are loaded with plain insertions,
+        # whose unique indexes are built once all the tuples have been loaded, see build_deferred_unique_indexes()
+        self.deferred_unique_indexes = {}  # { table_name: [unique variables of an index, ...] }
+        # with the diff load, the content hashes of the tuples already stored for each dataset, fetched once per dataset,
+        # and the keys of the tuples loaded during this execution (the other stored tuples are obsolete)
+        self.stored_hashes = {}  # { (table_name, dataset): { key: [_id, content hash] } }
+        self.loaded_keys = {}  # { (table_name, dataset): set of keys }
+        self.diff_load_counts = {"unchanged": 0, "written": 0}
+        self.diff_load_lock = threading.Lock()  # batches may be diffed by several loader threads
+        # the time (in seconds) to build each index created by this instance, { "table.index name": time }, reported in the DB statistics
+        self.index_build_times = {}
+
         # 3. access the database
         log.info(f"drop db is: {self.execution.db_drop}")
         if self.execution.db_drop:
@@ -92,6 +118,9 @@ class Database:
 
     def drop_table(self, table_name: str) -> None:
         self.db.drop_collection(table_name)
+        self.tables_with_unique_index.discard(table_name)
+        if table_name == TableNames.COUNTER:
+            self.has_identifier_counter = False
 
     def drop_db(self) -> None:
         """
@@ -101,6 +130,8 @@ class Database:
         if self.execution.db_drop:
             log.info(f"WARNING: The database {self.execution.db_name} will be dropped!", )
             self.client.drop_database(name_or_database=self.execution.db_name)
+            self.tables_with_unique_index.clear()
+            self.has_identifier_counter = False
 
     def close(self) -> None:
         self.client.close()
@@ -109,18 +140,30 @@ class Database:
         # log.info(f"In table {table_name}, insert {one_tuple}")
         self.db[table_name].insert_one(one_tuple)
 
-    def insert_many_tuples(self, table_name: str, tuples: list[dict] | tuple) -> None:
+    def insert_many_tuples(self, table_name: str, tuples: list[dict] | tuple, acknowledged: bool = False) -> None:
         """
         Insert the given tuples in the specified table.
         :param table_name: A string being the table name in which to insert the tuples.
         :param tuples: A list of dicts being the tuples to insert.
+        :param acknowledged: A boolean to wait for the server to acknowledge the insertion (the client does not by default).
         """
-        _ = self.db[table_name].insert_many(tuples, ordered=False)
+        collection = self.db[table_name]
+        if acknowledged:
+            collection = collection.with_options(write_concern=WriteConcern(w=1))
+        _ = collection.insert_many(tuples, ordered=False)
+
+    def delete_many_tuples(self, table_name: str, filter_dict: dict) -> None:
+        # acknowledged, so that the tuples are deleted before the next insertions
+        _ = self.db[table_name].with_options(write_concern=WriteConcern(w=1)).delete_many(filter_dict)
 
     def update_one_tuple(self, table_name: str, filter_dict: dict, update: dict) -> None:
         _ = self.db[table_name].update_one(filter=filter_dict, update=self.create_update_stmt(the_tuple=update))
 
-    def create_update_stmt(self, the_tuple: dict):
+    def create_update_stmt(self, the_tuple: dict, table_name: str | None = None):
+        if table_name == TableNames.FEATURE:
+            # Features are upserted by name and never replaced: when several datasets are transformed at once (see DatasetScheduler),
+            # the first one creating a Feature gives its identifier, which all the records of that Feature reference
+            return {"$setOnInsert": the_tuple}
         # if self.execution.db_upsert_policy == UpsertPolicy.DO_NOTHING:
         #     # insert the document if it does not exist
         #     # otherwise, do nothing
@@ -144,7 +187,7 @@ class Database:
                 filter_dict[unique_variable] = one_tuple[unique_variable]
             except Exception:
                 raise KeyError(f"The tuple does not contains the attribute '{unique_variable}, thus the upsert cannot refer to it.")
-        update_stmt = self.create_update_stmt(the_tuple=one_tuple)
+        update_stmt = self.create_update_stmt(the_tuple=one_tuple, table_name=table_name)
         self.db[table_name].find_one_and_update(filter=filter_dict, update=update_stmt, upsert=True)
 
     def upsert_one_batch_of_tuples(self, table_name: str, unique_variables: list[str], the_batch: list[dict], ordered: bool) -> None:
@@ -158,7 +201,7 @@ class Database:
         log.info(unique_variables)
         operations = [pymongo.UpdateOne(
             filter={unique_variable: one_tuple[unique_variable] for unique_variable in unique_variables if unique_variable in one_tuple},
-            update=self.create_update_stmt(the_tuple=one_tuple), upsert=True)
+            update=self.create_update_stmt(the_tuple=one_tuple, table_name=table_name), upsert=True)
             for one_tuple in the_batch]
         # July 18th, 2024: bulk_write modifies the hospital lists in Transform (even if I use deep copies everywhere)
         # It changes (only?) the timestamp value with +1/100, e.g., 2024-07-18T14:34:32Z becomes 2024-07-18T14:34:33Z
@@ -198,11 +241,18 @@ class Database:
             split = Split(expected_filename, self.execution.working_dir_current)
             split.bysize(MAX_FILE_SIZE, newline=True)
             counter_files = 0
+            # the whole filename is matched, otherwise the chunks of dataset 1 would include those of dataset 11
             regex_chunk_filename = re.compile(f"{dataset_id}{table_name}_[0-9]+\\.jsonl")
-            total_count_files = sum([1 if regex_chunk_filename.search(elem) else 0 for elem in os.listdir(self.execution.working_dir_current)])
+            total_count_files = sum([1 if regex_chunk_filename.fullmatch(elem) else 0 for elem in os.listdir(self.execution.working_dir_current)])
             for chunk_filename in os.listdir(self.execution.working_dir_current):
-                if regex_chunk_filename.search(chunk_filename):
+                if regex_chunk_filename.fullmatch(chunk_filename):
                     with jsonlines.open(os.path.join(self.execution.working_dir_current, chunk_filename), "r") as json_datafile:
+                        if self.defers_unique_index(table_name=table_name, unique_variables=unique_variables):
+                            # first-time load: the tuples are inserted and the unique index will be built once all of them are loaded
+                            tuples = bson.json_util.loads(json.dumps([obj for obj in json_datafile]))
+                            self.insert_many_tuples(table_name=table_name, tuples=tuples, acknowledged=True)
+                            counter_files += 1
+                            continue
                         if first_file:
                             # first, create an index on the unique variables to speed up the upsert (which checks whether each document already exists)
                             # we do this only if we have data for that kind of data
@@ -213,7 +263,10 @@ class Database:
                         # this needs to be added back to the JSON read string before parsing it
                         tuples = [obj for obj in json_datafile]  # this transforms the JSONL file to a list of objects
                         tuples = bson.json_util.loads(json.dumps(tuples))  # we need to read the objects with bson to interpret dates
-                        self.upsert_one_batch_of_tuples(table_name=table_name, unique_variables=unique_variables, the_batch=tuples, ordered=ordered)
+                        if self.diff_loads(table_name=table_name):
+                            tuples = self.diff_one_batch_of_tuples(table_name=table_name, unique_variables=unique_variables, the_batch=tuples)
+                        if len(tuples) > 0:
+                            self.upsert_one_batch_of_tuples(table_name=table_name, unique_variables=unique_variables, the_batch=tuples, ordered=ordered)
                         counter_files += 1
                         if counter_files % 5 == 0:
                             log.debug(f"Table {table_name}, loaded {counter_files}/{total_count_files}")
@@ -221,6 +274,161 @@ class Database:
         else:
             log.debug(f"Table {table_name}, no file to load.")
 
+    def load_tuples_in_table(self, table_name: str, unique_variables: list[str], tuples: list[dict], ordered: bool) -> None:
+        """
+        Upsert in-memory tuples in the given table, e.g., a batch of records coming directly from the Transform step.
+        Contrarily to load_json_in_table, tuples are already typed (dates are datetime objects),
+        thus they do not need to be written in a file and parsed back with bson.
+
+        :param table_name: A string being the table name in which to upsert the tuples.
+        :param unique_variables: The fields on which the tuples are unique.
+        :param tuples: A list of dicts being the tuples to upsert.
+        :param ordered: Whether the upserts should be performed in order.
+        """
+        if len(tuples) > 0:
+            if self.defers_unique_index(table_name=table_name, unique_variables=unique_variables):
+                # first-time load: the tuples are inserted and the unique index will be built once all of them are loaded
+                self.insert_many_tuples(table_name=table_name, tuples=tuples, acknowledged=True)
+                return
+            if table_name not in self.tables_with_unique_index:
+                # first, create an index on the unique variables to speed up the upsert (which checks whether each document already exists)
+                log.info(f"For table {table_name}, creating unique index {unique_variables}")
+                self.create_unique_index(table_name=table_name, columns={elem: 1 for elem in unique_variables})
+                self.tables_with_unique_index.add(table_name)
+            if self.diff_loads(table_name=table_name):
+                tuples = self.diff_one_batch_of_tuples(table_name=table_name, unique_variables=unique_variables, the_batch=tuples)
+            if len(tuples) > 0:
+                self.upsert_one_batch_of_tuples(table_name=table_name, unique_variables=unique_variables, the_batch=tuples, ordered=ordered)
+
+    def defers_unique_index(self, table_name: str, unique_variables: list[str]) -> bool:
+        # only records are loaded with plain insertions in the fast initial load, because they are the bulk of the data,
+        # while features, patients and hospitals are few and may be shared by several datasets (thus upserted)
+        if not self.execution.fast_initial_load or table_name != TableNames.RECORD:
+            return False
+        indexes = self.deferred_unique_indexes.setdefault(table_name, [])
+        if unique_variables not in indexes:
+            indexes.append(list(unique_variables))
+        return True
+
+    def build_deferred_unique_indexes(self) -> dict:
+        """
+        Build the unique indexes of the tables loaded with plain insertions (fast initial load).
+        Before building each index, a validation pass removes the duplicates of its unique variables:
+        as with upserts, the last inserted tuple is kept.
+        :return: A dict being the number of removed duplicates per table.
+        """
+        nb_duplicates = {}
+        for table_name, indexes in self.deferred_unique_indexes.items():
+            for unique_variables in indexes:
+                nb_duplicates[table_name] = nb_duplicates.get(table_name, 0) + self.remove_duplicates(table_name=table_name, unique_variables=unique_variables)
+                self.create_unique_index(table_name=table_name, columns={elem: 1 for elem in unique_variables})
+        self.deferred_unique_indexes.clear()
+        return nb_duplicates
+
+    def remove_duplicates(self, table_name: str, unique_variables: list[str]) -> int:
+        # as with upserts, the last tuple of the data is kept: identifiers are given in the order of the data by the Transform,
+        # while _id (ObjectIds) follow the insertion order, which is arbitrary with several loader threads (they only break ties)
+        operations = [
+            Operators.sort_many(map_field_order={"identifier": 1, "_id": 1}),  # cannot use Resource.IDENTIFIER_ because it leads to a circular dependency
+            # missing and null values are the same for unique indexes
+            Operators.group_by(group_key={unique_variable: {"$ifNull": [f"${unique_variable}", None]} for unique_variable in unique_variables}, groups=[
+                {"name": "kept_id", "operator": "$last", "field": "$_id"},
+                {"name": "count", "operator": "$sum", "field": 1}
+            ]),
+            Operators.match(field="count", value={"$gt": 1}, is_regex=False)
+        ]
+        # the other tuples of each duplicated key are deleted, by batches of keys
+        nb_duplicates = 0
+        operations_batch = []
+        for duplicates in self.db[table_name].aggregate(operations, allowDiskUse=True):
+            nb_duplicates += duplicates["count"] - 1
+            duplicates_filter = {unique_variable: duplicates["_id"].get(unique_variable) for unique_variable in unique_variables}
+            operations_batch.append(pymongo.DeleteMany(duplicates_filter | {"_id": {"$ne": duplicates["kept_id"]}}))
+            if len(operations_batch) >= Database.DELETE_BATCH_SIZE:
+                self.db[table_name].bulk_write(operations_batch, ordered=False)
+                operations_batch = []
+        if len(operations_batch) > 0:
+            self.db[table_name].bulk_write(operations_batch, ordered=False)
+        if nb_duplicates > 0:
+            log.info(f"Removed {nb_duplicates} duplicates in table {table_name} on {unique_variables}")
+        return nb_duplicates
+
+    def diff_loads(self, table_name: str) -> bool:
+        # only records are diff-loaded, because they are the bulk of the data and are partitioned by dataset
+        return self.execution.diff_load and table_name == TableNames.RECORD
+
+    def diff_one_batch_of_tuples(self, table_name: str, unique_variables: list[str], the_batch: list[dict]) -> list[dict]:
+        """
+        Keep the tuples of the batch that are not already stored as is, i.e., the new tuples and the tuples whose value has changed.
+        Tuples are compared with a hash of their unique variables and value, stored in the tuples (the timestamp and identifier are not part of it).
+        :param table_name: A string being the table name in which the tuples will be upserted.
+        :param unique_variables: The fields on which the tuples are unique.
+        :param the_batch: A list of dicts being the tuples to compare to the stored ones.
+        :return: The list of new or changed tuples, with their content hash.
+        """
+        new_or_changed_tuples = []
+        with self.diff_load_lock:
+            for one_tuple in the_batch:
+                dataset = one_tuple.get(Database.DIFF_LOAD_DATASET_)
+                stored_hashes = self.get_stored_hashes(table_name=table_name, unique_variables=unique_variables, dataset=dataset)
+                key = Database.compute_diff_key(one_tuple=one_tuple, unique_variables=unique_variables)
+                content_hash = Database.compute_content_hash(one_tuple=one_tuple, unique_variables=unique_variables)
+                self.loaded_keys.setdefault((table_name, dataset), set()).add(key)
+                stored = stored_hashes.get(key)
+                if stored is None or stored[1] != content_hash:
+                    one_tuple[Database.CONTENT_HASH_] = content_hash
+                    new_or_changed_tuples.append(one_tuple)
+                    stored_hashes[key] = [None if stored is None else stored[0], content_hash]
+            self.diff_load_counts["unchanged"] += len(the_batch) - len(new_or_changed_tuples)
+            self.diff_load_counts["written"] += len(new_or_changed_tuples)
+        log.debug(f"Table {table_name}, {len(new_or_changed_tuples)}/{len(the_batch)} new or changed tuples")
+        return new_or_changed_tuples
+
+    def get_stored_hashes(self, table_name: str, unique_variables: list[str], dataset: str) -> dict:
+        # a single scan of the tuples of the dataset, projected on their key and hash (tuples loaded without hash are rewritten once)
+        if (table_name, dataset) not in self.stored_hashes:
+            projection = {unique_variable: 1 for unique_variable in unique_variables}
+            projection[Database.CONTENT_HASH_] = 1
+            stored_hashes = {}
+            for stored_tuple in self.find_operation(table_name=table_name, filter_dict={Database.DIFF_LOAD_DATASET_: dataset}, projection=projection):
+                key = Database.compute_diff_key(one_tuple=stored_tuple, unique_variables=unique_variables)
+                stored_hashes[key] = [stored_tuple["_id"], stored_tuple.get(Database.CONTENT_HASH_)]
+            self.stored_hashes[(table_name, dataset)] = stored_hashes
+        return self.stored_hashes[(table_name, dataset)]
+
+    @classmethod
+    def compute_diff_key(cls, one_tuple: dict, unique_variables: list[str]) -> str:
+        return json.dumps([one_tuple.get(unique_variable) for unique_variable in unique_variables], default=str)
+
+    @classmethod
+    def compute_content_hash(cls, one_tuple: dict, unique_variables: list[str]) -> str:
+        content = [one_tuple.get(unique_variable) for unique_variable in unique_variables]
+        content.append(one_tuple.get(Database.DIFF_LOAD_VALUE_))
+        return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def finish_diff_load(self, dataset: str, delete_obsolete: bool) -> dict:
+        """
+        End the diff load of a dataset, once all its tuples have been loaded: optionally delete its stored tuples that have not been loaded again,
+        and free the keys and hashes kept for it.
+        :param dataset: A string being the global identifier of the dataset.
+        :param delete_obsolete: A boolean to delete the obsolete tuples.
+        :return: A dict being the number of deleted tuples per table.
+        """
+        nb_deleted = {}
+        with self.diff_load_lock:
+            for table_name in [table_name for table_name, one_dataset in self.stored_hashes if one_dataset == dataset]:
+                stored_hashes = self.stored_hashes.pop((table_name, dataset))
+                loaded_keys = self.loaded_keys.pop((table_name, dataset), set())
+                if delete_obsolete:
+                    obsolete_ids = [stored[0] for key, stored in stored_hashes.items() if key not in loaded_keys and stored[0] is not None]
+                    if len(obsolete_ids) > 0:
+                        log.info(f"Removing {len(obsolete_ids)} obsolete tuples of dataset {dataset} in table {table_name}")
+                        self.delete_many_tuples(table_name=table_name, filter_dict={"_id": {"$in": obsolete_ids}})
+                        nb_deleted[table_name] = nb_deleted.get(table_name, 0) + len(obsolete_ids)
+            log.info(f"Diff load of dataset {dataset}: {self.diff_load_counts['unchanged']} unchanged tuples, {self.diff_load_counts['written']} new or changed tuples")
+            self.diff_load_counts = {"unchanged": 0, "written": 0}
+        return nb_deleted
+
     def find_operation(self, table_name: str, filter_dict: dict, projection: dict) -> Cursor:
         """
         Perform a find operation (SELECT * FROM x WHERE filter_dict) in a given table.
@@ -251,12 +459,16 @@ class Database:
         return self.db[table_name].count_documents(filter_dict)
 
     def inverse_inner_join(self, name_table_1: str, name_table_2: str, foreign_field: str, local_field: str, lookup_name: str) -> CommandCursor:
-        operations = [
+        operations = Database.inverse_inner_join_operations(name_table_2=name_table_2, foreign_field=foreign_field, local_field=local_field, lookup_name=lookup_name)
+        return self.db[name_table_1].aggregate(operations)
+
+    @classmethod
+    def inverse_inner_join_operations(cls, name_table_2: str, foreign_field: str, local_field: str, lookup_name: str) -> list:
+        return [
             Operators.lookup(join_table_name=name_table_2, foreign_field=foreign_field, local_field=local_field, lookup_field_name=lookup_name),
             Operators.match(field=lookup_name, value={"$eq": []}, is_regex=False),
             Operators.set_variables([{"name": "_id", "operation": 0}])
         ]
-        return self.db[name_table_1].aggregate(operations)
 
     def list_existing_indexes(self, table_name: str) -> list:
         index_list = [res.values() for res in self.db[table_name].list_indexes()]
@@ -272,7 +484,9 @@ class Database:
         :return: Nothing.
         """
         log.info(f"create unique index in {table_name} on columns {columns}")
-        self.db[table_name].create_index(columns, unique=True)
+        start = time.time()
+        index_name = self.db[table_name].create_index(columns, unique=True)
+        self.index_build_times[f"{table_name}.{index_name}"] = time.time() - start
 
     def create_non_unique_index(self, table_name: str, columns: dict) -> None:
         """
@@ -283,7 +497,20 @@ class Database:
         :return: Nothing.
         """
         log.info(f"create non-unique index in {table_name} on columns {columns}")
-        self.db[table_name].create_index(columns, unique=False)
+        start = time.time()
+        index_name = self.db[table_name].create_index(columns, unique=False)
+        self.index_build_times[f"{table_name}.{index_name}"] = time.time() - start
+
+    def get_index_sizes(self, table_name: str) -> dict:
+        # the size (in bytes) of each index of the table, { index name: size }
+        return self.db.command("collStats", table_name).get("indexSizes", {})
+
+    def explain_find(self, table_name: str, filter_dict: dict, projection: dict) -> dict:
+        return self.db[table_name].find(filter_dict, projection).explain()
+
+    def explain_aggregate(self, table_name: str, operations: list) -> dict:
+        # the query plan of the pipeline, without running it
+        return self.db.command("explain", {"aggregate": table_name, "pipeline": operations, "cursor": {}}, verbosity="queryPlanner")
 
     def create_on_demand_view(self, table_name: str, view_name: str, pipeline: list) -> None:
         self.drop_table(table_name=view_name)
@@ -361,6 +588,59 @@ class Database:
                 pass
         return max_value
 
+    def reserve_identifiers(self, nb_ids: int) -> int:
+        """
+        Reserve a block of consecutive resource identifiers, shared by all resources.
+        The block is reserved atomically (with $inc) in a single counter document,
+        thus several ETL processes can reserve identifiers concurrently without getting the same ones.
+        :param nb_ids: An integer being the number of identifiers to reserve.
+        :return: An integer being the first reserved identifier.
+        """
+        self.create_identifier_counter()
+        counter = self.get_identifier_counter_table().find_one_and_update(filter={"_id": Database.IDENTIFIER_COUNTER_ID},
+                                                                          update={"$inc": {"value": nb_ids}},
+                                                                          return_document=ReturnDocument.AFTER)
+        return counter["value"] - nb_ids + 1
+
+    def skip_identifiers_until(self, identifier: int) -> None:
+        """
+        Make sure that the next reserved identifiers are greater than the given one, e.g., because it has been used in a previous execution.
+        :param identifier: An integer being an identifier that should not be reserved anymore.
+        :return: Nothing.
+        """
+        self.create_identifier_counter()
+        self.get_identifier_counter_table().update_one(filter={"_id": Database.IDENTIFIER_COUNTER_ID}, update={"$max": {"value": identifier}})
+
+    def get_last_identifier(self) -> int:
+        """
+        Get the last resource identifier that has been reserved (by any ETL process).
+        :return: An integer being the last reserved identifier, 0 if no identifier has been reserved yet.
+        """
+        self.create_identifier_counter()
+        return self.get_identifier_counter_table().find_one(filter={"_id": Database.IDENTIFIER_COUNTER_ID})["value"]
+
+    def create_identifier_counter(self) -> None:
+        if not self.has_identifier_counter:
+            if self.get_identifier_counter_table().find_one(filter={"_id": Database.IDENTIFIER_COUNTER_ID}) is None:
+                # the database is new, or has been created before the counter document existed,
+                # thus we look (once) for the current max identifier to start after it
+                max_value = max(self.get_max_resource_counter_id(), 0)
+                log.info(f"create the identifier counter, starting after {max_value}")
+                try:
+                    # $max keeps the counter of another ETL process that would have created (and incremented) it meanwhile
+                    self.get_identifier_counter_table().update_one(filter={"_id": Database.IDENTIFIER_COUNTER_ID},
+                                                                   update={"$max": {"value": max_value}}, upsert=True)
+                except DuplicateKeyError:
+                    # another ETL process has just inserted the counter document
+                    self.get_identifier_counter_table().update_one(filter={"_id": Database.IDENTIFIER_COUNTER_ID},
+                                                                   update={"$max": {"value": max_value}})
+            self.has_identifier_counter = True
+
+    def get_identifier_counter_table(self):
+        # identifiers have to be acknowledged by the database before being used,
+        # while the client does not wait for acknowledgments by default (w=0)
+        return self.db[TableNames.COUNTER].with_options(write_concern=WriteConcern(w=1))
+
     def db_exists(self, db_name: str) -> bool:
         list_dbs = self.client.list_databases()
         for db in list_dbs:
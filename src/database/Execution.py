@@ -1,5 +1,6 @@
 import dataclasses
 import getpass
+import hashlib
 import json
 import logging
 import os.path
@@ -12,10 +13,15 @@ import pymongo
 from constants.methods import factory
 from enums.MetadataColumns import MetadataColumns
 from enums.Profile import Profile
+from enums.ProfileEngines import ProfileEngines
+from enums.RecordLayouts import RecordLayouts
+from enums.ValueEncodings import ValueEncodings
 
 from constants.structure import WORKING_DIR, DB_CONNECTION, DOCKER_FOLDER_METADATA, \
-    DOCKER_FOLDER_ANONYMIZED_PATIENT_IDS, DOCKER_FOLDER_TEST, DEFAULT_DB_NAME
+    DOCKER_FOLDER_ANONYMIZED_PATIENT_IDS, DOCKER_FOLDER_TEST, DEFAULT_DB_NAME, ONTOLOGY_LABEL_CACHE_FILE
+from database.OntologyLabelCache import OntologyLabelCache
 from enums.HospitalNames import HospitalNames
+from enums.IngestionBackends import IngestionBackends
 from enums.ParameterKeys import ParameterKeys
 from utils import setup_logger
 from utils.cast_utils import cast_str_to_int
@@ -31,6 +37,7 @@ class Execution:
     # parameters related to the project structure and the input/output files
     metadata_filepath: str = field(init=False, default=None)  # user input
     current_filepath: str = field(init=False, default=None)  # set in the loop on files in ETL
+    current_file_hash: str = field(init=False, default=None)  # set in the loop on files in ETL, None if the current file has not been hashed
     current_dataset_gid: str = field(init=False, default=None)  # set in the loop on file sin ETL
     current_file_number: int = field(init=False, default=1)  # set in the ETL
     anonymized_patient_ids_filepath: str = field(init=False, default=None)  # user input
@@ -45,6 +52,29 @@ class Execution:
     columns_to_remove: list = field(init=False, default_factory=list)  # user input
     patient_id_column_name: str = field(init=False, default="id")
     sample_id_column_name: str = field(init=False, default="")
+    data_chunk_size: int = field(init=False, default=0)  # user input, in rows
+    ingestion_backend: str = field(init=False, default=IngestionBackends.PANDAS)  # user input
+    value_cache_size: int = field(init=False, default=10000)  # user input, in values per column
+    record_layout: str = field(init=False, default=RecordLayouts.DOCUMENTS)  # user input
+    value_encoding: str = field(init=False, default=ValueEncodings.VERBOSE)  # user input
+    max_memory_mb: int = field(init=False, default=0)  # user input, in MB
+    direct_load: bool = field(init=False, default=False)  # user input
+    audit_files: bool = field(init=False, default=False)  # user input
+    nb_loaders: int = field(init=False, default=0)  # user input
+    load_queue_size: int = field(init=False, default=4)  # user input
+    nb_workers: int = field(init=False, default=1)  # user input
+    nb_parallel_datasets: int = field(init=False, default=1)  # user input
+    fast_initial_load: bool = field(init=False, default=False)  # user input
+    diff_load: bool = field(init=False, default=False)  # user input
+    diff_load_delete: bool = field(init=False, default=False)  # user input
+    skip_unchanged_datasets: bool = field(init=False, default=False)  # user input
+    ontology_cache_ttl: int = field(init=False, default=30)  # user input, in days
+    ontology_offline: bool = field(init=False, default=False)  # user input
+    ontology_nb_threads: int = field(init=False, default=0)  # user input
+    ontology_max_per_api: int = field(init=False, default=4)  # user input
+    profile_engine: str = field(init=False, default=ProfileEngines.AGGREGATIONS)  # user input
+    profile_approximate: bool = field(init=False, default=False)  # user input
+    profile_rank_error: float = field(init=False, default=0.01)  # user input
 
     # parameters related to data generation
     nb_rows: int = field(init=False, default=0)
@@ -70,10 +100,46 @@ class Execution:
         self.record_carrier_patients = self.check_parameter(key=ParameterKeys.RECORD_CARRIER_PATIENT, accepted_values=["True", "False", True, False], default_value=self.record_carrier_patients)
         self.patient_id_column_name = MetadataColumns.normalize_name(self.check_parameter(key=ParameterKeys.PATIENT_ID_COLUMN, accepted_values=None, default_value=self.patient_id_column_name))
         self.sample_id_column_name = MetadataColumns.normalize_name(self.check_parameter(key=ParameterKeys.SAMPLE_ID_COLUMN, accepted_values=None, default_value=self.patient_id_column_name))
+        self.data_chunk_size = self.check_parameter(key=ParameterKeys.DATA_CHUNK_SIZE, accepted_values=None, default_value=self.data_chunk_size)
+        self.ingestion_backend = self.check_parameter(key=ParameterKeys.INGESTION_BACKEND, accepted_values=IngestionBackends.values(), default_value=self.ingestion_backend)
+        self.value_cache_size = self.check_parameter(key=ParameterKeys.VALUE_CACHE_SIZE, accepted_values=None, default_value=self.value_cache_size)
+        self.record_layout = self.check_parameter(key=ParameterKeys.RECORD_LAYOUT, accepted_values=RecordLayouts.values(), default_value=self.record_layout)
+        self.value_encoding = self.check_parameter(key=ParameterKeys.VALUE_ENCODING, accepted_values=ValueEncodings.values(), default_value=self.value_encoding)
+        self.max_memory_mb = self.check_parameter(key=ParameterKeys.MAX_MEMORY_MB, accepted_values=None, default_value=self.max_memory_mb)
+        self.direct_load = self.check_parameter(key=ParameterKeys.DIRECT_LOAD, accepted_values=["True", "False", True, False], default_value=self.direct_load)
+        self.audit_files = self.check_parameter(key=ParameterKeys.AUDIT_FILES, accepted_values=["True", "False", True, False], default_value=self.audit_files)
+        self.nb_loaders = self.check_parameter(key=ParameterKeys.NB_LOADERS, accepted_values=None, default_value=self.nb_loaders)
+        self.load_queue_size = self.check_parameter(key=ParameterKeys.LOAD_QUEUE_SIZE, accepted_values=None, default_value=self.load_queue_size)
+        self.nb_workers = self.check_parameter(key=ParameterKeys.NB_WORKERS, accepted_values=None, default_value=self.nb_workers)
+        self.nb_parallel_datasets = self.check_parameter(key=ParameterKeys.NB_PARALLEL_DATASETS, accepted_values=None, default_value=self.nb_parallel_datasets)
+        self.fast_initial_load = self.check_parameter(key=ParameterKeys.FAST_INITIAL_LOAD, accepted_values=["True", "False", True, False], default_value=self.fast_initial_load)
+        self.diff_load = self.check_parameter(key=ParameterKeys.DIFF_LOAD, accepted_values=["True", "False", True, False], default_value=self.diff_load)
+        self.diff_load_delete = self.check_parameter(key=ParameterKeys.DIFF_LOAD_DELETE, accepted_values=["True", "False", True, False], default_value=self.diff_load_delete)
+        self.skip_unchanged_datasets = self.check_parameter(key=ParameterKeys.SKIP_UNCHANGED_DATASETS, accepted_values=["True", "False", True, False], default_value=self.skip_unchanged_datasets)
+        self.ontology_cache_ttl = self.check_parameter(key=ParameterKeys.ONTOLOGY_CACHE_TTL, accepted_values=None, default_value=self.ontology_cache_ttl)
+        self.ontology_offline = self.check_parameter(key=ParameterKeys.ONTOLOGY_OFFLINE, accepted_values=["True", "False", True, False], default_value=self.ontology_offline)
+        self.ontology_nb_threads = self.check_parameter(key=ParameterKeys.ONTOLOGY_NB_THREADS, accepted_values=None, default_value=self.ontology_nb_threads)
+        self.ontology_max_per_api = self.check_parameter(key=ParameterKeys.ONTOLOGY_MAX_PER_API, accepted_values=None, default_value=self.ontology_max_per_api)
+        self.profile_engine = self.check_parameter(key=ParameterKeys.PROFILE_ENGINE, accepted_values=ProfileEngines.values(), default_value=self.profile_engine)
+        self.profile_approximate = self.check_parameter(key=ParameterKeys.PROFILE_APPROXIMATE, accepted_values=["True", "False", True, False], default_value=self.profile_approximate)
+        self.profile_rank_error = float(self.check_parameter(key=ParameterKeys.PROFILE_RANK_ERROR, accepted_values=None, default_value=self.profile_rank_error))
+        if self.nb_loaders > 0 and not self.direct_load:
+            # loader threads load records while they are transformed, thus they are never written in files
+            log.info(f"Using {self.nb_loaders} loader threads, thus records are directly loaded in the database.")
+            self.direct_load = True
+        if self.fast_initial_load and not self.db_drop:
+            # records are inserted without checking whether they already exist, which is only valid in an empty database
+            log.info("The fast initial load requires to drop the database, thus records are upserted.")
+            self.fast_initial_load = False
+        if self.profile_approximate and self.profile_engine != ProfileEngines.SINGLE_PASS:
+            # the sketches are built while reading the records once
+            log.info("The approximate profiles are computed with the single-pass engine.")
+            self.profile_engine = ProfileEngines.SINGLE_PASS
 
         # create working files for the ETL
         self.create_current_working_dir()
         self.setup_logging_files()
+        self.set_up_ontology_label_cache()
 
     def file_set_up(self, setup_files: bool) -> None:
         log.info("in file_set_up()")
@@ -165,6 +231,11 @@ class Execution:
         filehandler.setFormatter(formatter)
         setup_logger.log.addHandler(filehandler)  # add the filehandler located in the working dir
 
+    def set_up_ontology_label_cache(self):
+        # worker processes receive the cache of the main process (with the labels resolved so far)
+        OntologyLabelCache.set_up(filepath=os.path.join(self.working_dir, ONTOLOGY_LABEL_CACHE_FILE), ttl_days=self.ontology_cache_ttl,
+                                  offline=self.ontology_offline)
+
     def setup_mapping_to_anonymized_patient_ids(self):
         if os.sep in self.anonymized_patient_ids_filepath:
             raise ValueError(f"The anonymized patient ids ({self.anonymized_patient_ids_filepath}) file should be a filename, but it looks like a filepath.")
@@ -182,6 +253,26 @@ class Execution:
                 # there are some mappings there, nothing more to do
                 pass
 
+    def compute_etl_version(self) -> str:
+        """
+        Compute the version of the ETL, being the hash of its code and of the parameters changing the loaded data (not its performance),
+        thus a dataset is loaded again (see ETL.run()) if it has been loaded by another version.
+        :return: The SHA-256 of the ETL code and of the parameters.
+        """
+        etl_version = hashlib.sha256()
+        code_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # src
+        for folder, sub_folders, filenames in os.walk(code_folder):
+            sub_folders.sort()  # os.walk() visits the sub-folders in the order of this list
+            for filename in sorted(filenames):
+                if filename.endswith(".py"):
+                    etl_version.update(os.path.relpath(os.path.join(folder, filename), code_folder).encode("utf-8"))
+                    with open(os.path.join(folder, filename), "rb") as code_file:
+                        etl_version.update(code_file.read())
+        parameters = [self.hospital_name, self.use_locale, self.record_carrier_patients, self.columns_to_remove, self.patient_id_column_name,
+                      self.sample_id_column_name, self.record_layout, self.value_encoding]
+        etl_version.update(json.dumps(parameters, default=str).encode("utf-8"))
+        return etl_version.hexdigest()
+
     def to_json(self):
         return {"my_exec": "exec"}
         # return dataclasses.asdict(self, dict_factory=factory)
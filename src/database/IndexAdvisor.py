@@ -0,0 +1,49 @@
+from entities.Record import Record
+from entities.Resource import Resource
+
+
+class IndexAdvisor:
+    """
+    The compound indexes of the Record table, designed for the shapes of the queries computing feature profiles and statistics:
+    the fields of the first $match come first (equalities before ranges), then the fields of the first $group,
+    so that MongoDB scans the index instead of the collection and gets the grouped fields from the index keys.
+    """
+
+    RECORD_INDEXES = [
+        # single-pass profiles and Pearson correlations: find {instantiates, dataset $in},
+        # aggregation profiles: $match {instantiates $in, value $type}, then $group by (dataset, instantiates, value)
+        {Record.INSTANTIATES_: 1, Record.DATASET_: 1, Record.VALUE_: 1},
+        # number of patients per dataset (missing percentage): $match {entity_type $ne clinical}, then $group by (dataset, has_subject)
+        {Resource.ENTITY_TYPE_: 1, Record.DATASET_: 1, Record.SUBJECT_: 1},
+        # number of samples per dataset (missing percentage of clinical records): $match {entity_type clinical}, then $group by (dataset, base_id)
+        {Resource.ENTITY_TYPE_: 1, Record.DATASET_: 1, Record.BASE_ID_: 1}
+    ]
+
+    # the indexes of the RecordBucket table (bucket layout), for the conditions on the shared fields of buckets, matched before their expansion
+    RECORD_BUCKET_INDEXES = [
+        # single-pass profiles and Pearson correlations: find {instantiates, dataset $in}
+        {Record.INSTANTIATES_: 1, Record.DATASET_: 1},
+        # number of patients and samples per dataset: $match {entity_type}
+        {Resource.ENTITY_TYPE_: 1, Record.DATASET_: 1}
+    ]
+
+    @classmethod
+    def get_plan_stages(cls, explanation: dict | list) -> list:
+        # all the stages of the winning plans of an explain() output, which nests plans in
+        # queryPlanner.winningPlan(.queryPlan), inputStage(s) and $cursor (aggregations)
+        stages = []
+        if isinstance(explanation, dict):
+            if "stage" in explanation:
+                stages.append(explanation["stage"])
+            for key, value in explanation.items():
+                if key != "rejectedPlans":
+                    stages.extend(IndexAdvisor.get_plan_stages(explanation=value))
+        elif isinstance(explanation, list):
+            for element in explanation:
+                stages.extend(IndexAdvisor.get_plan_stages(explanation=element))
+        return stages
+
+    @classmethod
+    def uses_index(cls, explanation: dict) -> bool:
+        stages = IndexAdvisor.get_plan_stages(explanation=explanation)
+        return ("IXSCAN" in stages or "DISTINCT_SCAN" in stages) and "COLLSCAN" not in stages
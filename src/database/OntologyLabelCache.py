@@ -0,0 +1,86 @@
+import sqlite3
+import time
+
+from utils.setup_logger import log
+
+
+class OntologyLabelCache:
+    """
+    Cache of the labels of ontology resources, keyed by (system, code), kept in memory during the execution
+    and persisted in a SQLite file of the working dir (unless filepath is None).
+    Codes that are not found by the ontology APIs are cached too (with their error), so that they are not queried again.
+    Persisted entries expire after ttl_days, except in offline mode where the cache is the only source of labels.
+    The cache is configured by the main process (see Execution.set_up_ontology_label_cache()) and sent to worker processes.
+    """
+
+    current = None  # the cache used by the OntologyResources of the current process, if any
+
+    def __init__(self, filepath: str | None, ttl_days: int, offline: bool):
+        self.filepath = filepath
+        self.ttl = ttl_days * 86400  # in seconds
+        self.offline = offline
+        self.labels = {}  # { (system, code): (label, error), ... } for the codes looked up or resolved during this execution
+        self.connection = None  # opened at the first lookup, in the process using the cache
+
+    @classmethod
+    def set_up(cls, filepath: str, ttl_days: int, offline: bool) -> None:
+        if cls.current is not None:
+            cls.current.close()
+        if ttl_days <= 0 and not offline:
+            filepath = None
+        cls.current = OntologyLabelCache(filepath=filepath, ttl_days=ttl_days, offline=offline)
+        log.info(f"Ontology label cache: {filepath if filepath is not None else 'in memory only'}, offline mode: {offline}")
+
+    def get_connection(self) -> sqlite3.Connection:
+        if self.connection is None:
+            # several processes (ETL workers) may use the same file: WAL lets readers work while one process writes,
+            # and writers wait (up to timeout seconds) for each other instead of failing
+            self.connection = sqlite3.connect(self.filepath, timeout=30, isolation_level=None)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS labels (system TEXT NOT NULL, code TEXT NOT NULL, label TEXT, error TEXT, "
+                                    "timestamp REAL NOT NULL, PRIMARY KEY (system, code))")
+        return self.connection
+
+    def get_label(self, system: str, code: str) -> tuple[str | None, str | None] | None:
+        # returns None if the code is not cached (or has expired), else the pair (label, error) where exactly one is None
+        if (system, code) in self.labels:
+            return self.labels[(system, code)]
+        elif self.filepath is None:
+            return None
+        row = self.get_connection().execute("SELECT label, error, timestamp FROM labels WHERE system = ? AND code = ?", (system, code)).fetchone()
+        if row is None:
+            return None
+        elif not self.offline and time.time() - row[2] > self.ttl:
+            # in offline mode, an expired label is still better than no label
+            return None
+        else:
+            self.labels[(system, code)] = (row[0], row[1])
+            return row[0], row[1]
+
+    def add_label(self, system: str, code: str, label: str) -> None:
+        self.upsert(system=system, code=code, label=label, error=None)
+
+    def add_not_found(self, system: str, code: str, error: str) -> None:
+        self.upsert(system=system, code=code, label=None, error=error)
+
+    def add_failed_call(self, system: str, code: str, error: str) -> None:
+        # the API could not be reached (even with retries), thus we do not query it again during this execution,
+        # but the code is not persisted in order to be queried in the next executions
+        self.labels[(system, code)] = (None, error)
+
+    def upsert(self, system: str, code: str, label: str | None, error: str | None) -> None:
+        self.labels[(system, code)] = (label, error)
+        if self.filepath is not None:
+            self.get_connection().execute("INSERT OR REPLACE INTO labels (system, code, label, error, timestamp) VALUES (?, ?, ?, ?, ?)",
+                                          (system, code, label, error, time.time()))
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def __getstate__(self):
+        # the cache is sent to worker processes, which open their own connection to the SQLite file
+        state = self.__dict__.copy()
+        state["connection"] = None
+        return state
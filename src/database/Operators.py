@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, date, time
 from typing import Any
 
 from enums.EnumAsClass import EnumAsClass
@@ -236,6 +236,14 @@ class Operators(EnumAsClass):
     def from_datetime_to_isodate(cls, current_datetime: datetime) -> dict:
         return {"$date": current_datetime.strftime(THE_DATETIME_FORMAT)}
 
+    @classmethod
+    def from_datetime_to_bson_date(cls, current_datetime: datetime | date | time) -> datetime:
+        # the datetime that MongoDB stores for from_datetime_to_isodate(current_datetime), i.e., a UTC datetime without microseconds
+        if isinstance(current_datetime, datetime):
+            return current_datetime.replace(microsecond=0, tzinfo=None)
+        else:
+            return datetime.strptime(current_datetime.strftime(THE_DATETIME_FORMAT), THE_DATETIME_FORMAT)
+
     @classmethod
     def merge(cls, table_name: str, on_attribute: str|list, when_matched: str, when_not_matched: str) -> dict:
         # append new tuples, e.g., from an aggregation pipeline, to an existing collection
@@ -0,0 +1,35 @@
+from entities.DiagnosisRecord import DiagnosisRecord
+from entities.Record import Record
+from entities.Resource import Resource
+
+
+class RecordBuckets:
+    """
+    The bucket layout of records: the records of a (dataset, feature) pair are stored by buckets of at most BUCKET_SIZE records,
+    whose shared fields (dataset, feature, entity type, hospital and timestamp) are stored once, and other fields in parallel arrays.
+    A record with no sample or diagnosis counter has a null element in those arrays (if the bucket has them).
+    """
+
+    BUCKET_SIZE = 1000
+    BUCKET_ID_ = "bucket_id"  # the identifier of the first record of the bucket
+    SHARED_FIELDS = [Resource.TIMESTAMP_, Record.REG_BY_, Record.INSTANTIATES_, Resource.DATASET_, Resource.ENTITY_TYPE_]
+    ARRAY_FIELDS = [Resource.IDENTIFIER_, Record.SUBJECT_, Record.VALUE_]
+    OPTIONAL_ARRAY_FIELDS = [Record.BASE_ID_, DiagnosisRecord.DIAGNOSIS_COUNTER_]
+    POSITION_ = "position"
+
+    @classmethod
+    def get_unique_variables(cls) -> list[str]:
+        return [Resource.DATASET_, Record.INSTANTIATES_, Resource.ENTITY_TYPE_, RecordBuckets.BUCKET_ID_]
+
+    @classmethod
+    def expansion_pipeline(cls) -> list:
+        # the aggregation stages expanding each bucket in the records it contains, with the same fields as in the Record table
+        elements = {field: {"$arrayElemAt": [f"${field}", f"${RecordBuckets.POSITION_}"]} for field in RecordBuckets.ARRAY_FIELDS[1:]}
+        for field in RecordBuckets.OPTIONAL_ARRAY_FIELDS:
+            # as in the Record table, records with no sample (or counter) do not have the field
+            elements[field] = {"$ifNull": [{"$arrayElemAt": [f"${field}", f"${RecordBuckets.POSITION_}"]}, "$$REMOVE"]}
+        return [
+            {"$unwind": {"path": f"${Resource.IDENTIFIER_}", "includeArrayIndex": RecordBuckets.POSITION_}},
+            {"$set": elements},
+            {"$project": {RecordBuckets.POSITION_: 0, RecordBuckets.BUCKET_ID_: 0, "_id": 0}}
+        ]
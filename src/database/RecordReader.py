@@ -0,0 +1,106 @@
+from database.Database import Database
+from database.Operators import Operators
+from database.RecordBuckets import RecordBuckets
+from entities.Feature import Feature
+from entities.Record import Record
+from entities.Resource import Resource
+from enums.RecordLayouts import RecordLayouts
+from enums.TableNames import TableNames
+
+
+class RecordReader:
+    """
+    Read the records of the database in any layout: in the Record table (one document per record),
+    or in the RecordBucket table, whose buckets are expanded in the records they contain.
+    Readers (feature profiles, database statistics) thus get the same records, with the same fields, whatever the layout.
+    With expand_values, compact (categorical) values are also expanded in the category of the Feature they index.
+    """
+
+    FEATURE_ = "feature"  # the Feature of the record, joined to expand values
+
+    def __init__(self, database: Database, layout: str, expand_values: bool = False):
+        self.database = database
+        self.layout = layout
+        self.expand_values = expand_values
+        self.table_name = TableNames.RECORD_BUCKET if layout == RecordLayouts.BUCKETS else TableNames.RECORD
+
+    @classmethod
+    def value_expansion_pipeline(cls) -> list:
+        # the aggregation stages replacing each compact value, i.e., a number in a record of a Feature having categories,
+        # by the category at that index ($isNumber is false for booleans)
+        categories = {"$arrayElemAt": [f"${RecordReader.FEATURE_}.{Feature.CATEGORIES_}", 0]}
+        return [
+            Operators.lookup(join_table_name=TableNames.FEATURE, foreign_field=Resource.IDENTIFIER_, local_field=Record.INSTANTIATES_, lookup_field_name=RecordReader.FEATURE_),
+            {"$set": {Record.VALUE_: {"$cond": {"if": {"$and": [{"$isNumber": Record.VALUE__}, {"$isArray": categories}]},
+                                                "then": {"$arrayElemAt": [categories, Record.VALUE__]},
+                                                "else": Record.VALUE__}}}},
+            {"$project": {RecordReader.FEATURE_: 0}}
+        ]
+
+    def reads_table(self) -> bool:
+        # whether records are read as they are stored in the table
+        return self.layout != RecordLayouts.BUCKETS and not self.expand_values
+
+    def get_pipeline(self, pipeline: list) -> list:
+        """
+        Get the aggregation pipeline to run on the record table to run the given pipeline on records.
+        With buckets, the pipeline starts by expanding the buckets, after the conditions of the first $match on the shared fields of buckets.
+        With expanded values, values are expanded after the conditions of the first $match that are not on values.
+
+        :param pipeline: A list of aggregation stages, written for the Record table.
+        :return: A list of aggregation stages, for the table of the layout.
+        """
+        if self.reads_table():
+            return pipeline
+        conditions = {}
+        if len(pipeline) > 0 and "$match" in pipeline[0]:
+            conditions = pipeline[0]["$match"]
+            pipeline = pipeline[1:]
+        read_pipeline = []
+        if self.layout == RecordLayouts.BUCKETS:
+            # conditions on shared fields hold for all the records of a bucket, and may use the indexes of the bucket table
+            read_pipeline.extend(RecordReader.match_first(conditions=conditions, fields=RecordBuckets.SHARED_FIELDS))
+            conditions = {field: condition for field, condition in conditions.items() if field not in RecordBuckets.SHARED_FIELDS}
+            read_pipeline.extend(RecordBuckets.expansion_pipeline())
+        if self.expand_values:
+            # conditions on values (or on several fields, e.g., $or) apply to expanded values
+            stored_fields = [field for field in conditions if not field.startswith("$") and field.split(".")[0] != Record.VALUE_]
+            read_pipeline.extend(RecordReader.match_first(conditions=conditions, fields=stored_fields))
+            conditions = {field: condition for field, condition in conditions.items() if field not in stored_fields}
+            read_pipeline.extend(RecordReader.value_expansion_pipeline())
+        if len(conditions) > 0:
+            read_pipeline.append({"$match": conditions})
+        return read_pipeline + pipeline
+
+    @classmethod
+    def match_first(cls, conditions: dict, fields: list) -> list:
+        fields_conditions = {field: condition for field, condition in conditions.items() if field in fields}
+        return [{"$match": fields_conditions}] if len(fields_conditions) > 0 else []
+
+    def aggregate(self, pipeline: list):
+        return self.database.db[self.table_name].aggregate(self.get_pipeline(pipeline=pipeline))
+
+    def find(self, filter_dict: dict, projection: dict):
+        if self.reads_table():
+            return self.database.find_operation(table_name=TableNames.RECORD, filter_dict=filter_dict, projection=projection)
+        return self.aggregate(pipeline=[{"$match": filter_dict}] + ([{"$project": projection}] if len(projection) > 0 else []))
+
+    def find_distinct(self, key: str, filter_dict: dict) -> list:
+        if self.reads_table():
+            return self.database.find_distinct_operation(table_name=TableNames.RECORD, key=key, filter_dict=filter_dict)
+        return [element["_id"] for element in self.aggregate(pipeline=[{"$match": filter_dict}, {"$group": {"_id": f"${key}"}}])]
+
+    def count(self, filter_dict: dict) -> int:
+        if self.reads_table():
+            return self.database.count_documents(table_name=TableNames.RECORD, filter_dict=filter_dict)
+        return next(iter(self.aggregate(pipeline=[{"$match": filter_dict}, {"$count": "count"}])), {"count": 0})["count"]
+
+    def inverse_inner_join(self, name_table_2: str, foreign_field: str, local_field: str, lookup_name: str):
+        # the records whose local field does not reference any tuple of the second table
+        return self.aggregate(pipeline=Database.inverse_inner_join_operations(name_table_2=name_table_2, foreign_field=foreign_field,
+                                                                              local_field=local_field, lookup_name=lookup_name))
+
+    def create_expansion_view(self) -> None:
+        # the view of the records, in the Record format and with verbose values, for consumers that need them
+        self.database.create_on_demand_view(table_name=self.table_name, view_name=TableNames.VIEW_RECORDS_EXPANDED,
+                                            pipeline=RecordReader(database=self.database, layout=self.layout, expand_values=True).get_pipeline(pipeline=[]))
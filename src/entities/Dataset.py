@@ -1,8 +1,11 @@
 import dataclasses
+import hashlib
 import os.path
 import uuid
 from datetime import datetime
 
+from pandas import DataFrame
+
 from catalogue.DatasetProfile import DatasetProfile
 from constants.defaults import DATASET_GLOBAL_IDENTIFIER_PREFIX
 from database.Database import Database
@@ -22,10 +25,17 @@ class Dataset(Resource):
     version_notes: str
     license: str
     profile: DatasetProfile = dataclasses.field(init=False)
+    data_hash: str = None  # the SHA-256 of the data file
+    metadata_hash: str = None  # the SHA-256 of the metadata rows of the dataset, see compute_metadata_hash()
+    etl_version: str = None  # the version of the ETL which loaded the dataset, see Execution.compute_etl_version()
+    unchanged: bool = dataclasses.field(init=False, default=False)  # whether the dataset has already been loaded with the same hashes and ETL version
 
     # keys to be used when writing JSON or queries
     # those names have to exactly match the variables names declared in entity classes
     GID_ = "global_identifier"
+    DATA_HASH_ = "data_hash"
+    METADATA_HASH_ = "metadata_hash"
+    ETL_VERSION_ = "etl_version"
 
     # keys to be used when using an entity attribute as a query variable
     GID__ = f"${GID_}"
@@ -41,8 +51,16 @@ class Dataset(Resource):
                 # there was a dataset
                 self.global_identifier = result["global_identifier"]
                 log.info(f"existing dataset identifier: {self.global_identifier}")
-                self.version = str(int(result["version"]) + 1)  # increment the existing dataset version
-                self.last_update = datetime.now()  # the release should be only computed the first time the dataset is inserted
+                self.unchanged = (self.data_hash is not None and self.metadata_hash is not None and self.etl_version is not None
+                                  and [result.get(Dataset.DATA_HASH_), result.get(Dataset.METADATA_HASH_), result.get(Dataset.ETL_VERSION_)] == [self.data_hash, self.metadata_hash, self.etl_version])
+                if self.unchanged:
+                    # the same data and metadata have already been loaded by the same ETL version, thus this is the same version of the dataset
+                    self.version = result["version"]
+                    self.last_update = result["last_update"] if "last_update" in result else datetime.now()
+                else:
+                    self.version = str(int(result["version"]) + 1)  # increment the existing dataset version
+                    self.last_update = datetime.now()
+                self.release_date = result["release_date"] if "release_date" in result else None  # the release should be only computed the first time the dataset is inserted
                 self.version_notes = result["version_notes"] if "version_notes" in result else None
                 self.license = result["license"] if "license" in result else None
                 from_database = True
@@ -65,6 +83,11 @@ class Dataset(Resource):
         _, file_extension = os.path.splitext(docker_path)
         return file_extension[1:]  # remove the comma kept at the beginning of the extension
 
+    @classmethod
+    def compute_metadata_hash(cls, metadata: DataFrame) -> str:
+        # the metadata rows are hashed as they are read (strings), before any normalization
+        return hashlib.sha256(metadata.to_csv(index=False).encode("utf-8")).hexdigest()
+
     @classmethod
     def compute_global_identifier(cls) -> str:
         return DATASET_GLOBAL_IDENTIFIER_PREFIX + str(uuid.uuid4())
@@ -9,3 +9,6 @@ from enums.TableNames import TableNames
 class DiagnosisRecord(Record):
     diagnosis_counter: int
     entity_type: str = f"{Profile.DIAGNOSIS}{TableNames.RECORD}"
+
+    # keys to be used when writing JSON or queries
+    DIAGNOSIS_COUNTER_ = "diagnosis_counter"
@@ -4,6 +4,7 @@ from urllib.parse import quote
 
 from constants.defaults import SNOMED_OPERATORS_LIST, DEFAULT_ONTOLOGY_RESOURCE_LABEL, SNOMED_OPERATORS_STR
 from constants.methods import factory
+from database.OntologyLabelCache import OntologyLabelCache
 from enums.AccessTypes import AccessTypes
 from enums.Ontologies import Ontologies
 from statistics.QualityStatistics import QualityStatistics
@@ -43,10 +44,7 @@ class OntologyResource:
             # this is because an Ontology can have a single system
             # TODO Nelly: maybe there is a better way?
             self.system = self.system["url"]
-            self.code = self.code.replace("ORPHA:", "").replace("orpha:", "").replace("GO:", "").replace("go:", "")
-            self.code = process_spaces(input_string=self.code)
-            self.code = re.sub(r" *([" + SNOMED_OPERATORS_STR + "]+) *", r"\1", self.code)  # remove spaces around operators; r"\1" means: replace with first captured group
-            self.code = remove_operators_in_strings(input_string=self.code)  # for every label inside |, '' or "", we remove possible operators
+            self.code = OntologyResource.clean_full_code(full_code=self.code)
             code_elements = self.compute_elements(full_code=self.code)
             self.compute_code(code_elements=code_elements)
             if self.label is None:
@@ -54,7 +52,27 @@ class OntologyResource:
                 # if the query to the API does not work, we can still use the column name as the label of the OntoResource
                 self.compute_label(code_elements=code_elements, quality_stats=self.quality_stats)
 
-    def compute_elements(self, full_code: str) -> list:
+    @classmethod
+    def clean_full_code(cls, full_code: str) -> str:
+        full_code = full_code.replace("ORPHA:", "").replace("orpha:", "").replace("GO:", "").replace("go:", "")
+        full_code = process_spaces(input_string=full_code)
+        full_code = re.sub(r" *([" + SNOMED_OPERATORS_STR + "]+) *", r"\1", full_code)  # remove spaces around operators; r"\1" means: replace with first captured group
+        full_code = remove_operators_in_strings(input_string=full_code)  # for every label inside |, '' or "", we remove possible operators
+        return full_code
+
+    @classmethod
+    def get_single_codes(cls, full_code: str) -> list:
+        # the codes of a (post-coordinated) full code whose label is queried in compute_label()
+        code_elements = OntologyResource.compute_elements(full_code=OntologyResource.clean_full_code(full_code=full_code))
+        single_codes = []
+        for i in range(len(code_elements)):
+            element = code_elements[i]
+            if element not in SNOMED_OPERATORS_LIST and not element.startswith("\"") and not (i - 1 >= 0 and code_elements[i - 1] == "|"):
+                single_codes.append(element)
+        return single_codes
+
+    @classmethod
+    def compute_elements(cls, full_code: str) -> list:
         elements = []
         regex_elements = re.split(r"(?=["+SNOMED_OPERATORS_STR+"])|(?<=["+SNOMED_OPERATORS_STR+"])", full_code)
         # now self.elements may still contain spaces
@@ -99,7 +117,7 @@ class OntologyResource:
                     pass
                 else:
                     # this is a code, we get its label (name)
-                    resource_label = OntologyResource.get_resource_label_from_api(system=self.system, single_code=element, quality_stats=quality_stats)
+                    resource_label = OntologyResource.get_resource_label(system=self.system, single_code=element, quality_stats=quality_stats)
                     if resource_label is not None:
                         resource_label = process_spaces(input_string=resource_label)
                         resource_label = remove_specific_tokens(input_string=resource_label, tokens=["(property)", "- finding", "-finding", "(qualifier value)", "(observable entity)", "(social concept)", "(procedure)", "(assessment scale)", "- action", "-action", "- attribute", "-attribute"])  # useless and may break parsing (due to parenthesis and dash)
@@ -111,6 +129,41 @@ class OntologyResource:
                 if element != "|":
                     self.label += element
 
+    @classmethod
+    def get_resource_label(cls, system: str, single_code: str, quality_stats: QualityStatistics) -> str:
+        label_cache = OntologyLabelCache.current
+        if label_cache is None:
+            return OntologyResource.get_resource_label_from_api(system=system, single_code=single_code, quality_stats=quality_stats)
+        cached_label = label_cache.get_label(system=system, code=single_code)
+        quality_stats.count_label_cache_lookup(hit=cached_label is not None)
+        if cached_label is not None:
+            label, error = cached_label
+            if error is not None:
+                # this code has not been found by a previous query to the API
+                quality_stats.add_failed_api_call(system=system, code=single_code, api_error=error)
+                return DEFAULT_ONTOLOGY_RESOURCE_LABEL
+            return label
+        elif label_cache.offline:
+            quality_stats.add_failed_api_call(system=system, code=single_code, api_error=f"No cached label for resource {single_code} in offline mode.")
+            return DEFAULT_ONTOLOGY_RESOURCE_LABEL
+        else:
+            # we need the API error (if any), even though the given statistics are not recorded
+            api_stats = QualityStatistics(record_stats=True)
+            label = OntologyResource.get_resource_label_from_api(system=system, single_code=single_code, quality_stats=api_stats)
+            error = api_stats.failed_api_calls.get(f"{system}/{single_code}")
+            if error is None:
+                label_cache.add_label(system=system, code=single_code, label=label)
+            else:
+                if error == OntologyResource.get_not_found_error(single_code=single_code):
+                    # failed connections are not cached, so that they are retried in the next executions
+                    label_cache.add_not_found(system=system, code=single_code, error=error)
+                quality_stats.add_failed_api_call(system=system, code=single_code, api_error=error)
+            return label
+
+    @classmethod
+    def get_not_found_error(cls, single_code: str) -> str:
+        return f"Resource {single_code} not found."
+
     @classmethod
     def get_resource_label_from_api(cls, system: str, single_code: str, quality_stats: QualityStatistics) -> str:
         # column_name is to be used when the label of the OntologyResource could not be computed with any of the APIs
@@ -130,7 +183,7 @@ class OntologyResource:
                         else:
                             error = f"No label field for resource {single_code}."
                     elif response.status_code == 404 or response.status_code == 400:
-                        error = f"Resource {single_code} not found."
+                        error = OntologyResource.get_not_found_error(single_code=single_code)
                     else:
                         error = f"Failed connection to SNOMED-CT API."
                     quality_stats.add_failed_api_call(system=system, code=single_code, api_error=error)
@@ -148,7 +201,7 @@ class OntologyResource:
                             else:
                                 error = f"No field label for resource {single_code}"
                         else:
-                            error = f"Resource {single_code} not found."
+                            error = OntologyResource.get_not_found_error(single_code=single_code)
                     else:
                         error = f"Failed connection to LOINC API."
                     quality_stats.add_failed_api_call(system=system, code=single_code, api_error=error)
@@ -159,7 +212,7 @@ class OntologyResource:
                     if response is None:
                         error = f"Failed connection to PUBCHEM API."
                     elif response.status_code == 404 or response.status_code == 400:
-                        error = f"Resource {single_code} not found."
+                        error = OntologyResource.get_not_found_error(single_code=single_code)
                     elif response.status_code == 200:
                         data = parse_json_response(response)
                         if "InformationList" in data and "Information" in data["InformationList"] and len(data["InformationList"]["Information"]) > 0:
@@ -168,7 +221,7 @@ class OntologyResource:
                             else:
                                 error = f"No label field for resource {single_code}."
                         else:
-                            error = f"Resource {single_code} not found."
+                            error = OntologyResource.get_not_found_error(single_code=single_code)
                     else:
                         error = f"Failed connection to PUBCHEM API."
                     quality_stats.add_failed_api_call(system=system, code=single_code, api_error=error)
@@ -196,16 +249,16 @@ class OntologyResource:
                                 if one_class.getAttribute("rdf:about") == iri:
                                     expected_element = one_class
                             if expected_element is None:
-                                error = f"Resource {single_code} not found."
+                                error = OntologyResource.get_not_found_error(single_code=single_code)
                             else:
                                 if len(expected_element.getElementsByTagName("rdfs:label")) > 0:
                                     return expected_element.getElementsByTagName("rdfs:label")[0].childNodes[0].data
                                 else:
                                     error = f"No field label for resource {single_code}"
                         else:
-                            error = f"Resource {single_code} not found."
+                            error = OntologyResource.get_not_found_error(single_code=single_code)
                     elif response.status_code == 404 or response.status_code == 400:
-                        error = f"Resource {single_code} not found."
+                        error = OntologyResource.get_not_found_error(single_code=single_code)
                     else:
                         error = f"Failed connection to GSSO API."
                     quality_stats.add_failed_api_call(system=system, code=single_code, api_error=error)
@@ -216,7 +269,7 @@ class OntologyResource:
                     if response is None:
                         error = f"Failed connection to ORPHANET API."
                     elif response.status_code == 404 or response.status_code == 400:
-                        error = f"Resource {single_code} not found."
+                        error = OntologyResource.get_not_found_error(single_code=single_code)
                     elif response.status_code == 200:
                         data = parse_json_response(response)
                         if "Preferred term" in data:
@@ -243,7 +296,7 @@ class OntologyResource:
                         else:
                             error = f"No label field for resource {single_code}."
                     elif response.status_code == 404 or response.status_code == 400:
-                        error = f"Resource {single_code} not found."
+                        error = OntologyResource.get_not_found_error(single_code=single_code)
                     else:
                         error = f"Failed connection to GO API."
                     quality_stats.add_failed_api_call(system=system, code=single_code, api_error=error)
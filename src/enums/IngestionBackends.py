@@ -0,0 +1,7 @@
+from enums.EnumAsClass import EnumAsClass
+
+
+class IngestionBackends(EnumAsClass):
+    # how data files are read and normalized in the Extract step
+    PANDAS = "pandas"  # one Python str per cell, normalized with a Python function per cell
+    ARROW = "arrow"  # Arrow string columns (read with pyarrow), normalized with Arrow compute kernels
@@ -1,6 +1,10 @@
 from typing import Any
 
 import inflection
+import numpy as np
+import pandas as pd
+import pyarrow
+import pyarrow.compute
 
 from constants.defaults import NAN_VALUES, DEFAULT_NAN_VALUE
 from enums.EnumAsClass import EnumAsClass
@@ -40,3 +44,55 @@ class MetadataColumns(EnumAsClass):
             else:
                 # default case
                 return normalized_value
+
+    @classmethod
+    def normalize_values(cls, values: pd.Series) -> pd.Series:
+        """
+        Normalize a column of values as normalize_value() does on each value, with vectorized string operations.
+        Columns usually have few distinct values (e.g., categories), thus each distinct value is normalized once, then mapped back to the cells.
+        :param values: A Series of values.
+        :return: A Series of (Python) objects, being the normalized values.
+        """
+        codes, unique_values = pd.factorize(values, use_na_sentinel=False)
+        unique_values = pd.Series(unique_values, dtype=object)
+        is_str = np.fromiter((isinstance(value, str) for value in unique_values), dtype=bool, count=len(unique_values))
+        normalized_values = pd.Series(np.empty(len(unique_values), dtype=object))
+        if is_str.any():
+            # str.split() and str.lower() are the ones of Python str, as in process_spaces() and normalize_value()
+            str_values = unique_values[is_str].str.split().str.join(" ").str.lower()
+            str_values[str_values.isin([value for value in NAN_VALUES if isinstance(value, str)])] = DEFAULT_NAN_VALUE
+            normalized_values[is_str] = str_values
+        if not is_str.all():
+            # e.g., generated ids or NaN values, which are normalized as their str representation
+            normalized_values[~is_str] = unique_values[~is_str].apply(lambda x: MetadataColumns.normalize_value(column_value=x))
+        return pd.Series(normalized_values.to_numpy()[codes], index=values.index, name=values.name, dtype=object)
+
+    @classmethod
+    def normalize_values_with_arrow(cls, values: pd.Series) -> pd.Series:
+        """
+        Normalize a column of string values as normalize_value() does on each value, with Arrow compute kernels.
+        The kernels handle ASCII values only (Arrow and Python disagree on some Unicode whitespaces and lowercasings),
+        thus the other values are normalized with normalize_value(), which gives exactly the same values in all cases.
+        :param values: A Series of str values (or of Arrow strings).
+        :return: A Series of (Python) objects, being the normalized values.
+        """
+        if not isinstance(values.dtype, pd.ArrowDtype):
+            if pd.api.types.infer_dtype(values, skipna=False) != "string":
+                return MetadataColumns.normalize_values(values=values)
+            values = values.astype(pd.ArrowDtype(pyarrow.string()))
+        original_values = values.array.__arrow_array__()
+        if isinstance(original_values, pyarrow.ChunkedArray):
+            original_values = original_values.combine_chunks()
+        # as in normalize_values(), each distinct value is normalized once
+        encoded_values = pyarrow.compute.dictionary_encode(original_values, null_encoding="encode")
+        original_values = encoded_values.dictionary
+        # the whitespaces of str.split() within ASCII characters, collapsed and trimmed as with process_spaces()
+        normalized_values = pyarrow.compute.replace_substring_regex(original_values, pattern=r"[\t\n\x0b\x0c\r\x1c-\x1f ]+", replacement=" ")
+        normalized_values = pyarrow.compute.ascii_lower(pyarrow.compute.utf8_trim(normalized_values, characters=" "))
+        is_nan = pyarrow.compute.fill_null(pyarrow.compute.is_in(normalized_values, value_set=pyarrow.array([value for value in NAN_VALUES if isinstance(value, str)])), False)
+        is_not_ascii = pyarrow.compute.invert(pyarrow.compute.fill_null(pyarrow.compute.string_is_ascii(original_values), False))
+        result = normalized_values.to_numpy(zero_copy_only=False)
+        result[is_nan.to_numpy(zero_copy_only=False)] = DEFAULT_NAN_VALUE
+        for i in np.flatnonzero(is_not_ascii.to_numpy(zero_copy_only=False)):
+            result[i] = MetadataColumns.normalize_value(column_value=original_values[i].as_py())
+        return pd.Series(result[encoded_values.indices.to_numpy()], index=values.index, name=values.name, dtype=object)
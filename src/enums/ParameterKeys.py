@@ -15,3 +15,26 @@ class ParameterKeys(EnumAsClass):
     RECORD_CARRIER_PATIENT = "RECORD_CARRIER_PATIENTS"
     PATIENT_ID_COLUMN = "PATIENT_ID"
     SAMPLE_ID_COLUMN = "SAMPLE_ID"
+    DATA_CHUNK_SIZE = "DATA_CHUNK_SIZE"
+    INGESTION_BACKEND = "INGESTION_BACKEND"
+    VALUE_CACHE_SIZE = "VALUE_CACHE_SIZE"
+    RECORD_LAYOUT = "RECORD_LAYOUT"
+    VALUE_ENCODING = "VALUE_ENCODING"
+    MAX_MEMORY_MB = "ETL_MAX_MEMORY_MB"
+    DIRECT_LOAD = "DIRECT_LOAD"
+    AUDIT_FILES = "AUDIT_FILES"
+    NB_LOADERS = "NB_LOADERS"
+    LOAD_QUEUE_SIZE = "LOAD_QUEUE_SIZE"
+    NB_WORKERS = "NB_WORKERS"
+    NB_PARALLEL_DATASETS = "NB_PARALLEL_DATASETS"
+    FAST_INITIAL_LOAD = "FAST_INITIAL_LOAD"
+    DIFF_LOAD = "DIFF_LOAD"
+    DIFF_LOAD_DELETE = "DIFF_LOAD_DELETE"
+    SKIP_UNCHANGED_DATASETS = "SKIP_UNCHANGED_DATASETS"
+    ONTOLOGY_CACHE_TTL = "ONTOLOGY_CACHE_TTL"
+    ONTOLOGY_OFFLINE = "ONTOLOGY_OFFLINE"
+    ONTOLOGY_NB_THREADS = "ONTOLOGY_NB_THREADS"
+    ONTOLOGY_MAX_PER_API = "ONTOLOGY_MAX_PER_API"
+    PROFILE_ENGINE = "PROFILE_ENGINE"
+    PROFILE_APPROXIMATE = "PROFILE_APPROXIMATE"
+    PROFILE_RANK_ERROR = "PROFILE_RANK_ERROR"
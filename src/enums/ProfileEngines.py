@@ -0,0 +1,7 @@
+from enums.EnumAsClass import EnumAsClass
+
+
+class ProfileEngines(EnumAsClass):
+    # how FeatureProfiles are computed
+    SINGLE_PASS = "single_pass"  # a single read of the Record table, with the statistics computed with NumPy
+    AGGREGATIONS = "aggregations"  # one MongoDB aggregation pipeline per statistic
@@ -0,0 +1,7 @@
+from enums.EnumAsClass import EnumAsClass
+
+
+class RecordLayouts(EnumAsClass):
+    # how records are stored in the database
+    DOCUMENTS = "documents"  # one document per record (i.e., per non-empty cell), in the Record table
+    BUCKETS = "buckets"  # one document per bucket of records of a (dataset, feature) pair, with parallel arrays, in the RecordBucket table
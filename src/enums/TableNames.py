@@ -7,8 +7,7 @@ class TableNames(EnumAsClass):
     PATIENT = "Patient"
     FEATURE = "Feature"
     RECORD = "Record"
-    TOP10_FEATURES = "TMP_Top10Features"
-    PAIRS_FEATURES = "TMP_PairsFeatures"
+    RECORD_BUCKET = "RecordBucket"
     COUNTS_PATIENTS = "TMP_CountsPatients"
     COUNTS_SAMPLES = "TMP_CountsSamples"
     COUNTS_FEATURES = "TMP_CountsFeatures"
@@ -31,7 +30,9 @@ class TableNames(EnumAsClass):
     STATS_QUALITY = "QualityStatistics"
     TEST = "Test"
     DATASET = "Dataset"
+    COUNTER = "Counter"
     VIEW_FEATURES_DATASET = "ViewFeaturesDatasets"
+    VIEW_RECORDS_EXPANDED = "ViewRecordsExpanded"
 
     # IMPORTANT NOTE:
     # do NOT import Database for type hinting in methods defined here
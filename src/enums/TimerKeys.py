@@ -6,6 +6,16 @@ class TimerKeys(EnumAsClass):
     EXTRACT_TIME = "extract_time"
     TRANSFORM_TIME = "transform_time"
     LOAD_TIME = "load_time"
+    # pipelined load: time spent by loader threads loading (busy) or waiting for batches (idle),
+    # by the Transform step waiting for room in the queue (blocked), and by the ETL waiting for the queue to be drained
+    LOAD_BUSY_TIME = "load_busy_time"
+    LOAD_IDLE_TIME = "load_idle_time"
+    TRANSFORM_BLOCKED_TIME = "transform_blocked_time"
+    WAIT_LOADED_TIME = "wait_loaded_time"
+    # parallel datasets: time spent by the ETL waiting for a dataset to be extracted and transformed by a worker
+    WAIT_TRANSFORMED_TIME = "wait_transformed_time"
+    # concurrent resolution of the labels of the ontology codes of the metadata, before the Extract step
+    ONTOLOGY_RESOLUTION_TIME = "ontology_resolution_time"
     STATISTICS_TIME = "statistics_time"
     REPORT_TIME = "report_time"
     INSERT_DATASETS = "insert_datasets"
@@ -48,6 +58,9 @@ class TimerKeys(EnumAsClass):
 
     # # Fairification
     VALUE_FAIRIFICATION = "value_fairification"
+    # hit rates of the value caches (per column), for normalized values (Extract) and fairified values (Transform)
+    NORMALIZATION_CACHE = "normalization_cache"
+    FAIRIFICATION_CACHE = "fairification_cache"
 
     # Writing record resources
     GET_RESOURCE_JSON_FILE = "get_resource_json_file"
@@ -0,0 +1,7 @@
+from enums.EnumAsClass import EnumAsClass
+
+
+class ValueEncodings(EnumAsClass):
+    # how record values are stored in the database
+    VERBOSE = "verbose"  # categorical values are ontology resources (system, code and label)
+    COMPACT = "compact"  # categorical values are the index of their category in the categories of the Feature
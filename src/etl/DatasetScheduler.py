@@ -0,0 +1,171 @@
+import copy
+import locale
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.managers import BaseManager
+
+from pandas import DataFrame
+
+from database.Database import Database
+from database.Execution import Execution
+from database.OntologyLabelCache import OntologyLabelCache
+from entities.Dataset import Dataset
+from enums.TimerKeys import TimerKeys
+from etl.Extract import Extract
+from etl.PatientIdMapping import PatientIdMapping
+from etl.Transform import Transform
+from statistics.QualityStatistics import QualityStatistics
+from statistics.TimeStatistics import TimeStatistics
+from utils.setup_logger import log
+
+
+class PatientIdManager(BaseManager):
+    # the manager process hosting the PatientIdMapping shared by the workers
+    pass
+
+
+PatientIdManager.register("PatientIdMapping", PatientIdMapping)
+
+
+class DatasetScheduler:
+    """
+    Run the Extract and Transform steps of several datasets at once in worker processes (one dataset, with all its profiles, per job),
+    while the main process loads the transformed datasets in the order of the ETL.
+    Workers create Features and Patients in the database, each with its own connection:
+    - identifiers are reserved in the database counter, thus they are never given twice;
+    - Features are upserted by name and never replaced, thus the first worker creating a Feature gives its identifier (see Database.create_update_stmt);
+    - anonymized patient IDs are allocated in a PatientIdMapping shared by the workers, which the main process writes once all datasets are transformed.
+    Records are written in the working directory by the workers and loaded by the main process only,
+    thus the unique indexes of records (as well as the fast initial and diff loads) are handled as in a sequential run.
+    """
+
+    # in worker processes, the database connection and the shared mapping of patient IDs, see init_worker()
+    database = None
+    patient_ids_mapping = None
+
+    def __init__(self, execution: Execution, nb_workers: int):
+        self.execution = execution
+        self.nb_workers = nb_workers
+        # workers neither drop the database nor load records, which are written in files and loaded by the main process
+        self.worker_execution = copy.copy(execution)
+        self.worker_execution.db_drop = False
+        self.worker_execution.direct_load = False
+        self.jobs = []  # the (filepath, metadata, profiles, dataset, file hash) of the datasets to transform, in the order of the ETL
+        self.futures = []  # the jobs that have been submitted to the workers, but not taken by the ETL yet
+        self.executor = None
+        self.manager = None
+        self.shared_patient_ids_mapping = None
+
+    def add_job(self, filepath: str, metadata: DataFrame, profiles: list, dataset: Dataset, file_hash: str | None = None) -> None:
+        # the Dataset references the database, thus workers receive a copy without it
+        worker_dataset = copy.copy(dataset)
+        worker_dataset.database = None
+        self.jobs.append((filepath, metadata, profiles, worker_dataset, file_hash))
+
+    def start(self) -> None:
+        log.info(f"Extracting and transforming {len(self.jobs)} datasets with {self.nb_workers} workers")
+        # we spawn workers (instead of forking) because the ETL may run loader threads
+        mp_context = multiprocessing.get_context("spawn")
+        self.manager = PatientIdManager(ctx=mp_context)
+        self.manager.start()
+        self.shared_patient_ids_mapping = self.manager.PatientIdMapping(Transform.read_patient_id_mapping(filepath=self.execution.anonymized_patient_ids_filepath))
+        self.executor = ProcessPoolExecutor(max_workers=self.nb_workers, mp_context=mp_context, initializer=DatasetScheduler.init_worker,
+                                            initargs=(locale.setlocale(locale.LC_NUMERIC), OntologyLabelCache.current, self.worker_execution, self.shared_patient_ids_mapping))
+        self.jobs.reverse()  # we pop jobs from the end
+        # at most one transformed dataset per worker is waiting to be loaded, in addition to the ones being transformed
+        for _ in range(self.nb_workers):
+            self.submit_next_job()
+
+    def submit_next_job(self) -> None:
+        if len(self.jobs) > 0:
+            filepath, metadata, profiles, dataset, file_hash = self.jobs.pop()
+            execution = copy.copy(self.worker_execution)
+            execution.current_filepath = filepath
+            execution.current_file_hash = file_hash
+            execution.current_dataset_gid = dataset.global_identifier
+            future = self.executor.submit(DatasetScheduler.run_dataset, metadata, profiles, execution, dataset, QualityStatistics(record_stats=True))
+            self.futures.append((filepath, future))
+
+    def get_dataset(self, filepath: str, quality_stats: QualityStatistics, time_stats: TimeStatistics, dataset: str) -> dict:
+        """
+        Wait for the given dataset to be transformed by a worker, and record its statistics.
+        :return: A dict <profile, whether the profile has been transformed>, the records of the transformed profiles being ready to be loaded
+        (from the files of get_file_key()) with the execution of the workers.
+        """
+        expected_filepath, future = self.futures.pop(0)
+        if expected_filepath != filepath:
+            raise ValueError(f"The transformed dataset {expected_filepath} does not correspond to the current one ({filepath}).")
+        self.submit_next_job()
+        time_stats.start(dataset=dataset, key=TimerKeys.WAIT_TRANSFORMED_TIME)
+        results, worker_quality_stats = future.result()
+        time_stats.increment(dataset=dataset, key=TimerKeys.WAIT_TRANSFORMED_TIME)
+        quality_stats.merge(other=worker_quality_stats)
+        transformed_profiles = {}
+        for profile, extract_time, transform_time, normalization_cache, fairification_cache, nb_spilled_arrays in results:
+            time_stats.add(dataset=dataset, key=TimerKeys.EXTRACT_TIME, value=extract_time)
+            transformed_profiles[profile] = transform_time is not None
+            if transform_time is not None:
+                time_stats.add(dataset=dataset, key=TimerKeys.TRANSFORM_TIME, value=transform_time)
+                if nb_spilled_arrays > 0:
+                    log.info(f"{nb_spilled_arrays} arrays have been spilled to disk to stay within the memory budget")
+                normalization_cache.report(time_stats=time_stats, dataset=dataset, key=TimerKeys.NORMALIZATION_CACHE)
+                fairification_cache.report(time_stats=time_stats, dataset=dataset, key=TimerKeys.FAIRIFICATION_CACHE)
+        return transformed_profiles
+
+    def stop(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        if self.manager is not None:
+            # the patients created by the workers are kept for the next runs
+            Transform.save_patient_id_mapping(patient_ids_mapping=self.shared_patient_ids_mapping.get_mapping(), filepath=self.execution.anonymized_patient_ids_filepath)
+            self.manager.shutdown()
+            self.manager = None
+        self.futures.clear()
+        self.jobs.clear()
+
+    @classmethod
+    def get_file_key(cls, dataset_id: int, profile: str) -> str:
+        # workers write the files of each profile of a dataset separately, because the records of each profile are loaded with their own unique variables
+        return f"{dataset_id}{profile}"
+
+    @classmethod
+    def init_worker(cls, locale_name: str, label_cache: OntologyLabelCache, execution: Execution, patient_ids_mapping: PatientIdMapping) -> None:
+        # executed once in each worker process
+        locale.setlocale(category=locale.LC_NUMERIC, locale=locale_name)
+        OntologyLabelCache.current = label_cache
+        DatasetScheduler.database = Database(execution=execution)
+        DatasetScheduler.patient_ids_mapping = patient_ids_mapping
+
+    @classmethod
+    def run_dataset(cls, metadata: DataFrame, profiles: list, execution: Execution, dataset: Dataset,
+                    quality_stats: QualityStatistics) -> tuple[list[tuple], QualityStatistics]:
+        # executed in a worker process: the Extract and Transform steps of each profile of the dataset,
+        # the (profile, extract time, transform time, normalization cache, fairification cache, nb spilled arrays) of each profile being sent back to the main process
+        results = []
+        for count_profiles, profile in enumerate(profiles, start=1):
+            start_time = time.time()
+            extract = Extract(metadata=metadata, profile=profile, database=DatasetScheduler.database, execution=execution, quality_stats=quality_stats)
+            extract.run()
+            extract_time = time.time() - start_time
+            extract.value_cache.caches.clear()  # the cached values are not worth sending to the main process
+            if extract.metadata is None:
+                # the dataset has no column for this profile
+                results.append((profile, extract_time, None, None, None, 0))
+                continue
+            start_time = time.time()
+            transform = Transform(database=DatasetScheduler.database, execution=execution, data=extract.data, metadata=extract.metadata,
+                                  mapping_column_to_categorical_value=extract.mapping_column_to_categorical_value,
+                                  mapping_column_to_unit=extract.mapping_column_to_unit,
+                                  mapping_column_to_domain=extract.mapping_column_to_domain,
+                                  mapping_column_to_type=None,  # this will be computed during the Transform step
+                                  profile=profile, load_patients=count_profiles == 1,
+                                  dataset_id=DatasetScheduler.get_file_key(dataset_id=dataset.identifier, profile=profile), dataset_key=dataset,
+                                  quality_stats=quality_stats, load_pipeline=None,
+                                  data_chunks=extract.iterate_data_chunks if extract.streams_data else None)
+            transform.shared_patient_ids_mapping = DatasetScheduler.patient_ids_mapping
+            transform.run()
+            transform.value_cache.caches.clear()
+            results.append((profile, extract_time, time.time() - start_time, extract.value_cache, transform.value_cache, transform.memory_budget.nb_spilled_arrays))
+        return results, quality_stats
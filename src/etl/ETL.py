@@ -15,14 +15,19 @@ from enums.MetadataColumns import MetadataColumns
 from enums.Profile import Profile
 from enums.TableNames import TableNames
 from enums.TimerKeys import TimerKeys
+from enums.ValueEncodings import ValueEncodings
+from etl.DatasetScheduler import DatasetScheduler
 from etl.Extract import Extract
 from etl.Load import Load
+from etl.LoadPipeline import LoadPipeline
+from etl.MemoryBudget import MemoryBudget
+from etl.OntologyResolver import OntologyResolver
 from etl.Reporting import Reporting
 from etl.Transform import Transform
 from statistics.DatabaseStatistics import DatabaseStatistics
 from statistics.QualityStatistics import QualityStatistics
 from statistics.TimeStatistics import TimeStatistics
-from utils.file_utils import read_tabular_file_as_string, write_in_file
+from utils.file_utils import compute_file_hash, read_tabular_file_as_string, write_in_file
 from utils.setup_logger import log
 
 
@@ -43,6 +48,8 @@ class ETL:
         self.load = None
         self.reporting = None
         self.profile_computation = None
+        self.load_pipeline = None
+        self.dataset_scheduler = None
 
     def run(self) -> None:
         time_stats = TimeStatistics(record_stats=True)
@@ -57,61 +64,124 @@ class ETL:
         counter = Counter()
         counter.set_with_database(database=self.database)
 
+        if self.execution.nb_loaders > 0 and self.execution.nb_parallel_datasets <= 1:
+            # records are loaded by loader threads while the Transform step creates the next ones
+            # and while the Extract step reads the next profile
+            # (when datasets are transformed in worker processes, the main process only loads them, see DatasetScheduler)
+            self.load_pipeline = LoadPipeline(database=self.database, nb_loaders=self.execution.nb_loaders,
+                                              queue_size=self.execution.load_queue_size, time_stats=time_stats)
+            self.load_pipeline.start()
+
         all_metadata = read_tabular_file_as_string(self.execution.metadata_filepath)  # keep all metadata as str
-        first = True
+        if self.execution.ontology_nb_threads > 0:
+            # the labels of the ontology codes of the metadata are resolved concurrently, before the Extract and Transform steps
+            # create the OntologyResources (in the main process or in worker processes, which receive the resolved labels)
+            time_stats.start(dataset=None, key=TimerKeys.ONTOLOGY_RESOLUTION_TIME)
+            ontology_resolver = OntologyResolver(nb_threads=self.execution.ontology_nb_threads, max_per_api=self.execution.ontology_max_per_api)
+            ontology_resolver.add_metadata(metadata=all_metadata[all_metadata[MetadataColumns.DATASET_NAME].isin(all_filenames)])
+            ontology_resolver.run()
+            time_stats.increment(dataset=None, key=TimerKeys.ONTOLOGY_RESOLUTION_TIME)
+        # each data file is hashed once (if needed): to skip the datasets already loaded with the same data, metadata and ETL version,
+        # and to key the cache of the parsed Excel sheets
+        etl_version = self.execution.compute_etl_version() if self.execution.skip_unchanged_datasets else None
+        data_hashes = {}  # <filename, data hash>
+        inputs_hashes = {}  # <filename, (data hash, metadata hash)>, only to skip unchanged datasets
         for one_filename in all_filenames:
-            if one_filename != "":
-                log.info(one_filename)
-
-                # set the current filepath
-                self.execution.current_filepath = os.path.join(DOCKER_FOLDER_DATA, one_filename)
-                log.info(self.execution.current_filepath)
-
-                # create a new Dataset instance
-                counter.set_with_database(database=self.database)
-                dataset = Dataset(identifier=NO_ID, database=self.database, docker_path=self.execution.current_filepath, version_notes=None, license=None, counter=counter)
-                self.datasets.append(dataset)
-                self.execution.current_dataset_gid = dataset.global_identifier
-
-                # create the hospital only once
-                if first:
-                    self.create_hospital(counter=counter, dataset_id=dataset.identifier)
-                    first = False
-
-                # get metadata of file
-                log.info(one_filename)
-                if one_filename not in all_metadata[MetadataColumns.DATASET_NAME].unique():
-                    raise ValueError(f"The current dataset ({one_filename}) is not described in the provided metadata file.")
-                else:
-                    log.info(f"--- Extract metadata for file '{self.execution.current_filepath}', with number {self.execution.current_file_number}")
+            if one_filename != "" and one_filename in all_metadata[MetadataColumns.DATASET_NAME].unique():
+                if self.execution.skip_unchanged_datasets or one_filename.endswith(".xls") or one_filename.endswith(".xlsx"):
+                    data_hashes[one_filename] = compute_file_hash(filepath=os.path.join(DOCKER_FOLDER_DATA, one_filename))
+                if self.execution.skip_unchanged_datasets:
+                    metadata = pd.DataFrame(all_metadata[all_metadata[MetadataColumns.DATASET_NAME].values == one_filename])
+                    inputs_hashes[one_filename] = (data_hashes[one_filename], Dataset.compute_metadata_hash(metadata=metadata))
+        unchanged_filenames = self.find_unchanged_datasets(inputs_hashes=inputs_hashes, etl_version=etl_version) if self.execution.skip_unchanged_datasets else set()
+        # indexes are computed with the last profile of the last dataset that is not skipped
+        loaded_filenames = [one_filename for one_filename in all_filenames if one_filename != "" and one_filename not in unchanged_filenames]
+        # the Dataset instances (and the hospital, with the first one) are created before the Extract and Transform steps,
+        # which may run in worker processes for several datasets at once
+        dataset_filenames = [one_filename for one_filename in all_filenames if one_filename != ""]
+        for one_filename in dataset_filenames:
+            counter.set_with_database(database=self.database)
+            data_hash, metadata_hash = inputs_hashes.get(one_filename, (None, None))
+            dataset = Dataset(identifier=NO_ID, database=self.database, docker_path=os.path.join(DOCKER_FOLDER_DATA, one_filename), version_notes=None, license=None, counter=counter,
+                              data_hash=data_hash, metadata_hash=metadata_hash, etl_version=etl_version)
+            self.datasets.append(dataset)
+            # create the hospital only once
+            if len(self.datasets) == 1:
+                self.create_hospital(counter=counter, dataset_id=dataset.identifier)
+        if self.execution.nb_parallel_datasets > 1:
+            # the next datasets are extracted and transformed in worker processes while the current one is loaded
+            self.dataset_scheduler = DatasetScheduler(execution=self.execution, nb_workers=self.execution.nb_parallel_datasets)
+            for one_filename, dataset in zip(dataset_filenames, self.datasets):
+                if one_filename in all_metadata[MetadataColumns.DATASET_NAME].unique() and one_filename not in unchanged_filenames:
                     metadata = pd.DataFrame(all_metadata[all_metadata[MetadataColumns.DATASET_NAME].values == one_filename])
+                    self.dataset_scheduler.add_job(filepath=dataset.docker_path, metadata=metadata, profiles=[Profile.normalize(profile) for profile in pd.unique(metadata[MetadataColumns.PROFILE])],
+                                                   dataset=dataset, file_hash=data_hashes.get(one_filename))
+            self.dataset_scheduler.start()
+        for one_filename, dataset in zip(dataset_filenames, self.datasets):
+            log.info(one_filename)
+
+            # set the current filepath
+            self.execution.current_filepath = dataset.docker_path
+            self.execution.current_file_hash = data_hashes.get(one_filename)
+            log.info(self.execution.current_filepath)
+            self.execution.current_dataset_gid = dataset.global_identifier
+
+            if one_filename in unchanged_filenames:
+                # its records, patients and features are already in the database, as well as its profiles
+                log.info(f"--- Skipping file '{self.execution.current_filepath}' because it has not changed since its last load (version {dataset.version})")
+                self.execution.current_file_number += 1
+                continue
 
-                    log.info(f"--- Starting to transform file '{self.execution.current_filepath}', with number {self.execution.current_file_number}")
-                    # we have to iterate over all profiles associated to the dataset because we cannot do it in the Extract
-                    # because the transform and load have to be applied on each pair (ds, profile)
-                    # the Extract class will take care of setting the profile if it is associated to the current dataset
-                    unique_profiles_of_current_dataset = pd.unique(metadata[MetadataColumns.PROFILE])
-                    count_profiles = 0
-                    for profile in unique_profiles_of_current_dataset:
-                        count_profiles += 1
-                        profile = Profile.normalize(profile)
-                        log.info(f"using profile {profile}")
-
-                        # check whether this is the last profile of the last dataset
-                        # to know whether we should compute indexes
-                        if dataset.identifier == len(all_filenames) and count_profiles == len(unique_profiles_of_current_dataset):
-                            compute_indexes = True
+            # get metadata of file
+            log.info(one_filename)
+            if one_filename not in all_metadata[MetadataColumns.DATASET_NAME].unique():
+                raise ValueError(f"The current dataset ({one_filename}) is not described in the provided metadata file.")
+            else:
+                log.info(f"--- Extract metadata for file '{self.execution.current_filepath}', with number {self.execution.current_file_number}")
+                metadata = pd.DataFrame(all_metadata[all_metadata[MetadataColumns.DATASET_NAME].values == one_filename])
 
+                log.info(f"--- Starting to transform file '{self.execution.current_filepath}', with number {self.execution.current_file_number}")
+                if self.dataset_scheduler is not None:
+                    # all the profiles of the dataset are extracted and transformed by a worker
+                    transformed_profiles = self.dataset_scheduler.get_dataset(filepath=self.execution.current_filepath, quality_stats=quality_stats,
+                                                                              time_stats=time_stats, dataset=dataset.global_identifier)
+                # we have to iterate over all profiles associated to the dataset because we cannot do it in the Extract
+                # because the transform and load have to be applied on each pair (ds, profile)
+                # the Extract class will take care of setting the profile if it is associated to the current dataset
+                unique_profiles_of_current_dataset = pd.unique(metadata[MetadataColumns.PROFILE])
+                count_profiles = 0
+                for profile in unique_profiles_of_current_dataset:
+                    count_profiles += 1
+                    profile = Profile.normalize(profile)
+                    log.info(f"using profile {profile}")
+
+                    # check whether this is the last profile of the last dataset
+                    # to know whether we should compute indexes
+                    if one_filename == loaded_filenames[-1] and count_profiles == len(unique_profiles_of_current_dataset):
+                        compute_indexes = True
+
+                    if self.dataset_scheduler is not None:
+                        # the worker has written the records of the profile in files, which are loaded with its execution (without direct load)
+                        transformed = transformed_profiles[profile]
+                        load_execution = self.dataset_scheduler.worker_execution
+                        file_key = DatasetScheduler.get_file_key(dataset_id=dataset.identifier, profile=profile)
+                    else:
                         # EXTRACT
                         time_stats.start(dataset=dataset.global_identifier, key=TimerKeys.EXTRACT_TIME)
+                        MemoryBudget.reset_peak_rss()
                         self.extract = Extract(metadata=metadata, profile=profile, database=self.database, execution=self.execution, quality_stats=quality_stats)
                         self.extract.run()
                         time_stats.increment(dataset=dataset.global_identifier, key=TimerKeys.EXTRACT_TIME)
+                        time_stats.record_peak_rss(peak_rss_mb=MemoryBudget.get_peak_rss_mb(), dataset=dataset.global_identifier, key=TimerKeys.EXTRACT_TIME)
 
-                        if self.extract.metadata is not None:
+                        transformed = self.extract.metadata is not None
+                        load_execution = self.execution
+                        file_key = dataset.identifier
+                        if transformed:
                             log.info(f"running transform on dataset {self.execution.current_filepath} with profile {profile}")
                             # TRANSFORM
                             time_stats.start(dataset=dataset.global_identifier, key=TimerKeys.TRANSFORM_TIME)
+                            MemoryBudget.reset_peak_rss()
                             self.transform = Transform(database=self.database, execution=self.execution, data=self.extract.data,
                                                        metadata=self.extract.metadata,
                                                        mapping_column_to_categorical_value=self.extract.mapping_column_to_categorical_value,
@@ -120,20 +190,64 @@ class ETL:
                                                        mapping_column_to_type=None,  # this will be computed during the Transform step
                                                        profile=profile, load_patients=count_profiles == 1,
                                                        dataset_id=dataset.identifier, dataset_key=dataset,
-                                                       quality_stats=quality_stats)
+                                                       quality_stats=quality_stats, load_pipeline=self.load_pipeline,
+                                                       data_chunks=self.extract.iterate_data_chunks if self.extract.streams_data else None)
                             self.transform.run()
                             time_stats.increment(dataset=dataset.global_identifier, key=TimerKeys.TRANSFORM_TIME)
+                            time_stats.record_peak_rss(peak_rss_mb=MemoryBudget.get_peak_rss_mb(), dataset=dataset.global_identifier, key=TimerKeys.TRANSFORM_TIME)
+                            if self.transform.memory_budget.nb_spilled_arrays > 0:
+                                log.info(f"{self.transform.memory_budget.nb_spilled_arrays} arrays have been spilled to disk to stay within the memory budget")
+                            # streamed data is normalized during the Transform step, thus both hit rates are known now
+                            self.extract.value_cache.report(time_stats=time_stats, dataset=dataset.global_identifier, key=TimerKeys.NORMALIZATION_CACHE)
+                            self.transform.value_cache.report(time_stats=time_stats, dataset=dataset.global_identifier, key=TimerKeys.FAIRIFICATION_CACHE)
 
-                            # LOAD
-                            time_stats.start(dataset=dataset.global_identifier, key=TimerKeys.LOAD_TIME)
-                            # log.info(f"{one_filename} -> {compute_indexes}")
-                            # create indexes only if this is the last file (otherwise, we would create useless intermediate indexes)
-                            self.load = Load(database=self.database, execution=self.execution, create_indexes=compute_indexes,
-                                             dataset_id=dataset.identifier, profile=profile,
-                                             quality_stats=quality_stats)
-                            self.load.run()
-                            time_stats.increment(dataset=dataset.global_identifier, key=TimerKeys.LOAD_TIME)
-                self.execution.current_file_number += 1
+                    if transformed:
+                        # LOAD
+                        if compute_indexes:
+                            # indexes are computed once all the records are in the database
+                            self.wait_until_loaded(time_stats=time_stats, dataset=dataset.global_identifier)
+                        time_stats.start(dataset=dataset.global_identifier, key=TimerKeys.LOAD_TIME)
+                        MemoryBudget.reset_peak_rss()
+                        # log.info(f"{one_filename} -> {compute_indexes}")
+                        # create indexes only if this is the last file (otherwise, we would create useless intermediate indexes)
+                        self.load = Load(database=self.database, execution=load_execution, create_indexes=compute_indexes,
+                                         dataset_id=file_key, profile=profile,
+                                         quality_stats=quality_stats)
+                        self.load.run()
+                        time_stats.increment(dataset=dataset.global_identifier, key=TimerKeys.LOAD_TIME)
+                        time_stats.record_peak_rss(peak_rss_mb=MemoryBudget.get_peak_rss_mb(), dataset=dataset.global_identifier, key=TimerKeys.LOAD_TIME)
+                if self.execution.diff_load:
+                    # all the records of the dataset have been compared to the stored ones, the others are obsolete
+                    self.wait_until_loaded(time_stats=time_stats, dataset=dataset.global_identifier)
+                    for table_name, nb_obsolete in self.database.finish_diff_load(dataset=dataset.global_identifier, delete_obsolete=self.execution.diff_load_delete).items():
+                        quality_stats.count_obsolete_tuples(table_name=table_name, nb_tuples=nb_obsolete)
+            self.execution.current_file_number += 1
+
+        if self.load_pipeline is not None:
+            self.wait_until_loaded(time_stats=time_stats)
+            self.load_pipeline.stop()
+        if self.dataset_scheduler is not None:
+            self.dataset_scheduler.stop()
+        if self.execution.fast_initial_load:
+            # the unique indexes of records are built once all of them are loaded (if the last Load has not done it already)
+            for table_name, nb_duplicates in self.database.build_deferred_unique_indexes().items():
+                quality_stats.count_duplicated_tuples(table_name=table_name, nb_tuples=nb_duplicates)
+
+        db_stats = self.compute_profiles_and_stats(loaded_filenames=loaded_filenames)
+        # compute the final report with all the stats
+        self.reporting = Reporting(database=self.database, execution=self.execution, quality_stats=quality_stats, time_stats=time_stats, db_stats=db_stats)
+        self.reporting.run()
+
+    def compute_profiles_and_stats(self, loaded_filenames: list) -> DatabaseStatistics:
+        """
+        Save the datasets, compute the profiles of those that have been (re)loaded and the DB stats.
+        When all the datasets are unchanged, the database is left as it is: their Dataset tuples, profiles and DB stats are already there.
+        :param loaded_filenames: The list of the filenames of the datasets that have been loaded in this run.
+        :return: The DB stats, not recorded if all the datasets are unchanged.
+        """
+        if len(loaded_filenames) == 0:
+            log.info("all the datasets are unchanged, their profiles and the DB stats are not recomputed")
+            return DatabaseStatistics(record_stats=False)
 
         # save the datasets in the DB
         log.info(len(self.datasets))
@@ -146,14 +260,41 @@ class ETL:
             self.database.create_unique_index(table_name=TableNames.DATASET, columns={"global_identifier": 1})
         # compute their profiles
         log.info("profile computation")
-        self.profile_computation = FeatureProfileComputation(database=self.database)
+        # only the profiles of the datasets of this run are recomputed, those of the other datasets are left in place
+        self.profile_computation = FeatureProfileComputation(database=self.database, engine=self.execution.profile_engine,
+                                                            datasets=[dataset.global_identifier for dataset in self.datasets if not (self.execution.skip_unchanged_datasets and dataset.unchanged)],
+                                                            record_layout=self.execution.record_layout, value_encoding=self.execution.value_encoding,
+                                                            approximate=self.execution.profile_approximate, rank_error=self.execution.profile_rank_error)
         self.profile_computation.compute_features_profiles()
+        if self.execution.value_encoding == ValueEncodings.COMPACT:
+            # consumers needing verbose values read the view
+            self.profile_computation.records.create_expansion_view()
         # compute DB stats
         db_stats = DatabaseStatistics(record_stats=True)
-        db_stats.compute_stats(database=self.database)
-        # compute the final report with all the stats
-        self.reporting = Reporting(database=self.database, execution=self.execution, quality_stats=quality_stats, time_stats=time_stats, db_stats=db_stats)
-        self.reporting.run()
+        db_stats.compute_stats(database=self.database, record_layout=self.execution.record_layout)
+        return db_stats
+
+    def find_unchanged_datasets(self, inputs_hashes: dict, etl_version: str) -> set:
+        """
+        Find the datasets that have already been loaded (in the current database) with the same data file, metadata and ETL version.
+        :param inputs_hashes: A dict <filename, (data hash, metadata hash)> of the datasets to load.
+        :param etl_version: The version of the ETL, see Execution.compute_etl_version().
+        :return: A set of the filenames of the unchanged datasets.
+        """
+        unchanged_filenames = set()
+        for one_filename, (data_hash, metadata_hash) in inputs_hashes.items():
+            filter_dict = {"docker_path": os.path.join(DOCKER_FOLDER_DATA, one_filename), Dataset.DATA_HASH_: data_hash,
+                           Dataset.METADATA_HASH_: metadata_hash, Dataset.ETL_VERSION_: etl_version}
+            if self.database.count_documents(table_name=TableNames.DATASET, filter_dict=filter_dict) > 0:
+                unchanged_filenames.add(one_filename)
+        log.info(f"{len(unchanged_filenames)} unchanged datasets: {unchanged_filenames}")
+        return unchanged_filenames
+
+    def wait_until_loaded(self, time_stats: TimeStatistics, dataset: str | None = None) -> None:
+        if self.load_pipeline is not None:
+            time_stats.start(dataset=dataset, key=TimerKeys.WAIT_LOADED_TIME)
+            self.load_pipeline.wait_until_loaded()
+            time_stats.increment(dataset=dataset, key=TimerKeys.WAIT_LOADED_TIME)
 
     def create_hospital(self, counter: Counter, dataset_id: int) -> None:
         log.info(f"create hospital instance in memory")
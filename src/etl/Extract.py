@@ -1,34 +1,44 @@
 import itertools
 import json
 import os
+from typing import Iterator
 
+import pandas as pd
 from pandas import DataFrame
 
+from constants.structure import EXCEL_CACHE_FOLDER
 from database.Database import Database
 from database.Execution import Execution
 from entities.Feature import Feature
 from entities.OntologyResource import OntologyResource
 from enums.DataTypes import DataTypes
 from enums.HospitalNames import HospitalNames
+from enums.IngestionBackends import IngestionBackends
 from enums.MetadataColumns import MetadataColumns
 from enums.Ontologies import Ontologies
 from enums.Profile import Profile
 from enums.TableNames import TableNames
 from enums.TimerKeys import TimerKeys
 from enums.Visibility import Visibility
+from etl.MemoryBudget import MemoryBudget
 from etl.Task import Task
+from etl.ValueCache import ValueCache
 from preprocessing.PreprocessingTask import PreprocessingTask
 from statistics.QualityStatistics import QualityStatistics
 from statistics.TimeStatistics import TimeStatistics
-from utils.file_utils import read_tabular_file_as_string
+from utils.file_utils import read_tabular_file_as_arrow, read_tabular_file_as_string, read_tabular_file_in_chunks
 from utils.setup_logger import log
 
 
 class Extract(Task):
 
+    SAMPLE_SIZE = 1000  # the number of rows read to estimate the memory of a row
+
     def __init__(self, metadata: DataFrame, profile: str, database: Database, execution: Execution, quality_stats: QualityStatistics):
         super().__init__(database=database, execution=execution, quality_stats=quality_stats)
         self.data = None
+        self.streams_data = False  # whether the data is read chunk by chunk, see iterate_data_chunks()
+        self.data_chunk_size = self.execution.data_chunk_size  # in rows, computed from the memory budget if not given, see get_data_chunk_size()
         self.metadata = metadata
         self.profile = Profile.normalize(profile)
         self.columns_dataset_all_profiles = None
@@ -37,6 +47,8 @@ class Extract(Task):
         self.mapping_column_to_vartype = {}  # <column name, var type ("vartype" column)>
         self.mapping_column_to_unit = {}  # <column name, unit provided in the metadata>
         self.mapping_column_to_domain = {}  # <column name, <min: x, max: y> or <accepted_values: [...]>>
+        # the normalized values of the (raw) values of each data column, reused from one data chunk to another
+        self.value_cache = ValueCache(max_size=self.execution.value_cache_size)
 
     def run(self) -> None:
 
@@ -51,17 +63,26 @@ class Extract(Task):
         # filter: remove data columns that are not described in the metadata
         # normalize: the header
         if self.metadata is not None:
-            # preprocess input to have all the necessary data, as described in the metadata
-            self.load_tabular_data()
-            self.pre_process_data_file()
-            self.filter_data_file()
-            self.normalize_data_file()
+            self.data_chunk_size = self.get_data_chunk_size()
+            self.streams_data = self.can_stream_data()
+            if self.streams_data:
+                # the data is never entirely in memory: it is read, preprocessed, filtered and normalized chunk by chunk
+                # each time the Transform step iterates over it, here we only export it (which also reports the data columns not described)
+                for _ in self.iterate_data_chunks():
+                    self.export_data_to_csv_for_generative_ai()
+            else:
+                # preprocess input to have all the necessary data, as described in the metadata
+                self.load_tabular_data()
+                self.pre_process_data_file()
+                self.filter_data_file()
+                self.normalize_data_file()
 
             # compute mappings (categories, units and domains)
             self.compute_mapping_categorical_value_to_onto_resource()
             self.compute_column_to_unit()
             self.compute_column_to_domain()
-            self.export_data_to_csv_for_generative_ai()
+            if not self.streams_data:
+                self.export_data_to_csv_for_generative_ai()
 
     def export_metadata_to_csv_for_generative_ai(self):
         exported_filepath = os.path.join(self.execution.working_dir_current, "exported_metadata.csv")
@@ -102,7 +123,7 @@ class Extract(Task):
             if normalized_hospital_name in self.metadata.columns:
                 # the current hospital is in the metadata, we need to select the metadata line for which the
                 # hospital column has 1
-                self.metadata.loc[:, normalized_hospital_name] = self.metadata[normalized_hospital_name].apply(lambda x: MetadataColumns.normalize_value(column_value=x))
+                self.metadata.loc[:, normalized_hospital_name] = MetadataColumns.normalize_values(values=self.metadata[normalized_hospital_name])
                 self.metadata = self.metadata[self.metadata[normalized_hospital_name].isin([1, "1"])]
             else:
                 # we have no column specifying a hospital name, so the metadata is only for the current hospital
@@ -155,7 +176,54 @@ class Extract(Task):
     def load_tabular_data(self) -> None:
         log.info(f"Data filepath is {self.execution.current_filepath}")
         assert os.path.exists(self.execution.current_filepath), "The provided data file could not be found."
-        self.data = read_tabular_file_as_string(filepath=self.execution.current_filepath)
+        # only the Excel sheets with columns described in the metadata are read, and parsed sheets are cached for the next executions
+        column_names = set(self.columns_dataset_all_profiles.apply(lambda x: MetadataColumns.normalize_name(x)))
+        column_names.update([self.execution.patient_id_column_name, self.execution.sample_id_column_name])
+        cache_folder = os.path.join(self.execution.working_dir, EXCEL_CACHE_FOLDER)
+        if self.execution.ingestion_backend == IngestionBackends.ARROW:
+            self.data = read_tabular_file_as_arrow(filepath=self.execution.current_filepath, column_names=column_names, cache_folder=cache_folder,
+                                                   file_hash=self.execution.current_file_hash)
+        else:
+            self.data = read_tabular_file_as_string(filepath=self.execution.current_filepath, column_names=column_names, cache_folder=cache_folder,
+                                                    file_hash=self.execution.current_file_hash)
+
+    def can_stream_data(self) -> bool:
+        # Excel files cannot be read by chunks, and some pre-processing need all the rows at once
+        return (self.data_chunk_size > 0 and self.execution.current_filepath.endswith(".csv")
+                and PreprocessingTask.is_row_wise(hospital_name=self.execution.hospital_name))
+
+    def get_data_chunk_size(self) -> int:
+        """
+        Compute the number of rows of the data chunks: DATA_CHUNK_SIZE if given, otherwise, with a memory budget (ETL_MAX_MEMORY_MB),
+        the number of rows whose memory is a fraction of the budget, estimated on the first rows of the (CSV) data file.
+        :return: The number of rows of a data chunk, 0 if the data is read at once.
+        """
+        if (self.execution.data_chunk_size > 0 or self.execution.max_memory_mb <= 0 or not self.execution.current_filepath.endswith(".csv")
+                or not os.path.exists(self.execution.current_filepath)):
+            return self.execution.data_chunk_size
+        chunks = read_tabular_file_in_chunks(filepath=self.execution.current_filepath, chunk_size=Extract.SAMPLE_SIZE)
+        sample = next(chunks, None)
+        chunks.close()
+        if sample is None or len(sample) == 0:
+            return self.execution.data_chunk_size
+        row_memory = sample.memory_usage(deep=True).sum() / len(sample)
+        return MemoryBudget(max_memory_mb=self.execution.max_memory_mb).get_chunk_size(row_memory=row_memory)
+
+    def iterate_data_chunks(self) -> Iterator[DataFrame]:
+        """
+        Read the data file by chunks of rows (see get_data_chunk_size()), and preprocess, filter and normalize each of them,
+        thus the memory is bounded by the size of a chunk instead of the size of the file.
+        :return: An iterator over the chunks of the data, each of them being a DataFrame (also available in self.data).
+        """
+        log.info(f"Reading the data file {self.execution.current_filepath} by chunks of {self.data_chunk_size} rows")
+        assert os.path.exists(self.execution.current_filepath), "The provided data file could not be found."
+        for chunk in read_tabular_file_in_chunks(filepath=self.execution.current_filepath, chunk_size=self.data_chunk_size):
+            self.data = chunk
+            self.pre_process_data_file()
+            self.filter_data_file()
+            self.normalize_data_file()
+            yield self.data
+        self.data = None
 
     def normalize_data_file(self):
         # Normalize the data values
@@ -168,7 +236,13 @@ class Extract(Task):
 
         for column in self.data:
             if column not in columns_no_normalization:
-                self.data.loc[:, column] = self.data[column].apply(lambda x: MetadataColumns.normalize_value(column_value=x))
+                if self.execution.ingestion_backend == IngestionBackends.ARROW:
+                    self.data[column] = MetadataColumns.normalize_values_with_arrow(values=self.data[column])
+                else:
+                    self.data.loc[:, column] = self.value_cache.map_values(column_name=column, values=self.data[column].to_numpy(),
+                                                                           compute=lambda raw_values: MetadataColumns.normalize_values(values=pd.Series(raw_values, dtype=object)).tolist())
+        # the Transform step gets Python values, as with the pandas backend
+        self.convert_arrow_columns()
 
         log.info(f"{len(self.data.columns)} columns and {len(self.data)} lines in the data file.")
 
@@ -176,6 +250,9 @@ class Extract(Task):
         # preprocess data files, i.e., change the data DataFrame to fit the metadata
         # we do not write the pre-processed data to any new ile, we simply run the ETL with it
         # this avoids to (a) overwrite given data files and (b) to have filenames which differ from the metadata
+        if PreprocessingTask.preprocesses(hospital_name=self.execution.hospital_name):
+            # pre-processing is written for columns of Python values
+            self.convert_arrow_columns()
         preprocessing_task = PreprocessingTask(execution=self.execution, data=self.data, metadata=self.metadata, profile=self.profile)
         preprocessing_task.run()
         self.data = preprocessing_task.data
@@ -183,6 +260,11 @@ class Extract(Task):
         # normalize column names
         self.data = self.data.rename(columns=lambda x: MetadataColumns.normalize_name(column_name=x))
 
+    def convert_arrow_columns(self) -> None:
+        for column in self.data:
+            if isinstance(self.data[column].dtype, pd.ArrowDtype):
+                self.data[column] = self.data[column].astype(object)
+
     def filter_data_file(self) -> None:
         # Normalize column names ("sex", "dateOfBirth", "Ethnicity", etc.) to match column names described in the metadata
         self.data = self.data.rename(columns=lambda x: MetadataColumns.normalize_name(column_name=x))
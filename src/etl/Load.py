@@ -1,9 +1,12 @@
 from database.Database import Database
 from database.Execution import Execution
+from database.IndexAdvisor import IndexAdvisor
+from database.RecordBuckets import RecordBuckets
 from entities.Record import Record
 from entities.Resource import Resource
 from enums.DiagnosisColumns import DiagnosisColumns
 from enums.Profile import Profile
+from enums.RecordLayouts import RecordLayouts
 from enums.TableNames import TableNames
 from enums.TimerKeys import TimerKeys
 from etl.Task import Task
@@ -23,7 +26,11 @@ class Load(Task):
     def run(self) -> None:
         # Insert resources that have not been inserted yet, i.e., all Record instances
         log.debug(f"in the Load class")
-        self.load_records()
+        if not self.execution.direct_load:
+            self.load_records()
+        else:
+            # records have already been loaded batch by batch during the Transform step
+            pass
 
         # if everything has been loaded, we can create indexes
         if self.create_indexes:
@@ -31,21 +38,39 @@ class Load(Task):
 
     def load_records(self) -> None:
         log.info(f"load {self.profile} records")
+        table_name, unique_variables = Load.get_record_table(execution=self.execution, profile=self.profile)
+        log.info(unique_variables)
+        self.database.load_json_in_table(table_name=table_name, unique_variables=unique_variables, dataset_id=self.dataset_id)
+
+    @classmethod
+    def get_record_table(cls, execution: Execution, profile: str) -> tuple[str, list[str]]:
+        # the table in which records are loaded, depending on the record layout, and its unique variables
+        if execution.record_layout == RecordLayouts.BUCKETS:
+            return TableNames.RECORD_BUCKET, RecordBuckets.get_unique_variables()
+        else:
+            return TableNames.RECORD, Load.get_record_unique_variables(profile=profile)
+
+    @classmethod
+    def get_record_unique_variables(cls, profile: str) -> list[str]:
         # we need to have registered_by, has_subject and instantiates for sure
         # we also need entity_type because we cannot have two indexes, one for non-clinical (reg, subj, inst) and one for clinical (reg, subj, inst, bid)
         # we also need base_id for the same reason, the value will be null for non-clinical records and clinical records without sample information
         unique_variables = [Record.REG_BY_, Record.SUBJECT_, Record.INSTANTIATES_, Resource.ENTITY_TYPE_, Record.BASE_ID_]
-        if self.profile == Profile.DIAGNOSIS:
+        if profile == Profile.DIAGNOSIS:
             # we allow patients to have several diagnoses
             unique_variables.append(DiagnosisColumns.DISEASE_COUNTER)
-        log.info(unique_variables)
-        self.database.load_json_in_table(table_name=TableNames.RECORD, unique_variables=unique_variables, dataset_id=self.dataset_id)
+        return unique_variables
 
     def create_db_indexes(self) -> None:
         log.info(f"Creating indexes.")
 
         count = 0
 
+        # 0. with the fast initial load, the unique indexes of records have not been created during the load
+        for table_name, nb_duplicates in self.database.build_deferred_unique_indexes().items():
+            self.quality_stats.count_duplicated_tuples(table_name=table_name, nb_tuples=nb_duplicates)
+            count += 1
+
         # 1. for each resource type, we create an index on its "identifier" and its creation date "timestamp"
         for table_name in TableNames.data_tables():
             log.info(f"add index on id + timestamp + entity_type for table {table_name}")
@@ -61,11 +86,21 @@ class Load(Task):
         self.database.create_non_unique_index(table_name=TableNames.FEATURE, columns={"ontology_resource.system": 1, "ontology_resource.code": 1})
         count += 1
 
-        # for Record instances, we create an index per reference because we usually join each reference to a table
-        self.database.create_non_unique_index(table_name=TableNames.RECORD, columns={Record.INSTANTIATES_: 1})
-        self.database.create_non_unique_index(table_name=TableNames.RECORD, columns={Record.SUBJECT_: 1})
-        self.database.create_non_unique_index(table_name=TableNames.RECORD, columns={Record.DATASET_: 1})
-        count += 3
+        if self.execution.record_layout == RecordLayouts.BUCKETS:
+            # record buckets are only matched on their shared fields, before being expanded in records
+            for columns in IndexAdvisor.RECORD_BUCKET_INDEXES:
+                self.database.create_non_unique_index(table_name=TableNames.RECORD_BUCKET, columns=columns)
+                count += 1
+        else:
+            # for Record instances, we create an index per reference because we usually join each reference to a table
+            # (the compound indexes below start with instantiates, thus also serve the joins on instantiates)
+            self.database.create_non_unique_index(table_name=TableNames.RECORD, columns={Record.SUBJECT_: 1})
+            self.database.create_non_unique_index(table_name=TableNames.RECORD, columns={Record.DATASET_: 1})
+            count += 2
+            # and compound indexes for the queries computing feature profiles and statistics
+            for columns in IndexAdvisor.RECORD_INDEXES:
+                self.database.create_non_unique_index(table_name=TableNames.RECORD, columns=columns)
+                count += 1
         # we cannot create an index on the base id because some records have it (the clinical ones)
         # while others do not have (imaging, phenotypic, etc.)
         # if has_base_id:
@@ -0,0 +1,78 @@
+import queue
+import threading
+import time
+
+from database.Database import Database
+from enums.TimerKeys import TimerKeys
+from statistics.TimeStatistics import TimeStatistics
+from utils.setup_logger import log
+
+
+class LoadPipeline:
+    """
+    Load batches of (typed) tuples in the database with loader threads, while the Transform step produces the next batches.
+    The queue of batches is bounded: when it is full, the producer waits (backpressure),
+    thus at most queue_size batches are waiting in memory to be loaded.
+    """
+
+    def __init__(self, database: Database, nb_loaders: int, queue_size: int, time_stats: TimeStatistics):
+        self.database = database
+        self.nb_loaders = nb_loaders
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.time_stats = time_stats
+        self.time_stats_lock = threading.Lock()  # time statistics are written by the producer and all the loaders
+        self.loaders = []
+        self.errors = []
+
+    def start(self) -> None:
+        log.info(f"Starting {self.nb_loaders} loader threads, with a queue of at most {self.queue.maxsize} batches")
+        for i in range(self.nb_loaders):
+            loader = threading.Thread(target=self.run_loader, name=f"loader-{i}", daemon=True)
+            loader.start()
+            self.loaders.append(loader)
+
+    def put_batch(self, dataset: str | None, table_name: str, unique_variables: list[str], tuples: list[dict]) -> None:
+        self.check_errors()
+        start_time = time.time()
+        self.queue.put((dataset, table_name, unique_variables, tuples))  # this blocks while the queue is full
+        self.add_time(dataset=dataset, key=TimerKeys.TRANSFORM_BLOCKED_TIME, value=time.time() - start_time)
+
+    def wait_until_loaded(self) -> None:
+        # wait until all the batches that have been put in the queue are loaded
+        self.queue.join()
+        self.check_errors()
+
+    def stop(self) -> None:
+        for _ in self.loaders:
+            self.queue.put(None)  # one stop signal per loader
+        for loader in self.loaders:
+            loader.join()
+        self.loaders.clear()
+        self.check_errors()
+
+    def run_loader(self) -> None:
+        while True:
+            start_time = time.time()
+            batch = self.queue.get()
+            if batch is None:
+                self.queue.task_done()
+                break
+            dataset, table_name, unique_variables, tuples = batch
+            self.add_time(dataset=dataset, key=TimerKeys.LOAD_IDLE_TIME, value=time.time() - start_time)
+            start_time = time.time()
+            try:
+                self.database.load_tuples_in_table(table_name=table_name, unique_variables=unique_variables, tuples=tuples, ordered=False)
+            except Exception as error:
+                log.error(f"Could not load a batch of {len(tuples)} tuples in table {table_name}: {error}")
+                self.errors.append(error)
+            finally:
+                self.add_time(dataset=dataset, key=TimerKeys.LOAD_BUSY_TIME, value=time.time() - start_time)
+                self.queue.task_done()
+
+    def add_time(self, dataset: str | None, key: str, value: float) -> None:
+        with self.time_stats_lock:
+            self.time_stats.add(dataset=dataset, key=key, value=value)
+
+    def check_errors(self) -> None:
+        if len(self.errors) > 0:
+            raise RuntimeError(f"{len(self.errors)} batch(es) could not be loaded in the database.") from self.errors[0]
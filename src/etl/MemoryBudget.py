@@ -0,0 +1,99 @@
+import os
+import resource
+import sys
+import tempfile
+
+import numpy as np
+
+from constants.defaults import BATCH_SIZE
+
+
+class MemoryBudget:
+    """
+    Keep the resident memory (RSS) of the ETL process under max_memory_mb (if positive, otherwise memory is not bounded).
+    The batch size is adapted after each batch: halved (down to MIN_BATCH_SIZE) when the RSS is over the budget,
+    and doubled back (up to max_batch_size) when the RSS is under LOW_WATERMARK of the budget.
+    Large intermediate arrays are spilled to memory-mapped files (in the given directory) when the RSS is over the budget.
+    The RSS is read in /proc (Linux), and the peak RSS of a stage uses the (resettable) high-water mark of the kernel;
+    on other systems, the peak RSS is the one of the whole process, and the current RSS is approximated by it.
+    """
+
+    MIN_BATCH_SIZE = 500
+    LOW_WATERMARK = 0.5
+    SPILL_FRACTION = 0.1  # arrays larger than this fraction of the budget are spilled when the RSS is over the budget
+    CHUNK_FRACTION = 0.1  # a data chunk takes (about) this fraction of the budget, as it is copied during its pre-processing
+
+    def __init__(self, max_memory_mb: int, spill_dir: str | None = None, max_batch_size: int = BATCH_SIZE):
+        self.max_memory_mb = max_memory_mb
+        self.spill_dir = spill_dir
+        self.max_batch_size = max_batch_size
+        self.batch_size = max_batch_size
+        self.nb_spilled_arrays = 0
+
+    def is_bounded(self) -> bool:
+        return self.max_memory_mb > 0
+
+    def is_over_budget(self) -> bool:
+        return self.is_bounded() and MemoryBudget.get_rss_mb() > self.max_memory_mb
+
+    def adapt_batch_size(self) -> int:
+        # called after each batch, thus the batch size follows the memory actually used by the batches
+        if self.is_bounded():
+            rss_mb = MemoryBudget.get_rss_mb()
+            if rss_mb > self.max_memory_mb:
+                self.batch_size = max(MemoryBudget.MIN_BATCH_SIZE, self.batch_size // 2)
+            elif rss_mb < MemoryBudget.LOW_WATERMARK * self.max_memory_mb:
+                self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+        return self.batch_size
+
+    def get_chunk_size(self, row_memory: float) -> int:
+        # the number of rows of a data chunk, given the (estimated) memory of a row, in bytes
+        return max(MemoryBudget.MIN_BATCH_SIZE, int(MemoryBudget.CHUNK_FRACTION * self.max_memory_mb * 1024 * 1024 / max(row_memory, 1)))
+
+    def spill_array(self, array: np.ndarray) -> np.ndarray:
+        """
+        Move a (large) array to a memory-mapped file if the process is over its budget: its pages are then written to disk,
+        and read back by the OS when they are accessed, instead of being kept in (anonymous) memory.
+
+        :param array: the array to spill
+        :return: the array itself, or a memory-mapped copy of it
+        """
+        if not self.is_bounded() or array.nbytes < MemoryBudget.SPILL_FRACTION * self.max_memory_mb * 1024 * 1024 or not self.is_over_budget():
+            return array
+        # the file is deleted right away, and its disk space is freed once the memory map is released
+        with tempfile.TemporaryFile(dir=self.spill_dir) as spill_file:
+            spilled_array = np.memmap(spill_file, dtype=array.dtype, mode="w+", shape=array.shape)
+        spilled_array[:] = array
+        spilled_array.flush()
+        self.nb_spilled_arrays += 1
+        return spilled_array
+
+    @classmethod
+    def get_rss_mb(cls) -> float:
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+        except OSError:
+            return MemoryBudget.get_peak_rss_mb()
+
+    @classmethod
+    def reset_peak_rss(cls) -> None:
+        # the high-water mark is reset to the current RSS (Linux only), thus the next peak is the one of the next stage
+        try:
+            with open("/proc/self/clear_refs", "w") as clear_refs:
+                clear_refs.write("5")
+        except OSError:
+            pass
+
+    @classmethod
+    def get_peak_rss_mb(cls) -> float:
+        try:
+            with open("/proc/self/status") as status:
+                for line in status:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) / 1024  # in kB
+        except OSError:
+            pass
+        # ru_maxrss is in bytes on macOS, and in kB on Linux
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
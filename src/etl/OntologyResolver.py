@@ -0,0 +1,102 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pandas import DataFrame
+
+from database.OntologyLabelCache import OntologyLabelCache
+from entities.OntologyResource import OntologyResource
+from enums.MetadataColumns import MetadataColumns
+from enums.Ontologies import Ontologies
+from statistics.QualityStatistics import QualityStatistics
+from utils.setup_logger import log
+
+
+class OntologyResolver:
+    """
+    Resolve the labels of all the ontology codes of the metadata (or of API columns) with concurrent API calls,
+    before the Extract and Transform steps create the OntologyResources, which then find their labels in the label cache.
+    There are at most max_per_api concurrent calls to the API of each ontology, and failed connections are retried with an exponential backoff.
+    """
+
+    NB_RETRIES = 3
+    BACKOFF_TIME = 1  # in seconds, doubled after each failed attempt
+
+    def __init__(self, nb_threads: int, max_per_api: int):
+        self.nb_threads = nb_threads
+        self.max_per_api = max_per_api
+        self.codes = set()  # the (system url, single code) pairs to resolve
+        self.semaphores = {}  # { system url: semaphore bounding the number of concurrent calls to that API }
+
+    def add_code(self, ontology: dict, full_code: str) -> None:
+        if type(ontology) is dict and len(ontology) > 0 and len(full_code) > 0:
+            for single_code in OntologyResource.get_single_codes(full_code=full_code):
+                self.codes.add((ontology["url"], single_code))
+
+    def add_metadata(self, metadata: DataFrame) -> None:
+        # the ontology codes of the columns (for Features) and of their categorical values, as in Transform and Extract
+        metadata = metadata.rename(columns=lambda x: MetadataColumns.normalize_name(column_name=x))
+        for row in metadata.itertuples(index=False):
+            onto_name = row[metadata.columns.get_loc(MetadataColumns.ONTO_NAME)]
+            onto_code = row[metadata.columns.get_loc(MetadataColumns.ONTO_CODE)]
+            self.add_code(ontology=Ontologies.get_enum_from_name(ontology_name=Ontologies.normalize_name(ontology_name=onto_name)), full_code=onto_code)
+            candidate_json_values = row[metadata.columns.get_loc(MetadataColumns.JSON_VALUES)]
+            if candidate_json_values != "":
+                try:
+                    json_categorical_values = json.loads(candidate_json_values)
+                except Exception:
+                    json_categorical_values = {}  # this is reported by the Extract step
+                for json_categorical_value in json_categorical_values:
+                    for key, val in json_categorical_value.items():
+                        if key != "value" and key != "explanation":
+                            self.add_code(ontology=Ontologies.get_enum_from_name(ontology_name=Ontologies.normalize_name(key)), full_code=val)
+
+    def add_api_value(self, value: str) -> None:
+        # API values are of the form <ontology name>:<code>, as in Transform.fairify_value()
+        split_value = value.split(":")
+        if len(split_value) > 1:
+            self.add_code(ontology=Ontologies.get_enum_from_name(ontology_name=Ontologies.normalize_name(ontology_name=split_value[0])), full_code=split_value[1])
+
+    def run(self) -> None:
+        label_cache = OntologyLabelCache.current
+        if label_cache is None or label_cache.offline:
+            # resolved labels could not be given to OntologyResources (no cache has been set up),
+            # and in offline mode, codes that are not in the cache are reported when creating OntologyResources
+            return
+        codes_to_resolve = [(system, code) for system, code in self.codes if label_cache.get_label(system=system, code=code) is None]
+        if len(codes_to_resolve) == 0:
+            return
+        log.info(f"Resolving the labels of {len(codes_to_resolve)} ontology codes with {self.nb_threads} threads")
+        self.semaphores = {system: threading.Semaphore(self.max_per_api) for system, _ in codes_to_resolve}
+        with ThreadPoolExecutor(max_workers=self.nb_threads, thread_name_prefix="ontology") as executor:
+            results = executor.map(self.resolve, codes_to_resolve)
+            # the cache is only written by the current thread (SQLite connections cannot be shared by threads)
+            for (system, code), (label, error) in zip(codes_to_resolve, results):
+                if error is None:
+                    label_cache.add_label(system=system, code=code, label=label)
+                elif error == OntologyResource.get_not_found_error(single_code=code):
+                    label_cache.add_not_found(system=system, code=code, error=error)
+                else:
+                    label_cache.add_failed_call(system=system, code=code, error=error)
+
+    def resolve(self, system_and_code: tuple) -> tuple[str, str | None]:
+        # executed in a thread of the pool: returns the label of the code and the API error (if any)
+        system, code = system_and_code
+        label, error = None, None
+        for attempt in range(OntologyResolver.NB_RETRIES + 1):
+            if attempt > 0:
+                time.sleep(OntologyResolver.BACKOFF_TIME * 2 ** (attempt - 1))
+            api_stats = QualityStatistics(record_stats=True)
+            with self.semaphores[system]:
+                label = self.query_api(system=system, single_code=code, quality_stats=api_stats)
+            error = api_stats.failed_api_calls.get(f"{system}/{code}")
+            if error is None:
+                return label, None
+            elif not error.startswith("Failed connection"):
+                # the API answered (e.g., the code does not exist), querying it again would not help
+                break
+        return label, error
+
+    def query_api(self, system: str, single_code: str, quality_stats: QualityStatistics) -> str:
+        return OntologyResource.get_resource_label_from_api(system=system, single_code=single_code, quality_stats=quality_stats)
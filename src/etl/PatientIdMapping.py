@@ -0,0 +1,34 @@
+import threading
+
+
+class PatientIdMapping:
+    """
+    The mapping <patient ID, anonymized patient ID> shared by the worker processes transforming several datasets at once.
+    It is hosted by a manager process (see DatasetScheduler), which serves each worker in its own thread.
+    Workers reserve the identifiers of their new patients in the database counter, then allocate them here:
+    the first worker allocating an identifier to a patient ID wins, and the others take its identifier.
+    """
+
+    def __init__(self, mapping: dict):
+        self.mapping = mapping
+        self.lock = threading.Lock()
+
+    def get_mapping(self) -> dict:
+        with self.lock:
+            return dict(self.mapping)
+
+    def get_identifiers(self, patient_ids: list) -> dict:
+        # the anonymized IDs of the given patient IDs that are already allocated
+        with self.lock:
+            return {patient_id: self.mapping[patient_id] for patient_id in patient_ids if patient_id in self.mapping}
+
+    def allocate(self, identifiers: dict) -> dict:
+        """
+        Allocate anonymized IDs to new patient IDs, unless another worker has allocated them in the meantime.
+        :param identifiers: A dict <patient ID, anonymized ID> of the patients created by a worker (with identifiers reserved in the counter).
+        :return: A dict <patient ID, anonymized ID> of the same patient IDs, with the identifiers allocated first.
+        """
+        with self.lock:
+            for patient_id, identifier in identifiers.items():
+                self.mapping.setdefault(patient_id, identifier)
+            return {patient_id: self.mapping[patient_id] for patient_id in identifiers}
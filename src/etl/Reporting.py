@@ -47,7 +47,9 @@ class Reporting(Task):
 
         # 5. save each stat report in the database
         self.database.drop_table(table_name=TableNames.STATS_TIME)
-        self.database.insert_one_tuple(table_name=TableNames.STATS_DB, one_tuple=self.db_stats.to_json())
+        if self.db_stats.record_stats:
+            # DB stats are not recomputed when all the datasets are unchanged, the former ones still hold
+            self.database.insert_one_tuple(table_name=TableNames.STATS_DB, one_tuple=self.db_stats.to_json())
         self.database.insert_one_tuple(table_name=TableNames.STATS_TIME, one_tuple=self.time_stats.to_json())
         self.database.insert_one_tuple(table_name=TableNames.STATS_QUALITY, one_tuple=self.quality_stats.to_json())
 
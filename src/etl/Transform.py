@@ -1,33 +1,40 @@
+import copy
+import locale
+import multiprocessing
 import re
-from datetime import datetime
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, date, time
 from itertools import islice
-from typing import Any
+from typing import Any, Callable, Iterator
 
+import numpy as np
 import pandas as pd
 import ujson
 from pandas import DataFrame
 
-from constants.defaults import BATCH_SIZE, PATTERN_VALUE_UNIT, NO_ID
+from constants.defaults import BATCH_SIZE, PATTERN_VALUE_UNIT, NO_ID, PATTERN_INTEGER, PATTERN_FLOAT, \
+    PATTERN_ISO_DATETIME
+from constants.methods import factory
 from database.Counter import Counter
 from database.Database import Database
 from entities.Dataset import Dataset
 from database.Execution import Execution
+from database.OntologyLabelCache import OntologyLabelCache
+from database.Operators import Operators
+from database.RecordBuckets import RecordBuckets
 from entities.ClinicalFeature import ClinicalFeature
-from entities.ClinicalRecord import ClinicalRecord
 from entities.DiagnosisFeature import DiagnosisFeature
 from entities.DiagnosisRecord import DiagnosisRecord
 from entities.Feature import Feature
 from entities.GenomicFeature import GenomicFeature
-from entities.GenomicRecord import GenomicRecord
 from entities.Hospital import Hospital
 from entities.ImagingFeature import ImagingFeature
-from entities.ImagingRecord import ImagingRecord
 from entities.MedicineFeature import MedicineFeature
-from entities.MedicineRecord import MedicineRecord
 from entities.OntologyResource import OntologyResource
 from entities.Patient import Patient
 from entities.PhenotypicFeature import PhenotypicFeature
-from entities.PhenotypicRecord import PhenotypicRecord
+from entities.Record import Record
 from entities.Resource import Resource
 from enums.DataTypes import DataTypes
 from enums.DiagnosisColumns import DiagnosisColumns
@@ -35,10 +42,17 @@ from enums.Domain import Domain
 from enums.MetadataColumns import MetadataColumns
 from enums.Ontologies import Ontologies
 from enums.Profile import Profile
+from enums.RecordLayouts import RecordLayouts
 from enums.TableNames import TableNames
 from enums.TimerKeys import TimerKeys
+from enums.ValueEncodings import ValueEncodings
 from enums.Visibility import Visibility
+from etl.Load import Load
+from etl.LoadPipeline import LoadPipeline
+from etl.MemoryBudget import MemoryBudget
+from etl.OntologyResolver import OntologyResolver
 from etl.Task import Task
+from etl.ValueCache import ValueCache
 from src.constants.defaults import DEFAULT_NAN_VALUE
 from statistics.QualityStatistics import QualityStatistics
 from statistics.TimeStatistics import TimeStatistics
@@ -54,8 +68,10 @@ class Transform(Task):
                  mapping_column_to_unit: dict, mapping_column_to_domain: dict,
                  mapping_column_to_type: dict | None,
                  profile: str, dataset_id: int, dataset_key: Dataset, load_patients: bool,
-                 quality_stats: QualityStatistics):
+                 quality_stats: QualityStatistics, load_pipeline: LoadPipeline | None = None,
+                 data_chunks: Callable[[], Iterator[DataFrame]] | None = None):
         super().__init__(database=database, execution=execution, quality_stats=quality_stats)
+        self.load_pipeline = load_pipeline  # if given, records are loaded by loader threads while the next ones are created
         self.time_statistics = TimeStatistics(record_stats=True)
         self.counter = Counter()  # resource counter
         self.profile = profile
@@ -65,6 +81,8 @@ class Transform(Task):
 
         # get data, metadata and the mapped values computed in the Extract step
         self.data = data
+        # if given, the data is streamed: each iteration over the data reads it again, chunk by chunk, see iterate_data()
+        self.data_chunks = data_chunks
         self.metadata = metadata
         self.mapping_column_to_unit = mapping_column_to_unit
         self.mapping_column_to_categorical_value = mapping_column_to_categorical_value
@@ -75,9 +93,17 @@ class Transform(Task):
         self.mapping_column_to_visibility = {}
         self.mapping_column_to_domain = mapping_column_to_domain
         self.mapping_apivalue_to_onto_resource = {}  # for API columns only; of the form: <"onto_name:onto_code": onto resource>
+        # the record values (fairified, anonymized and converted) of the (normalized) values of each column
+        self.value_cache = ValueCache(max_size=self.execution.value_cache_size)
+        # for compact values, the index of each category in the categories of the Feature: <column name: <category (as JSON text): index>>
+        self.mapping_column_to_category_index = {}
+        # the batch size of records follows the memory budget, and large masks are spilled to disk when the budget is exceeded
+        self.memory_budget = MemoryBudget(max_memory_mb=self.execution.max_memory_mb, spill_dir=self.execution.working_dir_current)
         # to keep track of anonymized vs. hospital patient ids
         # this is empty if no file as been provided by the user, otherwise it contains some mappings <patient ID, anonymized ID>
         self.patient_ids_mapping = {}
+        # when several datasets are transformed at once (in worker processes), the PatientIdMapping shared by the workers, see DatasetScheduler
+        self.shared_patient_ids_mapping = None
         # to keep track of the total number of values that could exist (whether they are Nan or a real value)
         self.mapping_column_all_count = {}
 
@@ -102,6 +128,8 @@ class Transform(Task):
         log.info(f"********** create {self.profile} features and records")
         self.counter.set_with_database(database=self.database)
         self.create_features()
+        if self.execution.ontology_nb_threads > 0:
+            self.resolve_api_values()
         self.counter.set_with_database(database=self.database)
         self.create_records()
 
@@ -118,12 +146,16 @@ class Transform(Task):
 
         # 2. create non-existing features in-memory, then insert them
         log.info(f"Creating {self.profile}Feature instances in memory")
+        # columns to remove have already been removed in the Extract part from the metadata
+        # here, we need to ensure that we create Features that have a name, which are not IDs (patient or sample) nor for Diagnosis counter (clinical base_id)
+        not_feature_columns = ["", self.execution.patient_id_column_name, self.execution.sample_id_column_name, DiagnosisColumns.DISEASE_COUNTER]
+        new_feature_columns = [column_name for column_name in self.metadata[MetadataColumns.COLUMN_NAME] if column_name not in not_feature_columns and column_name not in db_existing_features]
+        # the identifiers of the new features are reserved at once, instead of one database round trip per feature
+        self.counter.reserve_block(nb_ids=len(new_feature_columns))
         columns = self.metadata.columns
         for row in self.metadata.itertuples(index=False):
             column_name = row[columns.get_loc(MetadataColumns.COLUMN_NAME)]
-            # columns to remove have already been removed in the Extract part from the metadata
-            # here, we need to ensure that we create Features that have a name, which are not IDs (patient or sample) nor for Diagnosis counter (clinical base_id)
-            if column_name not in ["", self.execution.patient_id_column_name, self.execution.sample_id_column_name, DiagnosisColumns.DISEASE_COUNTER]:
+            if column_name not in not_feature_columns:
                 if column_name not in db_existing_features:
                     # we create a new Feature from scratch
                     onto_resource = self.create_ontology_resource_from_row(column_name=column_name)
@@ -238,6 +270,19 @@ class Transform(Task):
     # RECORDS
     ##############################################################
 
+    def resolve_api_values(self) -> None:
+        # the ontology codes given in API columns are resolved concurrently, instead of one at a time while creating records
+        ontology_resolver = OntologyResolver(nb_threads=self.execution.ontology_nb_threads, max_per_api=self.execution.ontology_max_per_api)
+        api_columns = [column_name for column_name, etl_type in self.mapping_column_to_type.items() if etl_type == DataTypes.API]
+        if len(api_columns) == 0:
+            return
+        for _ in self.iterate_data():
+            for column_name in api_columns:
+                if column_name in self.data.columns:
+                    for value in self.data[column_name].dropna().unique():
+                        ontology_resolver.add_api_value(value=value)
+        ontology_resolver.run()
+
     def create_records(self) -> None:
         log.info(f"creating {self.profile}Record instances in memory")
 
@@ -258,125 +303,20 @@ class Transform(Task):
         #
         # else:
         # log.info(mapping_column_to_feature_id)
+        if self.execution.value_encoding == ValueEncodings.COMPACT:
+            self.load_category_indexes()
 
-        # b. Create Record instance, and write them in temporary (JSON) files
-        columns = self.data.columns
-        for row in self.data.itertuples(index=False):
-            # log.info(row)
-            # create Record instances by associating observations to a patient, a record and a hospital
-            for column_name in columns:
-                value = row[columns.get_loc(column_name)]
-                # log.debug(f"column {column_name} (type: {type(column_name)}), value is {value}")
-                if value == "":
-                    # if there is no value for that Feature, no need to create a Record instance
-                    # log.error(f"skipping value {value} in column {column_name} because it is None, or empty or nan")
-                    self.quality_stats.count_empty_cell_for_column(column_name=column_name)
-                    if column_name in mapping_column_to_feature_id:
-                        feature_id = mapping_column_to_feature_id[column_name]
-                        if feature_id not in self.mapping_column_all_count:
-                            self.mapping_column_all_count[feature_id] = 1
-                        else:
-                            self.mapping_column_all_count[feature_id] = self.mapping_column_all_count[feature_id] + 1
-                else:
-                    if column_name in mapping_column_to_feature_id:
-                        # we know a code for this column, so we can register the value of that Feature in a new Record
-                        feature_id = mapping_column_to_feature_id[column_name]
-                        hospital_id = mapping_hospital_to_hospital_id[self.execution.hospital_name]
-                        # get the anonymized patient id using the mapping <initial id, anonymized id>
-                        patient_id = self.patient_ids_mapping[row[columns.get_loc(self.execution.patient_id_column_name)]]
-                        fairified_value = self.fairify_value(column_name=column_name, value=value)
-                        anonymized_value, is_anonymized = self.anonymize_value(column_name=column_name,
-                                                                               fairified_value=fairified_value)
-                        if is_anonymized:
-                            fairified_value = anonymized_value  # we could anonymize this value, this is the one to insert in the DB
-                        dataset = self.execution.current_dataset_gid
-                        if self.profile == Profile.PHENOTYPIC:
-                            new_record = PhenotypicRecord(identifier=NO_ID,
-                                                          instantiates=feature_id,
-                                                          has_subject=patient_id,
-                                                          registered_by=hospital_id,
-                                                          value=fairified_value,
-                                                          counter=self.counter,
-                                                          dataset=dataset)
-                        elif self.profile == Profile.CLINICAL:
-                            if self.execution.sample_id_column_name in columns:
-                                # this dataset contains a sample barcode (or equivalent)
-                                base_id = row[columns.get_loc(self.execution.sample_id_column_name)]
-                            else:
-                                base_id = None
-                            new_record = ClinicalRecord(identifier=NO_ID,
-                                                        instantiates=feature_id,
-                                                        has_subject=patient_id,
-                                                        registered_by=hospital_id,
-                                                        value=fairified_value,
-                                                        base_id=base_id,
-                                                        counter=self.counter,
-                                                        dataset=dataset)
-                        elif self.profile == Profile.DIAGNOSIS:
-                            if DiagnosisColumns.DISEASE_COUNTER in columns:
-                                # this dataset contains a diagnosis counter because patients may be affected
-                                # by several diseases
-                                # we also need to force the conversion to int, because we read the data as str
-                                # and such values do not go through the fairification method
-                                try:
-                                    diagnosis_counter = int(row[columns.get_loc(DiagnosisColumns.DISEASE_COUNTER)])
-                                except:
-                                    # the value is None because the patient diseases is unknown in the disease classification
-                                    diagnosis_counter = None
-                            else:
-                                diagnosis_counter = None
-                            new_record = DiagnosisRecord(identifier=NO_ID,
-                                                         instantiates=feature_id,
-                                                         has_subject=patient_id,
-                                                         registered_by=hospital_id,
-                                                         value=fairified_value,
-                                                         diagnosis_counter=diagnosis_counter,
-                                                         counter=self.counter,
-                                                         dataset=dataset)
-                        elif self.profile == Profile.GENOMIC:
-                            new_record = GenomicRecord(identifier=NO_ID,
-                                                       instantiates=feature_id,
-                                                       has_subject=patient_id,
-                                                       registered_by=hospital_id,
-                                                       vcf=None,
-                                                       value=fairified_value,
-                                                       counter=self.counter,
-                                                       dataset=dataset)
-                        elif self.profile == Profile.IMAGING:
-                            new_record = ImagingRecord(identifier=NO_ID,
-                                                       instantiates=feature_id,
-                                                       has_subject=patient_id,
-                                                       registered_by=hospital_id,
-                                                       scan=None,
-                                                       value=fairified_value,
-                                                       counter=self.counter,
-                                                       dataset=dataset)
-                        elif self.profile == Profile.MEDICINE:
-                            new_record = MedicineRecord(identifier=NO_ID,
-                                                        instantiates=feature_id,
-                                                        has_subject=patient_id,
-                                                        registered_by=hospital_id,
-                                                        value=fairified_value,
-                                                        counter=self.counter,
-                                                        dataset=dataset)
-                        else:
-                            raise NotImplementedError("Not implemented yet.")
-                        self.records.append(new_record.to_json())
-                        if len(self.records) >= BATCH_SIZE:
-                            self.process_batch_of_records()
-                        # to compute the percentage of missing values in features' profiles
-                        if feature_id not in self.mapping_column_all_count:
-                            self.mapping_column_all_count[feature_id] = 1
-                        else:
-                            self.mapping_column_all_count[feature_id] = self.mapping_column_all_count[feature_id] + 1
-                    else:
-                        # this represents the case when a column has not been converted to a Feature resource
-                        # this may happen for ID column for instance, or in BUZZI many clinical columns are not described in the metadata, thus skipped here
-                        # log.error(f"Skipping column {column_name} for row {index}")
-                        pass
-        # save the remaining tuples that have not been saved (because there were less than BATCH_SIZE tuples before the loop ends).
-        if len(self.records) > 0:
-            self.process_batch_of_records()
+        if self.execution.record_layout == RecordLayouts.BUCKETS:
+            # the buckets of a previous load of this dataset do not match the new ones (records are bucketed by position), thus they are replaced
+            self.database.delete_many_tuples(table_name=TableNames.RECORD_BUCKET, filter_dict={Resource.DATASET_: self.execution.current_dataset_gid,
+                                                                                             Resource.ENTITY_TYPE_: f"{self.profile}{TableNames.RECORD}"})
+
+        # b. Create records column by column (instead of cell by cell), and write them in temporary (JSON) files
+        for _ in self.iterate_data():
+            for batch_of_records in self.generate_records(mapping_column_to_feature_id=mapping_column_to_feature_id,
+                                                          hospital_id=mapping_hospital_to_hospital_id[self.execution.hospital_name]):
+                self.records = batch_of_records
+                self.process_batch_of_records()
         # and save the total counts for each column (to compute the percentage of missing values in the profiles)
         all_counts = []  # a list of <"identifier": identifier, "all_counts": all_counts> instead of <identifier: all_counts>
         for k in self.mapping_column_all_count:
@@ -384,21 +324,352 @@ class Transform(Task):
         # log.info(all_counts)
         self.database.insert_many_tuples(table_name=TableNames.COUNTS_FEATURES, tuples=all_counts)
 
+    def load_category_indexes(self) -> None:
+        # categories are indexed as they are stored in the database, i.e., in the Feature created by the first dataset having it
+        features = self.database.find_operation(table_name=TableNames.FEATURE,
+                                                filter_dict={Resource.ENTITY_TYPE_: f"{self.profile}{TableNames.FEATURE}", Feature.CATEGORIES_: {"$exists": 1}},
+                                                projection={Feature.NAME_: 1, Feature.CATEGORIES_: 1})
+        self.mapping_column_to_category_index = {feature[Feature.NAME_]: {Transform.category_key(category=category): index for index, category in enumerate(feature[Feature.CATEGORIES_])}
+                                                 for feature in features}
+
+    @classmethod
+    def category_key(cls, category: dict) -> str:
+        return ujson.dumps(category, sort_keys=True)
+
+    def generate_records(self, mapping_column_to_feature_id: dict, hospital_id: int) -> Iterator[list[dict]]:
+        """
+        Create the JSON records of the data, and yield them by batches of records (of BATCH_SIZE records, or less with a memory budget).
+        Instead of creating one Record instance per cell, we melt the data in a long format (row, column, value)
+        containing only the non-empty cells of columns having a Feature, fairify the values column by column,
+        assign identifiers in bulk, and build the JSON dicts directly.
+        Records (and their identifiers) are produced in the same order as a row-by-row, column-by-column loop.
+        If several workers are asked (NB_WORKERS), shards of rows are transformed in parallel, with the same result.
+
+        :param mapping_column_to_feature_id: the mapping <column name, Feature identifier> for the current profile
+        :param hospital_id: the identifier of the hospital providing the data
+        :return: an iterator over batches of records (as JSON dicts)
+        """
+        if self.profile not in [Profile.PHENOTYPIC, Profile.CLINICAL, Profile.DIAGNOSIS, Profile.GENOMIC, Profile.IMAGING, Profile.MEDICINE]:
+            raise NotImplementedError("Not implemented yet.")
+        columns = self.data.columns
+        nb_rows = len(self.data)
+        is_empty = {column_name: self.data[column_name].eq("").to_numpy() for column_name in columns}
+
+        # 1. count empty cells (of all columns), in the order they would be encountered row by row
+        first_empty_cells = []
+        for column_index, column_name in enumerate(columns):
+            empty_rows = np.flatnonzero(is_empty[column_name])
+            if len(empty_rows) > 0:
+                first_empty_cells.append((empty_rows[0], column_index, column_name, len(empty_rows)))
+        for _, _, column_name, nb_empty_cells in sorted(first_empty_cells):
+            self.quality_stats.count_empty_cell_for_column(column_name=column_name, nb_cells=nb_empty_cells)
+
+        # 2. melt the data: keep the (row, column) positions of non-empty cells in columns having a Feature
+        # columns that have not been converted to a Feature (e.g., ID columns, or columns not described in the metadata) are skipped
+        record_columns = [column_name for column_name in columns if column_name in mapping_column_to_feature_id]
+        if nb_rows == 0 or len(record_columns) == 0:
+            return
+        for column_name in record_columns:
+            # to compute the percentage of missing values in features' profiles, we count empty and non-empty cells
+            feature_id = mapping_column_to_feature_id[column_name]
+            self.mapping_column_all_count[feature_id] = self.mapping_column_all_count.get(feature_id, 0) + nb_rows
+        has_value = self.memory_budget.spill_array(array=np.column_stack([~is_empty[column_name] for column_name in record_columns]))
+        del is_empty
+        nb_records = int(has_value.sum())
+        if nb_records == 0:
+            return
+        feature_ids = [mapping_column_to_feature_id[column_name] for column_name in record_columns]
+
+        # 3. assign identifiers in bulk, and create the records (in worker processes if asked)
+        first_identifier = self.counter.reserve(nb_ids=nb_records)
+        if self.execution.nb_workers > 1 and nb_rows > 1:
+            yield from self.generate_records_in_workers(has_value=has_value, record_columns=record_columns, feature_ids=feature_ids,
+                                                        hospital_id=hospital_id, first_identifier=first_identifier)
+        else:
+            yield from self.build_records(has_value=has_value, record_columns=record_columns, feature_ids=feature_ids,
+                                          hospital_id=hospital_id, first_identifier=first_identifier)
+
+    def generate_records_in_workers(self, has_value: np.ndarray, record_columns: list, feature_ids: list, hospital_id: int,
+                                    first_identifier: int) -> Iterator[list[dict]]:
+        """
+        Split the data in shards of consecutive rows, and create the records of each shard in a pool of worker processes.
+        Each shard receives the range of identifiers it would have used in a single process,
+        thus records (and identifiers) are exactly the same as with build_records(), and yielded in the same order.
+
+        :param has_value: a boolean mask (rows x record columns) telling which cells are non-empty
+        :param record_columns: the columns having a Feature
+        :param feature_ids: the Feature identifier of each record column
+        :param hospital_id: the identifier of the hospital providing the data
+        :param first_identifier: the first of the identifiers reserved for the records of the data
+        :return: an iterator over batches of records (as JSON dicts)
+        """
+        nb_rows = len(self.data)
+        # use several shards per worker to balance the load, while keeping shards of roughly a batch of records
+        nb_shards = min(nb_rows, max(self.execution.nb_workers, int(has_value.sum()) // self.memory_budget.batch_size))
+        shard_bounds = np.linspace(0, nb_rows, num=nb_shards + 1, dtype=int)
+        nb_records_per_row = has_value.sum(axis=1)
+        shards = []  # (first row, last row, first identifier)
+        for shard_start, shard_end in zip(shard_bounds[:-1].tolist(), shard_bounds[1:].tolist()):
+            shards.append((shard_start, shard_end, first_identifier))
+            first_identifier += int(nb_records_per_row[shard_start:shard_end].sum())
+        log.info(f"creating records of {nb_rows} rows in {nb_shards} shards with {self.execution.nb_workers} workers")
+
+        # mappings (types, categories, patient ids, etc.) are sent once to each worker, only shards are sent for each task
+        # we spawn workers (instead of forking) because the ETL may run loader threads
+        with ProcessPoolExecutor(max_workers=self.execution.nb_workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=Transform.init_worker, initargs=(self.get_worker(), locale.setlocale(locale.LC_NUMERIC), OntologyLabelCache.current)) as executor:
+            # at most two shards per worker are submitted ahead, thus the records of the shards that are done but not yet yielded
+            # (because they come after a shard which is still transformed) stay bounded
+            pending_shards = iter(shards)
+            tasks = deque()
+
+            def submit_next_shard() -> None:
+                shard = next(pending_shards, None)
+                if shard is not None:
+                    shard_start, shard_end, shard_first_identifier = shard
+                    tasks.append(executor.submit(Transform.build_records_of_shard, self.data.iloc[shard_start:shard_end], has_value[shard_start:shard_end],
+                                                 shard_first_identifier, record_columns, feature_ids, hospital_id))
+
+            for _ in range(2 * self.execution.nb_workers):
+                submit_next_shard()
+            batch_of_records = []
+            nb_records_in_batch = 0
+            while len(tasks) > 0:
+                records_of_shard, quality_stats_of_shard, cache_counts_of_shard = tasks.popleft().result()  # results are used in the order of shards
+                submit_next_shard()
+                self.quality_stats.merge(other=quality_stats_of_shard)
+                self.value_cache.merge_counts(counts=cache_counts_of_shard)
+                for record in records_of_shard:
+                    batch_of_records.append(record)
+                    # a bucket counts for the records it contains
+                    nb_records_in_batch += len(record[Resource.IDENTIFIER_]) if self.execution.record_layout == RecordLayouts.BUCKETS else 1
+                    if nb_records_in_batch >= self.memory_budget.batch_size:
+                        yield batch_of_records
+                        self.memory_budget.adapt_batch_size()
+                        batch_of_records = []
+                        nb_records_in_batch = 0
+            if len(batch_of_records) > 0:
+                yield batch_of_records
+
+    def get_worker(self) -> "Transform":
+        # a copy of this Transform, without the database connection and the data, to be sent to worker processes
+        worker = copy.copy(self)
+        worker.database = None
+        worker.load_pipeline = None
+        worker.dataset_instance = None  # it references the database
+        worker.shared_patient_ids_mapping = None
+        worker.counter = Counter()  # identifiers are reserved by the main process
+        worker.value_cache = ValueCache(max_size=self.value_cache.max_size)
+        worker.data = None
+        worker.data_chunks = None
+        worker.metadata = None
+        worker.features = []
+        worker.records = []
+        worker.hospitals = []
+        worker.patients = []
+        worker.samples = []
+        return worker
+
+    @classmethod
+    def init_worker(cls, worker: "Transform", locale_name: str, label_cache: OntologyLabelCache) -> None:
+        # executed once in each worker process
+        locale.setlocale(category=locale.LC_NUMERIC, locale=locale_name)
+        OntologyLabelCache.current = label_cache
+        cls.worker = worker
+
+    @classmethod
+    def build_records_of_shard(cls, data: DataFrame, has_value: np.ndarray, first_identifier: int, record_columns: list,
+                               feature_ids: list, hospital_id: int) -> tuple[list[dict], QualityStatistics, dict]:
+        # executed in a worker process: the quality statistics and value cache counts of the shard are sent back to be merged by the main process
+        # the value cache of the worker is kept from one shard to another
+        cls.worker.data = data
+        cls.worker.quality_stats = QualityStatistics(record_stats=cls.worker.quality_stats.record_stats)
+        previous_cache_counts = copy.deepcopy(cls.worker.value_cache.counts)
+        records = []
+        for batch_of_records in cls.worker.build_records(has_value=has_value, record_columns=record_columns, feature_ids=feature_ids,
+                                                         hospital_id=hospital_id, first_identifier=first_identifier):
+            records.extend(batch_of_records)
+        cls.worker.data = None
+        return records, cls.worker.quality_stats, cls.worker.value_cache.get_counts_since(previous_counts=previous_cache_counts)
+
+    def build_records(self, has_value: np.ndarray, record_columns: list, feature_ids: list, hospital_id: int,
+                      first_identifier: int) -> Iterator[list[dict]]:
+        """
+        Create the JSON records of the non-empty cells of the record columns, and yield them by batches of records (see generate_records()).
+        With the bucket layout, the records are built as record buckets, see build_buckets().
+
+        :param has_value: a boolean mask (rows x record columns) telling which cells are non-empty
+        :param record_columns: the columns having a Feature
+        :param feature_ids: the Feature identifier of each record column
+        :param hospital_id: the identifier of the hospital providing the data
+        :param first_identifier: the first of the identifiers reserved for these records
+        :return: an iterator over batches of records (as JSON dicts)
+        """
+        columns = self.data.columns
+        # positions are sorted in row-major order
+        row_indices, column_indices = (self.memory_budget.spill_array(array=indices) for indices in np.nonzero(has_value))
+        nb_records = len(row_indices)
+
+        # 1. fairify (and anonymize) the values column by column
+        fairified_columns = [self.fairify_column(column_name=column_name, values=self.data[column_name].to_numpy(), has_value=has_value[:, i])
+                             for i, column_name in enumerate(record_columns)]
+
+        # 2. compute the row-level fields (patient, and profile-specific fields), only for rows having at least one record
+        row_has_records = has_value.any(axis=1)
+        # get the anonymized patient id using the mapping <initial id, anonymized id>
+        patient_ids = [self.patient_ids_mapping[patient_id] if has_records else None for patient_id, has_records in zip(self.data[self.execution.patient_id_column_name].tolist(), row_has_records)]
+        extra_field = None
+        extra_values = None
+        if self.profile == Profile.CLINICAL and self.execution.sample_id_column_name in columns:
+            # this dataset contains a sample barcode (or equivalent)
+            extra_field = Record.BASE_ID_
+            extra_values = self.data[self.execution.sample_id_column_name].tolist()
+        elif self.profile == Profile.DIAGNOSIS and DiagnosisColumns.DISEASE_COUNTER in columns:
+            # this dataset contains a diagnosis counter because patients may be affected by several diseases
+            # we also need to force the conversion to int, because we read the data as str
+            # and such values do not go through the fairification method
+            extra_field = DiagnosisRecord.DIAGNOSIS_COUNTER_
+            extra_values = [Transform.cast_diagnosis_counter(value=value) if has_records else None for value, has_records in zip(self.data[DiagnosisColumns.DISEASE_COUNTER].tolist(), row_has_records)]
+
+        # 3. build the JSON records, batch by batch
+        if self.execution.record_layout == RecordLayouts.BUCKETS:
+            yield from self.build_buckets(has_value=has_value, fairified_columns=fairified_columns, feature_ids=feature_ids, hospital_id=hospital_id,
+                                          first_identifier=first_identifier, patient_ids=patient_ids, extra_field=extra_field, extra_values=extra_values)
+            return
+        dataset = self.execution.current_dataset_gid
+        entity_type = f"{self.profile}{TableNames.RECORD}"
+        batch_start = 0
+        while batch_start < nb_records:
+            batch_end = min(batch_start + self.memory_budget.batch_size, nb_records)
+            timestamp = self.get_timestamp()
+            batch_of_records = []
+            for identifier, row_index, column_index in zip(range(first_identifier + batch_start, first_identifier + batch_end),
+                                                           row_indices[batch_start:batch_end].tolist(),
+                                                           column_indices[batch_start:batch_end].tolist()):
+                # keys are inserted in the same order as the fields of the Record dataclasses
+                record = {
+                    Resource.IDENTIFIER_: identifier,
+                    Resource.TIMESTAMP_: timestamp,
+                    Record.SUBJECT_: patient_ids[row_index],
+                    Record.REG_BY_: hospital_id,
+                    Record.INSTANTIATES_: feature_ids[column_index],
+                    Record.VALUE_: fairified_columns[column_index][row_index]
+                }
+                if dataset is not None:
+                    record[Resource.DATASET_] = dataset
+                if extra_field is not None and extra_values[row_index] is not None:
+                    record[extra_field] = extra_values[row_index]
+                record[Resource.ENTITY_TYPE_] = entity_type
+                batch_of_records.append(record)
+            yield batch_of_records
+            self.memory_budget.adapt_batch_size()
+            batch_start = batch_end
+
+    def build_buckets(self, has_value: np.ndarray, fairified_columns: list, feature_ids: list, hospital_id: int, first_identifier: int,
+                      patient_ids: list, extra_field: str | None, extra_values: list | None) -> Iterator[list[dict]]:
+        """
+        Create the record buckets of the non-empty cells, column by column, and yield them by batches of about a batch of records.
+        Each bucket contains at most BUCKET_SIZE records of a single column, and its records have the identifiers they have with the document layout.
+
+        :param has_value: a boolean mask (rows x record columns) telling which cells are non-empty
+        :param fairified_columns: the JSON values of each record column, with None for empty cells
+        :param feature_ids: the Feature identifier of each record column
+        :param hospital_id: the identifier of the hospital providing the data
+        :param first_identifier: the first of the identifiers reserved for these records
+        :param patient_ids: the anonymized patient id of each row
+        :param extra_field: the profile-specific field of records (e.g., base_id), if any
+        :param extra_values: the value of the profile-specific field for each row
+        :return: an iterator over batches of record buckets (as JSON dicts)
+        """
+        # identifiers are given in the row-by-row order, as in build_records()
+        row_indices, column_indices = np.nonzero(has_value)
+        cell_identifiers = np.zeros(has_value.shape, dtype=np.int64)
+        cell_identifiers[row_indices, column_indices] = np.arange(first_identifier, first_identifier + len(row_indices))
+        cell_identifiers = self.memory_budget.spill_array(array=cell_identifiers)
+        del row_indices, column_indices
+        dataset = self.execution.current_dataset_gid
+        entity_type = f"{self.profile}{TableNames.RECORD}"
+        timestamp = self.get_timestamp()
+        batch_of_buckets = []
+        nb_records_in_batch = 0
+        for column_index, feature_id in enumerate(feature_ids):
+            rows = np.flatnonzero(has_value[:, column_index])
+            identifiers = cell_identifiers[rows, column_index].tolist()
+            rows = rows.tolist()
+            for bucket_start in range(0, len(rows), RecordBuckets.BUCKET_SIZE):
+                bucket_rows = rows[bucket_start:bucket_start + RecordBuckets.BUCKET_SIZE]
+                bucket_identifiers = identifiers[bucket_start:bucket_start + RecordBuckets.BUCKET_SIZE]
+                # keys are inserted in the same order as in records
+                bucket = {
+                    Resource.IDENTIFIER_: bucket_identifiers,
+                    Resource.TIMESTAMP_: timestamp,
+                    Record.SUBJECT_: [patient_ids[row_index] for row_index in bucket_rows],
+                    Record.REG_BY_: hospital_id,
+                    Record.INSTANTIATES_: feature_id,
+                    Record.VALUE_: [fairified_columns[column_index][row_index] for row_index in bucket_rows]
+                }
+                if dataset is not None:
+                    bucket[Resource.DATASET_] = dataset
+                if extra_field is not None:
+                    bucket_extra_values = [extra_values[row_index] for row_index in bucket_rows]
+                    if any(extra_value is not None for extra_value in bucket_extra_values):
+                        bucket[extra_field] = bucket_extra_values
+                bucket[Resource.ENTITY_TYPE_] = entity_type
+                bucket[RecordBuckets.BUCKET_ID_] = bucket_identifiers[0]
+                batch_of_buckets.append(bucket)
+                nb_records_in_batch += len(bucket_identifiers)
+                if nb_records_in_batch >= self.memory_budget.batch_size:
+                    yield batch_of_buckets
+                    self.memory_budget.adapt_batch_size()
+                    batch_of_buckets = []
+                    nb_records_in_batch = 0
+                    timestamp = self.get_timestamp()
+        if len(batch_of_buckets) > 0:
+            yield batch_of_buckets
+
+    def get_timestamp(self) -> Any:
+        # the creation date of records, loaded directly in the database or written in JSON files
+        if self.execution.direct_load:
+            return Operators.from_datetime_to_bson_date(current_datetime=datetime.now())
+        else:
+            return Operators.from_datetime_to_isodate(current_datetime=datetime.now())
+
     ##############################################################
     # OTHER ENTITIES
     ##############################################################
 
     def create_patients(self) -> None:
         log.info(f"create Patient instances in memory")
-        log.info(self.execution.patient_id_column_name)
-        if self.execution.patient_id_column_name not in self.data.columns:
-            # no patient ID in this dataset
-            log.error(f"The column {self.execution.patient_id_column_name} has been declared as the patient id but has not been found in the data. Creating automatically patient IDs.")
-            pids = [i for i in range(1, len(self.data)+1)]
-            self.data[self.execution.patient_id_column_name] = pids
+        log.info(f"creating patients using column {self.execution.patient_id_column_name}")
+        # anonymized patient ids of previous executions should not be given to new resources
+        if len(self.patient_ids_mapping) > 0:
+            self.counter.skip_until(identifier=max(self.patient_ids_mapping.values()))
+        for _ in self.iterate_data():
+            self.create_patients_of_data()
+        if len(self.patients) > 0:
+            self.process_batch_of_patients()
+        # finally, we also write the mapping patient ID / anonymized ID in a file - this will be ingested for subsequent runs to not renumber existing anonymized patients
+        # (the shared mapping is written by the main process once all the datasets are transformed)
+        if self.shared_patient_ids_mapping is None:
+            Transform.save_patient_id_mapping(patient_ids_mapping=self.patient_ids_mapping, filepath=self.execution.anonymized_patient_ids_filepath)
+        self.database.load_json_in_table(table_name=TableNames.PATIENT, unique_variables=[Resource.IDENTIFIER_], dataset_id=self.dataset_id)
 
+    def create_patients_of_data(self) -> None:
+        # the patients of the data (or of the current chunk of the data)
         columns = self.data.columns
-        log.info(f"creating patients using column {self.execution.patient_id_column_name}")
+        new_patient_ids = [patient_id for patient_id in pd.unique(self.data[self.execution.patient_id_column_name]) if patient_id != "" and patient_id not in self.patient_ids_mapping]
+        if self.shared_patient_ids_mapping is not None and len(new_patient_ids) > 0:
+            # other workers may have created some of these patients since the mapping has been loaded
+            self.patient_ids_mapping.update(self.shared_patient_ids_mapping.get_identifiers(patient_ids=new_patient_ids))
+            new_patient_ids = [patient_id for patient_id in new_patient_ids if patient_id not in self.patient_ids_mapping]
+        # reserve the identifiers of all new patients at once, they are given in the order patients appear in the data
+        if len(new_patient_ids) > 0:
+            first_identifier = self.counter.reserve(nb_ids=len(new_patient_ids))
+            new_patient_identifiers = dict(zip(new_patient_ids, range(first_identifier, first_identifier + len(new_patient_ids))))
+            if self.shared_patient_ids_mapping is not None:
+                # a worker creating the same patients at the same time may have allocated them first, we take its identifiers
+                new_patient_identifiers = self.shared_patient_ids_mapping.allocate(identifiers=new_patient_identifiers)
+            self.patient_ids_mapping.update(new_patient_identifiers)  # keep track of anonymized patient ids
         for row in self.data.itertuples(index=False):
             row_patient_id = row[columns.get_loc(self.execution.patient_id_column_name)]
             if row_patient_id == "":
@@ -406,15 +677,9 @@ class Transform(Task):
                 # thus, we skip it
                 pass
             else:
-                if row_patient_id not in self.patient_ids_mapping:
-                    # the (anonymized) patient does not exist yet, we will create it
-                    new_patient = Patient(identifier=NO_ID, counter=self.counter)
-                    # log.info(f"create new patient {row_patient_id} with anonymized ID {new_patient.identifier.value}")
-                    self.patient_ids_mapping[row_patient_id] = new_patient.identifier  # keep track of anonymized patient ids
-                else:
-                    # the (anonymized) patient id already exists, we take it from the mapping
-                    # log.info(f"create patient {row_patient_id} with existing anonymized ID {self.patient_ids_mapping[row_patient_id]}")
-                    new_patient = Patient(identifier=self.patient_ids_mapping[row_patient_id], counter=self.counter)
+                # the (anonymized) patient id is in the mapping, either because it already existed or because it has been allocated above
+                # log.info(f"create patient {row_patient_id} with anonymized ID {self.patient_ids_mapping[row_patient_id]}")
+                new_patient = Patient(identifier=self.patient_ids_mapping[row_patient_id], counter=self.counter)
                 self.patients.append(new_patient.to_json())
 
                 self.time_statistics.start(dataset=self.dataset_instance.global_identifier, key=TimerKeys.CHECK_BATCH_SIZE_PATIENTS)
@@ -422,16 +687,20 @@ class Transform(Task):
                     self.process_batch_of_patients()
                 # no need to load Patient instances because they are referenced using their ID,
                 # which was provided by the hospital (thus is known by the dataset)
-        if len(self.patients) > 0:
-            self.process_batch_of_patients()
-        # finally, we also write the mapping patient ID / anonymized ID in a file - this will be ingested for subsequent runs to not renumber existing anonymized patients
-        with open(self.execution.anonymized_patient_ids_filepath, "w") as data_file:
-            try:
-                ujson.dump(self.patient_ids_mapping, data_file)
-            except Exception:
-                raise ValueError(
-                    f"Could not dump the {len(self.patient_ids_mapping)} JSON resources in the file located at {self.execution.anonymized_patient_ids_filepath}.")
-        self.database.load_json_in_table(table_name=TableNames.PATIENT, unique_variables=[Resource.IDENTIFIER_], dataset_id=self.dataset_id)
+
+    def iterate_data(self) -> Iterator[DataFrame]:
+        # the data at once, or chunk by chunk if it is streamed (each chunk being in self.data while it is processed)
+        chunks = [self.data] if self.data_chunks is None else self.data_chunks()
+        first_row = 0
+        for chunk in chunks:
+            self.data = chunk
+            if self.execution.patient_id_column_name not in self.data.columns:
+                # no patient ID in this dataset
+                log.error(f"The column {self.execution.patient_id_column_name} has been declared as the patient id but has not been found in the data. Creating automatically patient IDs.")
+                pids = [i for i in range(first_row + 1, first_row + len(self.data) + 1)]
+                self.data[self.execution.patient_id_column_name] = pids
+            first_row += len(self.data)
+            yield self.data
 
     ##############################################################
     # UTILITIES
@@ -458,26 +727,67 @@ class Transform(Task):
         self.features.clear()
 
     def process_batch_of_records(self) -> None:
-        log.info(f"writing {len(self.records)} records in file")
-        write_in_file(resource_list=self.records,
-                      current_working_dir=self.execution.working_dir_current,
-                      table_name=TableNames.RECORD,
-                      is_feature=False,
-                      dataset_id=self.dataset_id,
-                      to_json=False)
-        self.records.clear()
+        table_name, unique_variables = Load.get_record_table(execution=self.execution, profile=self.profile)
+        if self.execution.direct_load:
+            # records are typed Python dicts, we stream them to the database without going through files
+            if self.execution.audit_files:
+                # for audit purposes, we still keep the records in files, with dates written as in the JSON files
+                write_in_file(resource_list=[factory(record.items()) for record in self.records],
+                              current_working_dir=self.execution.working_dir_current,
+                              table_name=table_name,
+                              is_feature=False,
+                              dataset_id=self.dataset_id,
+                              to_json=False)
+            if self.load_pipeline is not None:
+                # loader threads will load this batch while we create the next one
+                log.info(f"queuing {len(self.records)} records to be loaded in the database")
+                self.load_pipeline.put_batch(dataset=self.dataset_instance.global_identifier if self.dataset_instance is not None else None,
+                                             table_name=table_name,
+                                             unique_variables=unique_variables,
+                                             tuples=self.records)
+            else:
+                log.info(f"loading {len(self.records)} records in the database")
+                self.database.load_tuples_in_table(table_name=table_name,
+                                                   unique_variables=unique_variables,
+                                                   tuples=self.records, ordered=False)
+        else:
+            log.info(f"writing {len(self.records)} records in file")
+            write_in_file(resource_list=self.records,
+                          current_working_dir=self.execution.working_dir_current,
+                          table_name=table_name,
+                          is_feature=False,
+                          dataset_id=self.dataset_id,
+                          to_json=False)
+        # the batch may still be in the load queue, so we do not clear it but start a new one
+        self.records = []
 
     def load_patient_id_mapping(self) -> None:
         log.info(f"Patient ID mapping filepath is {self.execution.anonymized_patient_ids_filepath}")
 
         # index_col is False to not add a column with line numbers
-        self.patient_ids_mapping = {}
         log.debug(self.execution.anonymized_patient_ids_filepath)
-        if self.execution.anonymized_patient_ids_filepath is not None:
-            with open(self.execution.anonymized_patient_ids_filepath, "r") as f:
-                self.patient_ids_mapping = ujson.load(f)
+        if self.shared_patient_ids_mapping is not None:
+            # the mapping of the file, with the patients created by the workers so far
+            self.patient_ids_mapping = self.shared_patient_ids_mapping.get_mapping()
+        else:
+            self.patient_ids_mapping = Transform.read_patient_id_mapping(filepath=self.execution.anonymized_patient_ids_filepath)
         log.info(f"{len(self.patient_ids_mapping)} patient IDs in the mapping file.")
 
+    @classmethod
+    def read_patient_id_mapping(cls, filepath: str | None) -> dict:
+        if filepath is not None:
+            with open(filepath, "r") as f:
+                return ujson.load(f)
+        return {}
+
+    @classmethod
+    def save_patient_id_mapping(cls, patient_ids_mapping: dict, filepath: str) -> None:
+        with open(filepath, "w") as data_file:
+            try:
+                ujson.dump(patient_ids_mapping, data_file)
+            except Exception:
+                raise ValueError(f"Could not dump the {len(patient_ids_mapping)} JSON resources in the file located at {filepath}.")
+
     def create_ontology_resource_from_row(self, column_name: str) -> OntologyResource | None:
         rows = self.metadata[self.metadata[MetadataColumns.COLUMN_NAME].values == column_name]
         if len(rows) == 1:
@@ -604,6 +914,208 @@ class Transform(Task):
             # log.info(f"Column '{column_name}': fairify {type(value).__name__} value '{value}' (unit: {expected_unit}) into {type(return_value).__name__}: {return_value}")
             return return_value
 
+    def fairify_column(self, column_name: str, values: np.ndarray, has_value: np.ndarray) -> list:
+        """
+        Fairify and anonymize the (non-empty) values of a column, and convert them to their JSON representation.
+        Each distinct value is fairified once, and the record values of the column are cached for the next data chunks or shards.
+
+        :param column_name: the name of the column
+        :param values: the (normalized) values of the column
+        :param has_value: a boolean mask telling which cells are non-empty
+        :return: the list of JSON values, with None for empty cells
+        """
+        etl_type = self.mapping_column_to_type[column_name] if column_name in self.mapping_column_to_type else DataTypes.STRING
+        visibility = self.mapping_column_to_visibility[column_name] if column_name in self.mapping_column_to_visibility else Visibility.PRIVATE
+        # only date(time)s with an anonymized visibility need to be anonymized
+        to_anonymize = etl_type in [DataTypes.DATE, DataTypes.DATETIME] and visibility == Visibility.ANONYMIZED
+        # values loaded directly in the database keep native types (e.g., datetime), others are written as JSON in files
+        to_record_value = Transform.value_to_bson if self.execution.direct_load else Transform.value_to_json
+        # compact values: categories are replaced by their index (if the category, with its label, is one of the Feature)
+        category_index = self.mapping_column_to_category_index.get(column_name, None)
+
+        def compute_record_values(raw_values: list) -> list:
+            record_values = []
+            for fairified_value in self.fairify_values(column_name=column_name, values=pd.Series(raw_values, dtype=object)):
+                if to_anonymize:
+                    fairified_value, _ = self.anonymize_value(column_name=column_name, fairified_value=fairified_value)
+                record_value = to_record_value(value=fairified_value)
+                if category_index is not None and isinstance(record_value, dict):
+                    record_value = category_index.get(Transform.category_key(category=record_value), record_value)
+                record_values.append(record_value)
+            return record_values
+
+        json_values = [None] * len(values)
+        row_indices = np.flatnonzero(has_value)
+        record_values = self.value_cache.map_values(column_name=column_name, values=values[row_indices], compute=compute_record_values,
+                                                    variant=(self.execution.direct_load, self.execution.value_encoding))
+        for row_index, record_value in zip(row_indices.tolist(), record_values):
+            json_values[row_index] = record_value
+        return json_values
+
+    def fairify_values(self, column_name: str, values: pd.Series) -> list:
+        """
+        Column-wise equivalent of fairify_value: the ETL type, unit and categories of the column are resolved once,
+        and (string) values are cast with a few vectorized passes instead of one fairify_value call per cell.
+        Explicit NaN values are kept as such, and non-string values go through fairify_value.
+
+        :param column_name: the name of the column
+        :param values: the (normalized) non-empty values of the column
+        :return: the list of fairified values
+        """
+        etl_type = self.mapping_column_to_type[column_name] if column_name in self.mapping_column_to_type else DataTypes.STRING
+        fairified_values = [DEFAULT_NAN_VALUE] * len(values)
+        is_null = values.isna().to_numpy()
+        is_str = np.fromiter((isinstance(value, str) for value in values), dtype=bool, count=len(values))
+        for i in np.flatnonzero(~is_null & ~is_str).tolist():
+            fairified_values[i] = self.fairify_value(column_name=column_name, value=values.iloc[i])
+        str_indices = np.flatnonzero(~is_null & is_str)
+        if len(str_indices) == 0:
+            return fairified_values
+        str_values = values.iloc[str_indices].reset_index(drop=True)
+
+        if etl_type == DataTypes.STRING:
+            # the value is already normalized, we can return it as is
+            cast_values, cast_types = str_values, None
+        elif etl_type == DataTypes.LIST:
+            cast_values = pd.Series([[elem.strip() for elem in value.split(",")] for value in str_values], dtype=object)  # trim spaces around each str value
+            cast_types = None
+        elif etl_type == DataTypes.CATEGORY:
+            cast_values, cast_types = self.fairify_categorical_values(column_name=column_name, values=str_values)
+        elif etl_type == DataTypes.DATETIME or etl_type == DataTypes.DATE:
+            cast_values, cast_types = self.fairify_datetime_values(values=str_values)
+        elif etl_type == DataTypes.BOOLEAN:
+            cast_values, cast_types = self.fairify_boolean_values(column_name=column_name, values=str_values)
+        elif (etl_type == DataTypes.INTEGER or etl_type == DataTypes.FLOAT) and column_name != self.execution.patient_id_column_name:
+            cast_values, cast_types = self.fairify_numeric_values(column_name=column_name, etl_type=etl_type, values=str_values)
+        else:
+            # API values, (int-like) patient identifiers and unhandled ETL types are fairified value by value
+            for i in str_indices.tolist():
+                fairified_values[i] = self.fairify_value(column_name=column_name, value=values.iloc[i])
+            return fairified_values
+
+        # count how many fairified values do not (still) match the expected ETL type
+        expected_type = {DataTypes.BOOLEAN: "bool", DataTypes.FLOAT: "float", DataTypes.INTEGER: "int",
+                         DataTypes.DATE: "datetime", DataTypes.DATETIME: "datetime", DataTypes.STRING: "str",
+                         DataTypes.CATEGORY: OntologyResource.__name__}
+        if etl_type in expected_type:
+            if cast_types is None:
+                cast_types = pd.Series("str", index=str_values.index)
+            for typeof_type in cast_types[cast_types != expected_type[etl_type]].unique():
+                self.quality_stats.add_column_with_unmatched_typeof_etl_types(column_name=column_name,
+                                                                              typeof_type=typeof_type,
+                                                                              etl_type=etl_type)
+        for i, cast_value in zip(str_indices.tolist(), cast_values.tolist()):
+            fairified_values[i] = cast_value
+        return fairified_values
+
+    def fairify_categorical_values(self, column_name: str, values: pd.Series) -> tuple:
+        # we look for the CC associated to each categorical value, with a single dict map on the column
+        categories = self.mapping_column_to_categorical_value[column_name] if column_name in self.mapping_column_to_categorical_value else {}
+        is_known = values.isin(list(categories.keys()))
+        cast_values = values.copy()
+        cast_values[is_known] = values[is_known].map(categories)
+        # no categorical value for the other values, we keep the normalized value
+        for unknown_value in values[~is_known].unique():
+            self.quality_stats.add_unknown_categorical_value(column_name=column_name, categorical_value=unknown_value)
+        cast_types = pd.Series("str", index=values.index)
+        cast_types[is_known] = values[is_known].map({key: type(category).__name__ for key, category in categories.items()})
+        return cast_values, cast_types
+
+    def fairify_datetime_values(self, values: pd.Series) -> tuple:
+        # (naive) ISO dates and datetimes are parsed at once by Pandas (the normalization put the T separator in lower case),
+        # and dateutil is used only for the other values (including ISO-like values that Pandas could not parse)
+        cast_values = [None] * len(values)
+        is_iso = values.str.fullmatch(PATTERN_ISO_DATETIME).to_numpy(dtype=bool)
+        if is_iso.any():
+            iso_datetimes = pd.to_datetime(values[is_iso].str.upper(), format="ISO8601", errors="coerce")
+            for i, iso_datetime in zip(np.flatnonzero(is_iso).tolist(), iso_datetimes.array.to_pydatetime()):
+                cast_values[i] = None if pd.isnull(iso_datetime) else iso_datetime
+        for i, value in enumerate(values):
+            if cast_values[i] is None:
+                cast_values[i] = cast_str_to_datetime(str_value=value)
+        # in case, casting the value returned None, we set the normalized value back
+        is_cast = np.array([cast_value is not None for cast_value in cast_values], dtype=bool)
+        cast_values = [cast_value if cast_value is not None else value for cast_value, value in zip(cast_values, values)]
+        return pd.Series(cast_values, index=values.index, dtype=object), pd.Series(np.where(is_cast, "datetime", "str"), index=values.index)
+
+    def fairify_boolean_values(self, column_name: str, values: pd.Series) -> tuple:
+        # booleans have few distinct values, thus we cast each of them once and map the column with the result
+        mapping_value_to_boolean = {}
+        for value in values.unique():
+            boolean_value = cast_str_to_boolean(str_value="1" if value == "1.0" else "0" if value == "0.0" else value)
+            if boolean_value is None:
+                self.quality_stats.add_unknown_boolean_value(column_name=column_name, boolean_value=value)
+                mapping_value_to_boolean[value] = value
+            else:
+                mapping_value_to_boolean[value] = boolean_value
+        cast_values = values.map(mapping_value_to_boolean).astype(object)
+        cast_types = values.map({value: type(boolean_value).__name__ for value, boolean_value in mapping_value_to_boolean.items()})
+        return cast_values, cast_types
+
+    def fairify_numeric_values(self, column_name: str, etl_type: str, values: pd.Series) -> tuple:
+        expected_unit = self.mapping_column_to_unit[column_name] if column_name in self.mapping_column_to_unit else None  # there was some unit specified in the metadata or extracted from the data
+        # split values of the form "value unit" (group 0 is the int/float value, group 1 is the unit)
+        value_units = values.str.extract(PATTERN_VALUE_UNIT)
+        has_unit = value_units[0].notna()
+        has_unmatched_unit = has_unit & (value_units[1] != expected_unit)
+        unmatched_units = pd.DataFrame({"value": values[has_unmatched_unit], "unit": value_units[1][has_unmatched_unit]}).drop_duplicates()
+        for value, unit in unmatched_units.itertuples(index=False):
+            # the feature unit does not correspond, we keep the normalized (string) value
+            self.quality_stats.add_numerical_value_with_unmatched_unit(column_name=column_name,
+                                                                       expected_unit=expected_unit,
+                                                                       current_unit=unit,
+                                                                       value=value)
+        # values without a unit (or which are not of the form "value unit") are cast as is
+        numeric_values = value_units[0].where(has_unit, values)
+        to_cast = ~has_unmatched_unit
+        cast_values = pd.Series([None] * len(values), index=values.index, dtype=object)
+        if etl_type == DataTypes.INTEGER:
+            is_plain = to_cast & numeric_values.str.fullmatch(PATTERN_INTEGER)
+            cast_values[is_plain] = pd.Series(numeric_values[is_plain].astype("int64").tolist(), index=numeric_values[is_plain].index, dtype=object)
+            cast_method = cast_str_to_int
+        else:
+            # locale.atof is equivalent to float() for plain values only if the locale does not use "." as a thousands separator
+            # (and we do not use pd.to_numeric, which may round differently than float())
+            conventions = locale.localeconv()
+            if conventions["decimal_point"] == "." and re.fullmatch(r"[^0-9.-]*", conventions["thousands_sep"]) is not None:
+                is_plain = to_cast & numeric_values.str.fullmatch(PATTERN_FLOAT)
+            else:
+                is_plain = pd.Series(False, index=values.index)
+            cast_values[is_plain] = pd.Series(numeric_values[is_plain].astype(float).tolist(), index=numeric_values[is_plain].index, dtype=object)
+            cast_method = cast_str_to_float
+        for i in np.flatnonzero((to_cast & ~is_plain).to_numpy()).tolist():
+            cast_values.iat[i] = cast_method(str_value=numeric_values.iat[i])
+        # in case, casting the value returned None, we set the normalized value back
+        is_cast = pd.Series([cast_value is not None for cast_value in cast_values], index=values.index, dtype=bool)
+        cast_values[~is_cast] = values[~is_cast]
+        return cast_values, pd.Series(np.where(is_cast, "int" if etl_type == DataTypes.INTEGER else "float", "str"), index=values.index)
+
+    @classmethod
+    def cast_diagnosis_counter(cls, value: Any) -> int | None:
+        try:
+            return int(value)
+        except:
+            # the value is None because the patient diseases is unknown in the disease classification
+            return None
+
+    @classmethod
+    def value_to_json(cls, value: Any) -> Any:
+        # same conversion as the one applied by to_json() (with the factory) on the value field of a Record
+        if isinstance(value, OntologyResource):
+            return value.to_json()
+        elif isinstance(value, (datetime, date, time)):
+            return Operators.from_datetime_to_isodate(current_datetime=value)
+        else:
+            return value
+
+    @classmethod
+    def value_to_bson(cls, value: Any) -> Any:
+        # same as value_to_json, but dates are kept as (naive, UTC) datetime objects, with the same precision as in JSON files
+        if isinstance(value, (datetime, date, time)):
+            return Operators.from_datetime_to_bson_date(current_datetime=value)
+        else:
+            return Transform.value_to_json(value=value)
+
     def anonymize_value(self, column_name: str, fairified_value: Any) -> tuple:
         """
 
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+
+from statistics.TimeStatistics import TimeStatistics
+
+
+class ValueCache:
+    """
+    Memoize the values computed column by column (e.g., normalized values, or fairified and anonymized values), keyed by (column, raw value).
+    Each column has an LRU cache of at most max_size (str) values, and each distinct value is computed once per call.
+    Columns with many distinct values (e.g., identifiers or free text) do not benefit from the cache: once MIN_LOOKUPS values of a column
+    have been looked up, the cache of that column is turned off if more than MAX_DISTINCT_RATIO of them had to be computed.
+    """
+
+    MIN_LOOKUPS = 1000
+    MAX_DISTINCT_RATIO = 0.5
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.caches = {}  # { (column name, variant): OrderedDict { raw value: computed value } }, the most recently used values being at the end
+        self.disabled_columns = set()
+        self.counts = {}  # { column name: [number of looked up values, number of values which have not been found in the cache] }
+
+    def map_values(self, column_name: str, values: np.ndarray, compute: Callable[[list], list], variant: Any = None) -> list:
+        """
+        Get the computed value of each value, from the cache of the column or by computing the missing (distinct) ones.
+
+        :param column_name: the name of the column
+        :param values: the raw values of the column
+        :param compute: the function computing the list of values of a list of (distinct) raw values
+        :param variant: what else the computed values depend on (e.g., their representation), values of different variants being cached separately
+        :return: the list of computed values, in the order of the raw values
+        """
+        if self.max_size <= 0 or column_name in self.disabled_columns:
+            return compute(values.tolist())
+        codes, unique_values = pd.factorize(values, use_na_sentinel=False)
+        unique_values = unique_values.tolist()
+        cache = self.caches.setdefault((column_name, variant), OrderedDict())
+        unique_results = np.empty(len(unique_values), dtype=object)
+        missing_indices = []
+        for i, value in enumerate(unique_values):
+            # only str values are cached, because other values may be equal to values of another type (e.g., 1 and True)
+            if isinstance(value, str) and value in cache:
+                cache.move_to_end(value)
+                unique_results[i] = cache[value]
+            else:
+                missing_indices.append(i)
+        if len(missing_indices) > 0:
+            computed_values = compute([unique_values[i] for i in missing_indices])
+            for i, computed_value in zip(missing_indices, computed_values):
+                unique_results[i] = computed_value
+                if isinstance(unique_values[i], str):
+                    cache[unique_values[i]] = computed_value
+            while len(cache) > self.max_size:
+                cache.popitem(last=False)
+        self.count(column_name=column_name, nb_lookups=len(values), nb_computed=len(missing_indices))
+        return unique_results[codes].tolist()
+
+    def count(self, column_name: str, nb_lookups: int, nb_computed: int) -> None:
+        counts = self.counts.setdefault(column_name, [0, 0])
+        counts[0] += nb_lookups
+        counts[1] += nb_computed
+        if counts[0] >= ValueCache.MIN_LOOKUPS and counts[1] > ValueCache.MAX_DISTINCT_RATIO * counts[0]:
+            # high-cardinality column: caching its values costs more than it saves
+            self.disabled_columns.add(column_name)
+            for key in [key for key in self.caches if key[0] == column_name]:
+                self.caches.pop(key)
+
+    def get_counts_since(self, previous_counts: dict) -> dict:
+        # the counts of the lookups done since the given (copy of the) counts
+        return {column_name: [counts[0] - previous_counts.get(column_name, [0, 0])[0], counts[1] - previous_counts.get(column_name, [0, 0])[1]]
+                for column_name, counts in self.counts.items()}
+
+    def merge_counts(self, counts: dict) -> None:
+        # the counts of a cache used in another process (e.g., by a Transform worker)
+        for column_name, (nb_lookups, nb_computed) in counts.items():
+            column_counts = self.counts.setdefault(column_name, [0, 0])
+            column_counts[0] += nb_lookups
+            column_counts[1] += nb_computed
+
+    def report(self, time_stats: TimeStatistics, dataset: str | None, key: str) -> None:
+        for column_name, (nb_lookups, nb_computed) in self.counts.items():
+            time_stats.count_cache_lookups(nb_lookups=nb_lookups, nb_hits=nb_lookups - nb_computed, disabled=column_name in self.disabled_columns,
+                                           dataset=dataset, key=key, column_name=column_name)
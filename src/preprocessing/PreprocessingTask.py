@@ -17,6 +17,17 @@ class PreprocessingTask:
         self.metadata = metadata
         self.profile = profile
 
+    @classmethod
+    def preprocesses(cls, hospital_name: str) -> bool:
+        # whether the data of the hospital is pre-processed (otherwise, it is given as is to the ETL)
+        return hospital_name in [HospitalNames.IT_BUZZI_UC1, HospitalNames.EXPES_COVID, HospitalNames.EXPES_KIDNEY, HospitalNames.RS_IMGGE, HospitalNames.ES_HSJD]
+
+    @classmethod
+    def is_row_wise(cls, hospital_name: str) -> bool:
+        # whether the pre-processing of a row does not depend on the other rows, thus can be applied on chunks of the data
+        # (the kidney pre-processing computes the last sample of each individual)
+        return hospital_name != HospitalNames.EXPES_KIDNEY
+
     def run(self):
         if self.execution.hospital_name == HospitalNames.IT_BUZZI_UC1:
             pp = PreprocessBuzziUC1(execution=self.execution, data=self.data, profile=self.profile)
@@ -1,3 +1,4 @@
+import copy
 import dataclasses
 
 from statistics.Statistics import Statistics
@@ -16,6 +17,9 @@ class QualityStatistics(Statistics):
     data_columns_not_in_metadata: list = dataclasses.field(default_factory=list)  # list of data columns that are "removed" because not part of the metadata
     empty_cells_per_column: dict = dataclasses.field(default_factory=dict)  # { "column_name": X }
     failed_api_calls: dict = dataclasses.field(default_factory=dict)  # { "ontology/id_code": api_error, ... }
+    label_cache_lookups: dict = dataclasses.field(default_factory=dict)  # { "hits": X, "misses": Y } for the ontology label cache
+    duplicated_tuples: dict = dataclasses.field(default_factory=dict)  # { table_name: X } tuples removed by the validation pass of the fast initial load
+    obsolete_tuples: dict = dataclasses.field(default_factory=dict)  # { table_name: X } tuples removed by the diff load because they are not in the files anymore
     unknown_categorical_values: dict = dataclasses.field(default_factory=dict)  # { column_name: [ set of unknown categorical values ], ... }
     unknown_boolean_values: dict = dataclasses.field(default_factory=dict)  # { column_name: [ set of unknown categorical boolean values ], ... }
     numerical_values_unmatched_unit: dict = dataclasses.field(default_factory=dict)  # { column_name: { value: { "expected_dim": exp_dim, "current_unit": curr_unit }, ... }, ... }
@@ -64,16 +68,21 @@ class QualityStatistics(Statistics):
         if self.record_stats and data_column_name not in self.data_columns_not_in_metadata:
             self.data_columns_not_in_metadata.append(data_column_name)
 
-    def count_empty_cell_for_column(self, column_name: str) -> None:
+    def count_empty_cell_for_column(self, column_name: str, nb_cells: int = 1) -> None:
         if column_name not in self.empty_cells_per_column:
-            self.empty_cells_per_column[column_name] = 1
+            self.empty_cells_per_column[column_name] = nb_cells
         else:
-            self.empty_cells_per_column[column_name] += 1
+            self.empty_cells_per_column[column_name] += nb_cells
 
     def add_failed_api_call(self, system: str, code: str, api_error: str):
         if self.record_stats and f"{system}/{code}" not in self.failed_api_calls:
             self.failed_api_calls[f"{system}/{code}"] = api_error
 
+    def count_label_cache_lookup(self, hit: bool) -> None:
+        if self.record_stats:
+            key = "hits" if hit else "misses"
+            self.label_cache_lookups[key] = self.label_cache_lookups.get(key, 0) + 1
+
     def add_unknown_categorical_value(self, column_name: str, categorical_value: str):
         if self.record_stats:
             if column_name not in self.unknown_categorical_values:
@@ -104,3 +113,40 @@ class QualityStatistics(Statistics):
                 self.non_numeric_values_with_unit[column_name] = {}
             if value not in self.non_numeric_values_with_unit[column_name]:
                 self.non_numeric_values_with_unit[column_name][value] = unit
+
+    def count_duplicated_tuples(self, table_name: str, nb_tuples: int):
+        if self.record_stats:
+            self.duplicated_tuples[table_name] = self.duplicated_tuples.get(table_name, 0) + nb_tuples
+
+    def count_obsolete_tuples(self, table_name: str, nb_tuples: int):
+        if self.record_stats:
+            self.obsolete_tuples[table_name] = self.obsolete_tuples.get(table_name, 0) + nb_tuples
+
+    def merge(self, other: "QualityStatistics") -> None:
+        # add the statistics computed elsewhere (e.g., in a worker process), as if they had been computed here after the current ones
+        if self.record_stats:
+            for field in dataclasses.fields(self):
+                if field.name not in ["record_stats", "timestamp", "empty_cells_per_column", "label_cache_lookups", "duplicated_tuples", "obsolete_tuples"]:
+                    QualityStatistics.merge_values(current=getattr(self, field.name), other=getattr(other, field.name))
+            for key, nb_lookups in other.label_cache_lookups.items():
+                self.label_cache_lookups[key] = self.label_cache_lookups.get(key, 0) + nb_lookups
+            for table_name, nb_tuples in other.duplicated_tuples.items():
+                self.count_duplicated_tuples(table_name=table_name, nb_tuples=nb_tuples)
+            for table_name, nb_tuples in other.obsolete_tuples.items():
+                self.count_obsolete_tuples(table_name=table_name, nb_tuples=nb_tuples)
+        for column_name, nb_cells in other.empty_cells_per_column.items():
+            self.count_empty_cell_for_column(column_name=column_name, nb_cells=nb_cells)
+
+    @classmethod
+    def merge_values(cls, current: list | dict, other: list | dict) -> None:
+        # lists are sets of values, and in dicts, the first recorded value of a key is kept
+        if isinstance(current, list):
+            for value in other:
+                if value not in current:
+                    current.append(value)
+        else:
+            for key, value in other.items():
+                if key not in current:
+                    current[key] = copy.deepcopy(value)
+                elif isinstance(current[key], (list, dict)) and isinstance(value, type(current[key])):
+                    QualityStatistics.merge_values(current=current[key], other=value)
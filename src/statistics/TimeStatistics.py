@@ -26,6 +26,14 @@ class TimeStatistics(Statistics):
         else:
             log.error(f"No existing timer for dataset {dataset} and key {key}")
 
+    def add(self, value: float, dataset: str | None, key: str):
+        # add a duration that has been measured elsewhere, e.g., in a loader thread
+        if dataset is None:
+            dataset = "ALL"
+        # setdefault does not override a timer that the main thread would create at the same time
+        timer = self.stats.setdefault(dataset, {}).setdefault(key, {"start_time": 0.0, "cumulated_time": 0.0})
+        timer["cumulated_time"] += value
+
     def count(self, value: int, dataset: str | None, key: str):
         if dataset is None:
             dataset = "ALL"
@@ -36,3 +44,20 @@ class TimeStatistics(Statistics):
         else:
             self.stats[dataset][key] = {}
             self.stats[dataset][key]["count"] = value
+
+    def record_peak_rss(self, peak_rss_mb: float, dataset: str | None, key: str):
+        # the peak resident memory (in MB) of the ETL process during a stage, kept in the timer of that stage
+        if dataset is None:
+            dataset = "ALL"
+        timer = self.stats.setdefault(dataset, {}).setdefault(key, {"start_time": 0.0, "cumulated_time": 0.0})
+        timer["peak_rss_mb"] = max(timer.get("peak_rss_mb", 0.0), peak_rss_mb)
+
+    def count_cache_lookups(self, nb_lookups: int, nb_hits: int, disabled: bool, dataset: str | None, key: str, column_name: str):
+        # { dataset: { key: { column_name: { "lookups": x, "hits": y, "hit_rate": y/x, "disabled": bool } } } }
+        if dataset is None:
+            dataset = "ALL"
+        column_stats = self.stats.setdefault(dataset, {}).setdefault(key, {}).setdefault(column_name, {"lookups": 0, "hits": 0})
+        column_stats["lookups"] += nb_lookups
+        column_stats["hits"] += nb_hits
+        column_stats["hit_rate"] = column_stats["hits"] / column_stats["lookups"] if column_stats["lookups"] > 0 else 0.0
+        column_stats["disabled"] = disabled
@@ -1,17 +1,27 @@
+import csv
+import hashlib
+import importlib.util
 import os
 import re
+from typing import Iterator
 
 import pandas as pd
+import pyarrow
+import pyarrow.csv
 import ujson
 import jsonlines
 
 from constants.structure import GROUND_DATA_FOLDER_FOR_GENERATION, GROUND_METADATA_FOLDER_FOR_GENERATION
+from enums.MetadataColumns import MetadataColumns
 from enums.TableNames import TableNames
 from utils.setup_logger import log
 
+# calamine parses Excel files much faster than openpyxl (the default engine of pandas), thus it is used when it is installed
+EXCEL_ENGINE = "calamine" if importlib.util.find_spec("python_calamine") is not None else None
+
 
 def write_in_file(resource_list: list, current_working_dir: str, table_name: str, is_feature: bool, dataset_id: int, to_json: bool) -> None:
-    if table_name not in [TableNames.PATIENT, TableNames.HOSPITAL, TableNames.TEST]:
+    if table_name not in [TableNames.PATIENT, TableNames.HOSPITAL, TableNames.TEST, TableNames.RECORD_BUCKET]:
         if is_feature:
             table_name = TableNames.FEATURE
         else:
@@ -51,7 +61,7 @@ def clear_file(current_working_dir: str, dataset_id: int, table_name: str) -> No
         f.write("")
 
 
-def read_tabular_file_as_string(filepath: str) -> pd.DataFrame:
+def read_tabular_file_as_string(filepath: str, column_names: list | None = None, cache_folder: str | None = None, file_hash: str | None = None) -> pd.DataFrame:
     if filepath.endswith(".csv"):
         # leave empty cells as '' cells (they will be skipped during the Transform iteration on data values)
         # keep cells with explicit NaN values as they are (they will be converted into NaN during the Transform iteration on data values)
@@ -59,16 +69,102 @@ def read_tabular_file_as_string(filepath: str) -> pd.DataFrame:
         return pd.read_csv(filepath, index_col=False, dtype=str, na_values=[], keep_default_na=False)
     elif filepath.endswith(".xls") or filepath.endswith(".xlsx"):
         # for Excel files, there may be several sheets, so we load all data in a single dataframe
-        all_sheets = pd.read_excel(filepath, sheet_name=None, index_col=False, dtype=str, na_values=[], keep_default_na=False)
-        all_sub_df = []
-        for key, value in all_sheets.items():
-            if key != "Legend":  # skip the sheet describing the columns
-                all_sub_df.append(value)
+        all_sub_df = list(read_excel_sheets(filepath=filepath, column_names=column_names, cache_folder=cache_folder, file_hash=file_hash).values())
         return pd.concat(all_sub_df, ignore_index=True, axis="rows")  # append lines, not vertically as new columns
     else:
         raise ValueError(f"The extension of the tabular file {filepath} is not recognised. Accepted extensions are .csv, .xls, and .xlsx.")
 
 
+def read_excel_sheets(filepath: str, column_names: list | None, cache_folder: str | None, file_hash: str | None = None) -> dict:
+    """
+    Read the sheets of an Excel file as string DataFrames (as read_tabular_file_as_string() does for CSV files),
+    using calamine (a Rust parser, much faster than openpyxl) when it is installed.
+    The Legend sheet (describing the columns) is skipped, as well as the sheets none of whose columns is in column_names (if given).
+    With a cache folder, the parsed sheets are saved as Parquet files keyed by the hash of the Excel file,
+    thus the next executions on the same file do not parse it again.
+
+    :param filepath: the path to the Excel file
+    :param column_names: the (normalized) column names described in the metadata, or None to read all the sheets
+    :param cache_folder: the folder in which parsed sheets are cached, or None to not cache them
+    :param file_hash: the hash of the Excel file if it has already been computed, see compute_file_hash()
+    :return: a dict <sheet name, DataFrame of its cells>, in the order of the sheets in the file
+    """
+    if cache_folder is not None and file_hash is None:
+        file_hash = compute_file_hash(filepath=filepath)
+    headers = read_excel_headers(filepath=filepath, file_hash=file_hash, cache_folder=cache_folder)
+    sheets = {}
+    for sheet_index, (sheet_name, header) in enumerate(headers.items()):
+        if sheet_name == "Legend":  # skip the sheet describing the columns
+            continue
+        if column_names is not None and not any(MetadataColumns.normalize_name(column_name=str(column_name)) in column_names for column_name in header):
+            log.info(f"Skipping the sheet {sheet_name} of {filepath} because none of its columns is described in the metadata.")
+            continue
+        cache_file = os.path.join(cache_folder, f"{file_hash}-{sheet_index}.parquet") if cache_folder is not None else None
+        if cache_file is not None and os.path.exists(cache_file):
+            sheets[sheet_name] = pd.read_parquet(cache_file)
+        else:
+            sheets[sheet_name] = pd.read_excel(filepath, sheet_name=sheet_name, engine=EXCEL_ENGINE, index_col=False, dtype=str, na_values=[], keep_default_na=False)
+            # Parquet columns are named by strings, thus sheets with other headers (e.g., numbers) are not cached
+            if cache_file is not None and all(isinstance(column_name, str) for column_name in sheets[sheet_name].columns):
+                sheets[sheet_name].to_parquet(cache_file, index=False)
+    return sheets
+
+
+def read_excel_headers(filepath: str, file_hash: str | None, cache_folder: str | None) -> dict:
+    # the header of each sheet (only the first row of each sheet is parsed), also cached to not open the file at all in the next executions
+    headers_file = os.path.join(cache_folder, f"{file_hash}-headers.json") if cache_folder is not None else None
+    if headers_file is not None and os.path.exists(headers_file):
+        with open(headers_file) as f:
+            return ujson.load(f)
+    headers = {sheet_name: [str(column_name) for column_name in sheet.columns]
+               for sheet_name, sheet in pd.read_excel(filepath, sheet_name=None, engine=EXCEL_ENGINE, index_col=False, nrows=0).items()}
+    if headers_file is not None:
+        os.makedirs(cache_folder, exist_ok=True)
+        with open(headers_file, "w") as f:
+            ujson.dump(headers, f)
+    return headers
+
+
+def compute_file_hash(filepath: str) -> str:
+    # the SHA-256 of the content of a file, read by blocks to not load (large) files in memory
+    file_hash = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def read_tabular_file_as_arrow(filepath: str, column_names: list | None = None, cache_folder: str | None = None, file_hash: str | None = None) -> pd.DataFrame:
+    # the same cells as read_tabular_file_as_string(), in Arrow string columns instead of one Python str per cell
+    if not filepath.endswith(".csv"):
+        return read_tabular_file_as_string(filepath=filepath, column_names=column_names, cache_folder=cache_folder, file_hash=file_hash)
+    # utf-8-sig removes the BOM (as pandas and Arrow do), otherwise the first column name would not match the one of the Arrow table
+    with open(filepath, newline="", encoding="utf-8-sig") as csv_file:
+        header = next(csv.reader(csv_file), [])
+    if len(header) == 0 or len(set(header)) < len(header):
+        # pandas renames duplicated columns (a, a.1, ...), while Arrow would keep them duplicated
+        return read_tabular_file_as_string(filepath=filepath)
+    try:
+        # all the columns are strings, and empty cells are kept as '' (not null), as with keep_default_na=False
+        table = pyarrow.csv.read_csv(filepath, convert_options=pyarrow.csv.ConvertOptions(
+            column_types={column_name: pyarrow.string() for column_name in header},
+            null_values=[], strings_can_be_null=False, quoted_strings_can_be_null=False))
+    except pyarrow.ArrowInvalid as error:
+        # e.g., rows with missing cells, which pandas fills with NaN
+        log.info(f"The file {filepath} could not be read with Arrow ({error}), reading it with pandas.")
+        return read_tabular_file_as_string(filepath=filepath)
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def read_tabular_file_in_chunks(filepath: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    # the same reading options as read_tabular_file_as_string(), chunk_size rows at a time (CSV files only)
+    if not filepath.endswith(".csv"):
+        raise ValueError(f"The tabular file {filepath} cannot be read by chunks. Only .csv files can.")
+    with pd.read_csv(filepath, index_col=False, dtype=str, na_values=[], keep_default_na=False, chunksize=chunk_size) as reader:
+        for chunk in reader:
+            yield chunk.reset_index(drop=True)
+
+
 # transform a json-line file (one record per line, no comma, no encompassing brackets) to a valid stringified json (with brackets and commas)
 def from_json_line_to_json_str(json_file) -> str:
     read_json = json_file.read()  # this is a JSON-by-line file, we need to append the encompassing brackets and a comma between each record
@@ -32,3 +32,13 @@ class TestCounter:
         assert counter.resource_id == 2
         counter.reset()
         assert counter.resource_id == 0
+
+    def test_reserve(self):
+        counter = Counter()
+        counter.set(new_value=100)
+        first_id = counter.reserve(nb_ids=10)
+        assert first_id == 101
+        assert counter.resource_id == 110
+
+        counter.increment()
+        assert counter.resource_id == 111
@@ -30,7 +30,10 @@ class TestDatabase(unittest.TestCase):
         args = {
             ParameterKeys.DB_NAME: TEST_DB_NAME,
             ParameterKeys.DB_DROP: "True",
-            ParameterKeys.HOSPITAL_NAME: HospitalNames.TEST_H1
+            ParameterKeys.HOSPITAL_NAME: HospitalNames.TEST_H1,
+            ParameterKeys.FAST_INITIAL_LOAD: "False",
+            ParameterKeys.DIFF_LOAD: "False",
+            ParameterKeys.DIFF_LOAD_DELETE: "False"
         }
         set_env_variables_from_dict(env_vars=args)
         TestDatabase.execution.internals_set_up()
@@ -382,6 +385,17 @@ class TestDatabase(unittest.TestCase):
         filepath = get_json_resource_file(current_working_dir=self.execution.working_dir_current, table_name=TableNames.TEST, dataset_id=98)
         assert os.path.exists(filepath) is False  # no file should have been created since there is no data to write
 
+    def test_upsert_features_keep_first_identifier(self):
+        database = Database(execution=TestDatabase.execution)
+        database.upsert_one_batch_of_tuples(table_name=TableNames.FEATURE, unique_variables=["name"], the_batch=[{"name": "sex", Resource.IDENTIFIER_: 1}], ordered=True)
+
+        # a dataset transformed at the same time creates the same Feature with another identifier:
+        # the Feature is not replaced, thus the records referencing the first identifier remain valid
+        database.upsert_one_batch_of_tuples(table_name=TableNames.FEATURE, unique_variables=["name"],
+                                            the_batch=[{"name": "sex", Resource.IDENTIFIER_: 2}, {"name": "age", Resource.IDENTIFIER_: 3}], ordered=True)
+        docs = [doc for doc in database.db[TableNames.FEATURE].find({}, {"_id": 0}).sort({Resource.IDENTIFIER_: 1})]
+        assert docs == [{"name": "sex", Resource.IDENTIFIER_: 1}, {"name": "age", Resource.IDENTIFIER_: 3}]
+
     def test_load_json_in_table(self):
         database = Database(execution=TestDatabase.execution)
         my_tuples = [
@@ -404,6 +418,68 @@ class TestDatabase(unittest.TestCase):
         for i in range(len(expected_docs)):
             compare_tuples(original_tuple=expected_docs[i], inserted_tuple=docs[i])
 
+    def test_fast_initial_load(self):
+        set_env_variables_from_dict(env_vars={ParameterKeys.FAST_INITIAL_LOAD: "True"})
+        TestDatabase.execution.internals_set_up()
+        assert TestDatabase.execution.fast_initial_load is True
+        database = Database(execution=TestDatabase.execution)
+        unique_variables = ["has_subject", "instantiates"]
+        database.load_tuples_in_table(table_name=TableNames.RECORD, unique_variables=unique_variables, ordered=False, tuples=[
+            {"has_subject": 1, "instantiates": 1, "value": "a"},
+            {"has_subject": 1, "instantiates": 2, "value": "b"},
+            {"has_subject": 2, "instantiates": 1, "value": "c"}
+        ])
+        database.load_tuples_in_table(table_name=TableNames.RECORD, unique_variables=unique_variables, ordered=False, tuples=[
+            {"has_subject": 1, "instantiates": 1, "value": "d"},
+            {"has_subject": 1, "instantiates": 1, "value": "e"}
+        ])
+        # records are inserted as is, without their unique index
+        assert database.count_documents(table_name=TableNames.RECORD, filter_dict={}) == 5
+        assert len(database.list_existing_indexes(table_name=TableNames.RECORD)) == 1  # _id
+        # the validation pass keeps the last inserted record of each duplicate, then the unique index is built
+        assert database.build_deferred_unique_indexes() == {TableNames.RECORD: 2}
+        docs = [doc["value"] for doc in database.db[TableNames.RECORD].find({}).sort({"has_subject": 1, "instantiates": 1})]
+        assert docs == ["e", "b", "c"]
+        assert len(database.list_existing_indexes(table_name=TableNames.RECORD)) == 2
+        # other tables are still upserted
+        database.load_tuples_in_table(table_name=TableNames.TEST, unique_variables=["name"], ordered=False, tuples=[{"name": "Nelly"}, {"name": "Nelly"}])
+        assert database.count_documents(table_name=TableNames.TEST, filter_dict={}) == 1
+
+        # the fast initial load is only possible in an empty database
+        set_env_variables_from_dict(env_vars={ParameterKeys.DB_DROP: "False"})
+        TestDatabase.execution.internals_set_up()
+        assert TestDatabase.execution.fast_initial_load is False
+
+    def test_diff_load(self):
+        set_env_variables_from_dict(env_vars={ParameterKeys.DIFF_LOAD: "True"})
+        TestDatabase.execution.internals_set_up()
+        database = Database(execution=TestDatabase.execution)
+        unique_variables = ["has_subject", "instantiates"]
+        database.load_tuples_in_table(table_name=TableNames.RECORD, unique_variables=unique_variables, ordered=False, tuples=[
+            {"has_subject": 1, "instantiates": 1, "value": "a", "dataset": "d1"},
+            {"has_subject": 1, "instantiates": 2, "value": "b", "dataset": "d1"},
+            {"has_subject": 2, "instantiates": 1, "value": "c", "dataset": "d1"}
+        ])
+        assert database.finish_diff_load(dataset="d1", delete_obsolete=True) == {}
+        assert database.count_documents(table_name=TableNames.RECORD, filter_dict={Database.CONTENT_HASH_: {"$exists": True}}) == 3
+
+        # a new execution: one record is unchanged, one has changed, one is new and one is not in the data anymore
+        database.db[TableNames.RECORD].update_many({}, {"$set": {"marker": "stored"}})
+        database.load_tuples_in_table(table_name=TableNames.RECORD, unique_variables=unique_variables, ordered=False, tuples=[
+            {"has_subject": 1, "instantiates": 1, "value": "a", "dataset": "d1"},
+            {"has_subject": 1, "instantiates": 2, "value": "B", "dataset": "d1"},
+            {"has_subject": 3, "instantiates": 1, "value": "d", "dataset": "d1"}
+        ])
+        assert database.diff_load_counts == {"unchanged": 1, "written": 2}
+        assert database.finish_diff_load(dataset="d1", delete_obsolete=True) == {TableNames.RECORD: 1}
+        # the keys and hashes of the dataset are not kept once its diff load is finished
+        assert database.stored_hashes == {} and database.loaded_keys == {}
+        docs = list(database.db[TableNames.RECORD].find({}).sort({"has_subject": 1, "instantiates": 1}))
+        assert [doc["value"] for doc in docs] == ["a", "B", "d"]
+        # the unchanged record has not been written again
+        assert docs[0]["marker"] == "stored"
+        assert docs[1]["content_hash"] != docs[0]["content_hash"]
+
     def test_find_operation_1(self):
         database = Database(execution=TestDatabase.execution)
         my_tuples = [
@@ -570,3 +646,17 @@ class TestDatabase(unittest.TestCase):
         database.db[TableNames.FEATURE].insert_many(documents=my_resources_2)
         max_resource_id = database.get_max_resource_counter_id()
         assert max_resource_id == 999, "The expected max resource id is 999."
+
+    def test_reserve_identifiers(self):
+        database = Database(execution=TestDatabase.execution)
+        database.db[TableNames.RECORD].insert_many(documents=[{"identifier": 1}, {"identifier": 41}])
+        # the counter starts after the max identifier, and blocks of identifiers do not overlap
+        assert database.get_last_identifier() == 41
+        assert database.reserve_identifiers(nb_ids=10) == 42
+        assert database.reserve_identifiers(nb_ids=1) == 52
+        assert database.get_last_identifier() == 52
+        # the counter is stored in a single document, thus a new connection continues from it
+        TestDatabase.execution.db_drop = False
+        other_database = Database(execution=TestDatabase.execution)
+        assert other_database.reserve_identifiers(nb_ids=5) == 53
+        assert database.count_documents(table_name=TableNames.COUNTER, filter_dict={}) == 1
@@ -0,0 +1,74 @@
+import os
+import unittest
+
+import pandas as pd
+
+from constants.defaults import NO_ID
+from constants.structure import TEST_DB_NAME, DOCKER_FOLDER_TEST
+from database.Counter import Counter
+from database.Database import Database
+from database.Execution import Execution
+from entities.Dataset import Dataset
+from enums.ParameterKeys import ParameterKeys
+from enums.RecordLayouts import RecordLayouts
+from enums.TableNames import TableNames
+from enums.TheTestFiles import TheTestFiles
+from utils.file_utils import compute_file_hash, read_tabular_file_as_string
+from utils.test_utils import set_env_variables_from_dict
+
+
+class TestDataset(unittest.TestCase):
+    execution = Execution()
+
+    def setUp(self):
+        set_env_variables_from_dict(env_vars={ParameterKeys.DB_NAME: TEST_DB_NAME, ParameterKeys.DB_DROP: "True"})
+        TestDataset.execution.internals_set_up()
+        TestDataset.execution.file_set_up(setup_files=False)
+
+    def test_unchanged_dataset(self):
+        database = Database(execution=TestDataset.execution)
+        database.drop_table(table_name=TableNames.DATASET)
+        data_path = os.path.join(DOCKER_FOLDER_TEST, TheTestFiles.ORIG_CLINICAL_PATH)
+        metadata = read_tabular_file_as_string(filepath=os.path.join(DOCKER_FOLDER_TEST, TheTestFiles.ORIG_METADATA_PATH))
+        hashes = {"data_hash": compute_file_hash(filepath=data_path), "metadata_hash": Dataset.compute_metadata_hash(metadata=metadata),
+                  "etl_version": TestDataset.execution.compute_etl_version()}
+
+        def load_dataset(**dataset_hashes) -> Dataset:
+            dataset = Dataset(identifier=NO_ID, database=database, docker_path=data_path, version_notes=None, license=None, counter=Counter(), **dataset_hashes)
+            database.upsert_one_batch_of_tuples(table_name=TableNames.DATASET, unique_variables=["docker_path"], the_batch=[dataset.to_json()], ordered=False)
+            return dataset
+
+        # a new dataset is never unchanged, and the flag is not stored
+        dataset = load_dataset(**hashes)
+        assert dataset.unchanged is False and dataset.version == "1"
+        stored_dataset = database.find_operation(table_name=TableNames.DATASET, filter_dict={}, projection={"_id": 0})[0]
+        assert stored_dataset[Dataset.DATA_HASH_] == hashes["data_hash"] and "unchanged" not in stored_dataset
+
+        # the same hashes and ETL version: the dataset keeps its version
+        dataset = load_dataset(**hashes)
+        assert dataset.unchanged is True and dataset.version == "1"
+
+        # another metadata or ETL version: this is a new version of the dataset
+        dataset = load_dataset(**(hashes | {"metadata_hash": Dataset.compute_metadata_hash(metadata=metadata.iloc[1:])}))
+        assert dataset.unchanged is False and dataset.version == "2"
+        dataset = load_dataset(**(hashes | {"etl_version": "another version"}))
+        assert dataset.unchanged is False and dataset.version == "3"
+        # datasets without hashes (e.g., loaded by former ETL versions) are never unchanged
+        dataset = load_dataset()
+        assert dataset.unchanged is False and dataset.version == "4"
+
+    def test_compute_etl_version(self):
+        etl_version = TestDataset.execution.compute_etl_version()
+        assert etl_version == TestDataset.execution.compute_etl_version()
+        # parameters changing the loaded data change the ETL version, not the ones changing its performance
+        TestDataset.execution.nb_workers = 4
+        assert TestDataset.execution.compute_etl_version() == etl_version
+        TestDataset.execution.record_layout = RecordLayouts.BUCKETS
+        assert TestDataset.execution.compute_etl_version() != etl_version
+        TestDataset.execution.nb_workers = 1
+        TestDataset.execution.record_layout = RecordLayouts.DOCUMENTS
+
+    def test_compute_metadata_hash(self):
+        metadata = pd.DataFrame({"name": ["a", "b"], "dataset": ["d.csv", "d.csv"]})
+        assert Dataset.compute_metadata_hash(metadata=metadata) == Dataset.compute_metadata_hash(metadata=metadata.copy())
+        assert Dataset.compute_metadata_hash(metadata=metadata) != Dataset.compute_metadata_hash(metadata=metadata.replace("b", "c"))
@@ -0,0 +1,110 @@
+import copy
+import os
+import unittest
+
+import pandas as pd
+
+from constants.defaults import NO_ID
+from constants.structure import TEST_DB_NAME, DOCKER_FOLDER_TEST
+from database.Counter import Counter
+from database.Database import Database
+from database.Execution import Execution
+from entities.Dataset import Dataset
+from entities.Feature import Feature
+from entities.Record import Record
+from entities.Resource import Resource
+from enums.HospitalNames import HospitalNames
+from enums.MetadataColumns import MetadataColumns
+from enums.ParameterKeys import ParameterKeys
+from enums.Profile import Profile
+from enums.TableNames import TableNames
+from enums.TheTestFiles import TheTestFiles
+from etl.DatasetScheduler import DatasetScheduler
+from etl.ETL import ETL
+from etl.Load import Load
+from etl.PatientIdMapping import PatientIdMapping
+from statistics.QualityStatistics import QualityStatistics
+from utils.file_utils import read_tabular_file_as_string
+from utils.test_utils import set_env_variables_from_dict
+
+
+class TestDatasetScheduler(unittest.TestCase):
+    execution = Execution()
+
+    def setUp(self):
+        args = {
+            ParameterKeys.HOSPITAL_NAME: HospitalNames.TEST_H1,
+            ParameterKeys.DB_NAME: TEST_DB_NAME,
+            ParameterKeys.DB_DROP: "True",
+            ParameterKeys.USE_LOCALE: "C",
+            ParameterKeys.METADATA_PATH: TheTestFiles.ORIG_METADATA_PATH,
+            ParameterKeys.DATA_FILES: f"{TheTestFiles.ORIG_PHENOTYPIC_PATH},{TheTestFiles.ORIG_CLINICAL_PATH}",
+            ParameterKeys.ANONYMIZED_PATIENT_IDS: TheTestFiles.ORIG_EMPTY_PIDS_PATH,
+            ParameterKeys.PATIENT_ID_COLUMN: "id",
+            ParameterKeys.SAMPLE_ID_COLUMN: "sid",
+            ParameterKeys.NB_PARALLEL_DATASETS: "2"
+        }
+        set_env_variables_from_dict(env_vars=args)
+        TestDatasetScheduler.execution.internals_set_up()
+        TestDatasetScheduler.execution.file_set_up(setup_files=True)
+
+    def test_shared_patient_ids_mapping(self):
+        patient_ids_mapping = PatientIdMapping(mapping={"p1": 1})
+        assert patient_ids_mapping.get_identifiers(patient_ids=["p1", "p2"]) == {"p1": 1}
+
+        # two workers create the patient p2 at the same time: the first one to allocate it wins
+        assert patient_ids_mapping.allocate(identifiers={"p2": 10, "p3": 11}) == {"p2": 10, "p3": 11}
+        assert patient_ids_mapping.allocate(identifiers={"p2": 20}) == {"p2": 10}
+        assert patient_ids_mapping.get_mapping() == {"p1": 1, "p2": 10, "p3": 11}
+
+    def test_run_dataset(self):
+        database = Database(execution=TestDatasetScheduler.execution)
+        counter = Counter()
+        counter.set_with_database(database=database)
+        datasets = [Dataset(identifier=NO_ID, database=database, docker_path=os.path.join(DOCKER_FOLDER_TEST, filename), version_notes=None, license=None, counter=counter)
+                    for filename in [TheTestFiles.ORIG_PHENOTYPIC_PATH, TheTestFiles.ORIG_CLINICAL_PATH]]
+        etl = ETL(execution=TestDatasetScheduler.execution, database=database)
+        etl.create_hospital(counter=counter, dataset_id=datasets[0].identifier)
+        all_metadata = read_tabular_file_as_string(filepath=TestDatasetScheduler.execution.metadata_filepath)
+
+        # the workers are run in the current process, with their own database connection and a shared mapping of patient IDs
+        dataset_scheduler = DatasetScheduler(execution=TestDatasetScheduler.execution, nb_workers=2)
+        assert dataset_scheduler.worker_execution.db_drop is False
+        assert dataset_scheduler.worker_execution.direct_load is False
+        DatasetScheduler.database = Database(execution=dataset_scheduler.worker_execution)
+        DatasetScheduler.patient_ids_mapping = PatientIdMapping(mapping={})
+        for dataset, profile in zip(datasets, [Profile.PHENOTYPIC, Profile.CLINICAL]):
+            filename = os.path.basename(dataset.docker_path)
+            metadata = pd.DataFrame(all_metadata[all_metadata[MetadataColumns.DATASET_NAME].values == filename])
+            dataset_scheduler.add_job(filepath=dataset.docker_path, metadata=metadata, profiles=[profile], dataset=dataset)
+            filepath, _, profiles, worker_dataset, _ = dataset_scheduler.jobs[-1]
+            assert worker_dataset.database is None and dataset.database == database
+            execution = copy.copy(dataset_scheduler.worker_execution)
+            execution.current_filepath = filepath
+            execution.current_dataset_gid = worker_dataset.global_identifier
+            results, quality_stats = DatasetScheduler.run_dataset(metadata=metadata, profiles=profiles, execution=execution, dataset=worker_dataset,
+                                                                  quality_stats=QualityStatistics(record_stats=True))
+            assert [result[0] for result in results] == [profile]
+            assert results[0][2] is not None  # the profile has been transformed
+
+        # both datasets describe the same patients, which are created once, with the identifiers allocated by the first dataset
+        patient_ids_mapping = DatasetScheduler.patient_ids_mapping.get_mapping()
+        assert len(patient_ids_mapping) > 0
+        patients = database.find_operation(table_name=TableNames.PATIENT, filter_dict={}, projection={"_id": 0, Resource.IDENTIFIER_: 1})
+        assert sorted(patient[Resource.IDENTIFIER_] for patient in patients) == sorted(patient_ids_mapping.values())
+        # the Features are in the database, but the records are written in files for the main process
+        features = list(database.find_operation(table_name=TableNames.FEATURE, filter_dict={}, projection={"_id": 0, Feature.NAME_: 1, Resource.IDENTIFIER_: 1}))
+        assert len(features) > 0
+        assert database.count_documents(table_name=TableNames.RECORD, filter_dict={}) == 0
+        for dataset, profile in zip(datasets, [Profile.PHENOTYPIC, Profile.CLINICAL]):
+            load = Load(database=database, execution=dataset_scheduler.worker_execution, create_indexes=False,
+                        dataset_id=DatasetScheduler.get_file_key(dataset_id=dataset.identifier, profile=profile), profile=profile,
+                        quality_stats=QualityStatistics(record_stats=False))
+            load.run()
+            assert database.count_documents(table_name=TableNames.RECORD, filter_dict={Record.DATASET_: dataset.global_identifier}) > 0
+        records = database.find_operation(table_name=TableNames.RECORD, filter_dict={}, projection={"_id": 0, Record.INSTANTIATES_: 1, Record.SUBJECT_: 1})
+        for record in records:
+            assert record[Record.INSTANTIATES_] in [feature[Resource.IDENTIFIER_] for feature in features]
+            assert record[Record.SUBJECT_] in patient_ids_mapping.values()
+        DatasetScheduler.database = None
+        DatasetScheduler.patient_ids_mapping = None
@@ -0,0 +1,58 @@
+import os
+import unittest
+
+from constants.defaults import NO_ID
+from constants.structure import TEST_DB_NAME, DOCKER_FOLDER_TEST
+from database.Counter import Counter
+from database.Database import Database
+from database.Execution import Execution
+from entities.Dataset import Dataset
+from entities.Feature import Feature
+from entities.Record import Record
+from entities.Resource import Resource
+from enums.DataTypes import DataTypes
+from enums.ParameterKeys import ParameterKeys
+from enums.Profile import Profile
+from enums.ProfileEngines import ProfileEngines
+from enums.TableNames import TableNames
+from enums.TheTestFiles import TheTestFiles
+from etl.ETL import ETL
+from utils.test_utils import set_env_variables_from_dict
+
+
+class TestETL(unittest.TestCase):
+    execution = Execution()
+
+    def setUp(self):
+        args = {
+            ParameterKeys.DB_NAME: TEST_DB_NAME,
+            ParameterKeys.DB_DROP: "True",
+            ParameterKeys.USE_LOCALE: "C",
+            ParameterKeys.SKIP_UNCHANGED_DATASETS: "True",
+            ParameterKeys.PROFILE_ENGINE: ProfileEngines.SINGLE_PASS
+        }
+        set_env_variables_from_dict(env_vars=args)
+        TestETL.execution.internals_set_up()
+        TestETL.execution.file_set_up(setup_files=False)
+
+    def test_unchanged_datasets(self):
+        database = Database(execution=TestETL.execution)
+        etl = ETL(execution=TestETL.execution, database=database)
+        etl.datasets = [Dataset(identifier=NO_ID, database=database, docker_path=os.path.join(DOCKER_FOLDER_TEST, TheTestFiles.ORIG_CLINICAL_PATH),
+                                version_notes=None, license=None, counter=Counter())]
+        dataset = etl.datasets[0].global_identifier
+        database.insert_many_tuples(table_name=TableNames.FEATURE, tuples=[{Resource.IDENTIFIER_: 1, Feature.DT_: DataTypes.INTEGER}])
+        database.insert_many_tuples(table_name=TableNames.RECORD, tuples=[
+            {Record.DATASET_: dataset, Record.INSTANTIATES_: 1, Record.SUBJECT_: 1, Record.VALUE_: 4, Resource.ENTITY_TYPE_: f"{Profile.PHENOTYPIC}{TableNames.RECORD}"}
+        ])
+        # the profile of a former run
+        database.insert_one_tuple(table_name=TableNames.FEATURE_PROFILE, one_tuple={Record.DATASET_: dataset, Record.INSTANTIATES_: 1, "marker": "former run"})
+
+        # all the datasets are unchanged: nothing is rewritten
+        db_stats = etl.compute_profiles_and_stats(loaded_filenames=[])
+        assert db_stats.record_stats is False
+        assert etl.profile_computation is None
+        profiles = list(database.find_operation(table_name=TableNames.FEATURE_PROFILE, filter_dict={}, projection={"_id": 0}))
+        assert profiles == [{Record.DATASET_: dataset, Record.INSTANTIATES_: 1, "marker": "former run"}]
+        assert database.count_documents(table_name=TableNames.DATASET, filter_dict={}) == 0
+
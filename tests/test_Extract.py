@@ -1,15 +1,18 @@
 import json
 import os
+import tempfile
 import unittest
+from unittest import mock
 
 import numpy as np
 import pandas as pd
 
-from constants.structure import TEST_DB_NAME, DOCKER_FOLDER_TEST
+from constants.structure import TEST_DB_NAME, DOCKER_FOLDER_TEST, EXCEL_CACHE_FOLDER
 from database.Database import Database
 from database.Execution import Execution
 from enums.DataTypes import DataTypes
 from enums.HospitalNames import HospitalNames
+from enums.IngestionBackends import IngestionBackends
 from enums.MetadataColumns import MetadataColumns
 from enums.Ontologies import Ontologies
 from enums.ParameterKeys import ParameterKeys
@@ -17,7 +20,7 @@ from enums.Profile import Profile
 from enums.TheTestFiles import TheTestFiles
 from etl.Extract import Extract
 from statistics.QualityStatistics import QualityStatistics
-from utils.file_utils import read_tabular_file_as_string
+from utils.file_utils import compute_file_hash, read_tabular_file_as_arrow, read_tabular_file_as_string
 from utils.test_utils import set_env_variables_from_dict
 
 
@@ -29,7 +32,9 @@ def my_setup(metadata_path: str, data_paths: str, data_type: str, pids_path: str
         ParameterKeys.DB_DROP: "True",
         ParameterKeys.METADATA_PATH: metadata_path,
         ParameterKeys.DATA_FILES: data_paths,
-        ParameterKeys.ANONYMIZED_PATIENT_IDS: pids_path
+        ParameterKeys.ANONYMIZED_PATIENT_IDS: pids_path,
+        ParameterKeys.DATA_CHUNK_SIZE: "0",
+        ParameterKeys.INGESTION_BACKEND: IngestionBackends.PANDAS
     }
     set_env_variables_from_dict(env_vars=args)
     TestExtract.execution.internals_set_up()
@@ -369,6 +374,100 @@ class TestExtract(unittest.TestCase):
         assert cc_female["system"] == Ontologies.SNOMEDCT["url"]  # normalized (ontology) key
         assert cc_female["code"] == "248152002"  # normalized ontology code
 
+    def test_iterate_data_chunks(self):
+        extract = my_setup(metadata_path=TheTestFiles.ORIG_METADATA_PATH,
+                           data_paths=TheTestFiles.ORIG_CLINICAL_PATH,
+                           data_type=Profile.CLINICAL,
+                           pids_path=TheTestFiles.ORIG_EMPTY_PIDS_PATH,
+                           hospital_name=HospitalNames.TEST_H1)
+        assert extract.can_stream_data() is False
+
+        # the data read by chunks of 3 rows is the same as the data read at once
+        set_env_variables_from_dict(env_vars={ParameterKeys.DATA_CHUNK_SIZE: "3"})
+        TestExtract.execution.internals_set_up()
+        metadata = read_tabular_file_as_string(filepath=os.path.join(DOCKER_FOLDER_TEST, TheTestFiles.ORIG_METADATA_PATH))
+        streamed_extract = Extract(metadata=metadata, profile=Profile.CLINICAL, database=extract.database, execution=TestExtract.execution, quality_stats=QualityStatistics(record_stats=False))
+        streamed_extract.run()
+        assert streamed_extract.streams_data is True
+        assert streamed_extract.data is None
+        chunks = [chunk.copy() for chunk in streamed_extract.iterate_data_chunks()]
+        assert [len(chunk) for chunk in chunks] == [3, 3, 3, 1]
+        assert pd.concat(chunks, ignore_index=True).equals(extract.data)
+        extract.compute_column_to_unit()
+        assert streamed_extract.mapping_column_to_unit == extract.mapping_column_to_unit
+        set_env_variables_from_dict(env_vars={ParameterKeys.DATA_CHUNK_SIZE: "0"})
+
+    def test_normalize_values(self):
+        values = pd.Series(["", "  A  b ", "NA", " n/a ", "F", "f", "F", "x\x0by", "ÉCOLE  ΟΔΟΣ", "\t", np.nan, 12, "NA"], index=range(3, 16))
+        expected_values = values.apply(lambda x: MetadataColumns.normalize_value(column_value=x))
+        assert MetadataColumns.normalize_values(values=values).equals(expected_values)
+        assert MetadataColumns.normalize_values(values=pd.Series([], dtype=object)).tolist() == []
+
+    def test_arrow_backend(self):
+        for data_path, profile in [(TheTestFiles.ORIG_PHENOTYPIC_PATH, Profile.PHENOTYPIC), (TheTestFiles.ORIG_CLINICAL_PATH, Profile.CLINICAL)]:
+            extract = my_setup(metadata_path=TheTestFiles.ORIG_METADATA_PATH, data_paths=data_path, data_type=profile,
+                               pids_path=TheTestFiles.ORIG_EMPTY_PIDS_PATH, hospital_name=HospitalNames.TEST_H1)
+            set_env_variables_from_dict(env_vars={ParameterKeys.INGESTION_BACKEND: IngestionBackends.ARROW})
+            TestExtract.execution.internals_set_up()
+            metadata = read_tabular_file_as_string(filepath=os.path.join(DOCKER_FOLDER_TEST, TheTestFiles.ORIG_METADATA_PATH))
+            arrow_extract = Extract(metadata=metadata, profile=profile, database=extract.database, execution=TestExtract.execution, quality_stats=QualityStatistics(record_stats=False))
+            arrow_extract.filter_metadata_file()
+            arrow_extract.normalize_metadata_file()
+            arrow_extract.load_tabular_data()
+            assert all(isinstance(dtype, pd.ArrowDtype) for dtype in arrow_extract.data.dtypes)
+            arrow_extract.pre_process_data_file()
+            arrow_extract.filter_data_file()
+            arrow_extract.normalize_data_file()
+            # the data is exactly the same as with the pandas backend (same Python values, NaN included)
+            assert arrow_extract.data.equals(extract.data)
+            assert list(arrow_extract.data.dtypes) == list(extract.data.dtypes)
+            set_env_variables_from_dict(env_vars={ParameterKeys.INGESTION_BACKEND: IngestionBackends.PANDAS})
+
+        # values with non-ASCII characters are normalized in Python
+        values = pd.Series(["", "  A  b ", "NA", " n/a ", "x\x0by", "ÉCOLE  ΟΔΟΣ", "a\xa0b", "\t", "abc\r\ndef", "/", "İ"])
+        expected_values = values.apply(lambda x: MetadataColumns.normalize_value(column_value=x))
+        assert MetadataColumns.normalize_values_with_arrow(values=values).equals(expected_values)
+        assert MetadataColumns.normalize_values_with_arrow(values=pd.Series(["1", 2])).tolist() == ["1", "2"]
+
+        # with a BOM at the beginning of the file, the first column is read as strings too (IDs keep their leading zeros)
+        with tempfile.TemporaryDirectory() as folder:
+            filepath = os.path.join(folder, "data-bom.csv")
+            with open(filepath, "w", encoding="utf-8-sig") as f:
+                f.write("id,weight\n007,12\n010,\n")
+            arrow_data = read_tabular_file_as_arrow(filepath=filepath)
+            assert list(arrow_data.columns) == ["id", "weight"]
+            assert arrow_data["id"].tolist() == ["007", "010"] and arrow_data["weight"].tolist() == ["12", ""]
+            assert arrow_data.astype(object).equals(read_tabular_file_as_string(filepath=filepath))
+
+    def test_read_excel_sheets(self):
+        data = read_tabular_file_as_string(filepath=os.path.join(DOCKER_FOLDER_TEST, TheTestFiles.ORIG_CLINICAL_PATH))
+        column_names = [MetadataColumns.normalize_name(column_name=column_name) for column_name in data.columns]
+        with tempfile.TemporaryDirectory() as folder:
+            # the data is split in two sheets, along with a sheet describing the columns and a sheet with no described column
+            filepath = os.path.join(folder, "data.xlsx")
+            with pd.ExcelWriter(filepath) as writer:
+                data.iloc[:5].to_excel(writer, sheet_name="Sheet1", index=False)
+                pd.DataFrame({"column": data.columns}).to_excel(writer, sheet_name="Legend", index=False)
+                pd.DataFrame({"unknown column": ["a", "b"]}).to_excel(writer, sheet_name="Sheet2", index=False)
+                data.iloc[5:].to_excel(writer, sheet_name="Sheet3", index=False)
+
+            # only the sheets with described columns are read, and they are cached as Parquet files
+            cache_folder = os.path.join(folder, EXCEL_CACHE_FOLDER)
+            excel_data = read_tabular_file_as_string(filepath=filepath, column_names=column_names, cache_folder=cache_folder)
+            assert excel_data.equals(data)
+            assert sorted(os.listdir(cache_folder)) == sorted(f"{compute_file_hash(filepath=filepath)}-{suffix}" for suffix in ["0.parquet", "3.parquet", "headers.json"])
+
+            # the next reads of the same file do not parse it again
+            with mock.patch("pandas.read_excel", side_effect=AssertionError("the Excel file should not be parsed")):
+                assert read_tabular_file_as_string(filepath=filepath, column_names=column_names, cache_folder=cache_folder).equals(data)
+            # the hash computed by the ETL is used as is, the file is not hashed again
+            with mock.patch("utils.file_utils.compute_file_hash", side_effect=AssertionError("the Excel file should not be hashed again")):
+                assert read_tabular_file_as_string(filepath=filepath, column_names=column_names, cache_folder=cache_folder,
+                                                   file_hash=compute_file_hash(filepath=filepath)).equals(data)
+
+            # without column names, all the sheets (but the legend) are read
+            assert len(read_tabular_file_as_string(filepath=filepath)) == len(data) + 2
+
     def test_removed_unused_columns(self):
         extract = my_setup(metadata_path=TheTestFiles.ORIG_METADATA_PATH,
                            data_paths=TheTestFiles.ORIG_CLINICAL_PATH,
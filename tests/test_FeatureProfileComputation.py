@@ -0,0 +1,355 @@
+import math
+import unittest
+
+import numpy as np
+from pandas import DataFrame
+
+from catalogue.FeatureProfileComputation import FeatureProfileComputation
+from catalogue.NumericSketch import NumericSketch
+from constants.structure import TEST_DB_NAME
+from database.Database import Database
+from database.Execution import Execution
+from database.RecordBuckets import RecordBuckets
+from database.RecordReader import RecordReader
+from entities.Feature import Feature
+from entities.Record import Record
+from entities.Resource import Resource
+from enums.DataTypes import DataTypes
+from enums.HospitalNames import HospitalNames
+from enums.ParameterKeys import ParameterKeys
+from enums.Profile import Profile
+from enums.ProfileEngines import ProfileEngines
+from enums.RecordLayouts import RecordLayouts
+from enums.TableNames import TableNames
+from enums.ValueEncodings import ValueEncodings
+from statistics.DatabaseStatistics import DatabaseStatistics
+from utils.test_utils import set_env_variables_from_dict
+
+FEMALE = {"system": "http://snomed.info/sct", "code": "248152002"}
+MALE = {"system": "http://snomed.info/sct", "code": "248153007"}
+
+
+class TestFeatureProfileComputation(unittest.TestCase):
+    execution = Execution()
+
+    def setUp(self):
+        # before each test, get back to the original test configuration
+        args = {
+            ParameterKeys.DB_NAME: TEST_DB_NAME,
+            ParameterKeys.DB_DROP: "True",
+            ParameterKeys.HOSPITAL_NAME: HospitalNames.TEST_H1
+        }
+        set_env_variables_from_dict(env_vars=args)
+        TestFeatureProfileComputation.execution.internals_set_up()
+        TestFeatureProfileComputation.execution.file_set_up(setup_files=False)
+
+    def create_database(self) -> Database:
+        database = Database(execution=TestFeatureProfileComputation.execution)
+        database.insert_many_tuples(table_name=TableNames.FEATURE, tuples=[
+            {Resource.IDENTIFIER_: 1, Feature.DT_: DataTypes.INTEGER},
+            {Resource.IDENTIFIER_: 2, Feature.DT_: DataTypes.CATEGORY},
+            {Resource.IDENTIFIER_: 3, Feature.DT_: DataTypes.FLOAT}
+        ])
+        phen_record = f"{Profile.PHENOTYPIC}{TableNames.RECORD}"
+        clin_record = f"{Profile.CLINICAL}{TableNames.RECORD}"
+        records = []
+        # feature 1 (integer): 4 patients out of 5 have a value in dataset 10
+        for patient_id, value in zip([1, 2, 3, 4], [1, 2, 2, 10]):
+            records.append({Record.DATASET_: 10, Record.INSTANTIATES_: 1, Record.SUBJECT_: patient_id, Record.VALUE_: value, Resource.ENTITY_TYPE_: phen_record})
+        # feature 2 (category): all 5 patients of dataset 10
+        for patient_id, value in zip([1, 2, 3, 4, 5], [FEMALE, MALE, FEMALE, FEMALE, MALE]):
+            records.append({Record.DATASET_: 10, Record.INSTANTIATES_: 2, Record.SUBJECT_: patient_id, Record.VALUE_: value, Resource.ENTITY_TYPE_: phen_record})
+        # feature 3 (float): clinical records of 2 samples out of 4 in dataset 20, with a NaN
+        for sample_id, value in zip(["s1", "s2", "s3", "s4"], [1.5, float("nan"), None, None]):
+            if value is not None:
+                records.append({Record.DATASET_: 20, Record.INSTANTIATES_: 3, Record.SUBJECT_: 1, Record.BASE_ID_: sample_id, Record.VALUE_: value, Resource.ENTITY_TYPE_: clin_record})
+            else:
+                records.append({Record.DATASET_: 20, Record.INSTANTIATES_: 1, Record.SUBJECT_: 1, Record.BASE_ID_: sample_id, Record.VALUE_: 3, Resource.ENTITY_TYPE_: clin_record})
+        database.insert_many_tuples(table_name=TableNames.RECORD, tuples=records)
+        return database
+
+    def get_profile(self, database: Database, dataset: int, feature: int) -> dict:
+        return database.find_operation(table_name=TableNames.FEATURE_PROFILE, filter_dict={Record.DATASET_: dataset, Record.INSTANTIATES_: feature}, projection={"_id": 0}).next()
+
+    def test_single_pass(self):
+        database = self.create_database()
+        profile_computation = FeatureProfileComputation(database=database, engine=ProfileEngines.SINGLE_PASS)
+        profile_computation.compute_features_profiles_in_single_pass()
+        assert database.count_documents(table_name=TableNames.FEATURE_PROFILE, filter_dict={}) == 4
+
+        # numeric profile: values 1, 2, 2, 10
+        profile = self.get_profile(database=database, dataset=10, feature=1)
+        assert profile["min_value"] == 1
+        assert profile["max_value"] == 10
+        assert profile["mean_value"] == 3.75
+        assert profile["median_value"] == 2
+        assert math.isclose(profile["std_value"], math.sqrt(13.1875))
+        assert profile["ema"] == 0.5  # deviations to the median: 1, 0, 0, 8
+        assert profile["iqr"] == 9  # median of [10] - median of [1]
+        assert profile["skewness"] > 0
+        assert profile["uniqueness"] == 0.75
+        assert math.isclose(profile["entropy"], 1.5)  # probabilities 1/4, 1/2, 1/4
+        assert profile["values_and_counts"] == [{"value": 1, "count": 1}, {"value": 2, "count": 2}, {"value": 10, "count": 1}]
+        assert math.isclose(profile["missing_percentage"], 0.2)  # 4 values for 5 patients
+
+        # categorical profile: 3 females and 2 males
+        profile = self.get_profile(database=database, dataset=10, feature=2)
+        assert profile["mode"] == FEMALE
+        assert profile["imbalance"] == 1.5
+        assert profile["constancy"] == 1.0
+        assert profile["uniqueness"] == 0.4
+        assert profile["values_and_counts"] == [{"value": FEMALE, "count": 3}, {"value": MALE, "count": 2}]
+        assert profile["missing_percentage"] == 0
+        assert "mean_value" not in profile
+
+        # clinical records: the missing percentage is computed over samples, and NaN values are not numbers
+        profile = self.get_profile(database=database, dataset=20, feature=3)
+        assert profile["min_value"] == 1.5
+        assert profile["max_value"] == 1.5
+        assert profile["iqr"] is None
+        assert profile["skewness"] == 0
+        assert profile["values_and_counts"] == [{"value": 1.5, "count": 1}, {"value": None, "count": 1}]
+        assert profile["missing_percentage"] == 0.5
+
+    def test_incremental(self):
+        for engine in ProfileEngines.values():
+            with self.subTest(engine=engine):
+                self.check_incremental(engine=engine)
+
+    def check_incremental(self, engine: str):
+        database = self.create_database()
+        profile_computation = FeatureProfileComputation(database=database, engine=engine, datasets=None)
+        profile_computation.compute_features_profiles()
+        first_profile = self.get_profile(database=database, dataset=10, feature=1)
+        assert database.count_documents(table_name=TableNames.FEATURE_PROFILE, filter_dict={}) == 4
+
+        # a new run adds dataset 30 and changes dataset 20, thus only their profiles are recomputed
+        database.insert_many_tuples(table_name=TableNames.RECORD, tuples=[
+            {Record.DATASET_: 30, Record.INSTANTIATES_: 1, Record.SUBJECT_: 6, Record.VALUE_: 42, Resource.ENTITY_TYPE_: f"{Profile.PHENOTYPIC}{TableNames.RECORD}"}
+        ])
+        database.db[TableNames.RECORD].delete_many({Record.DATASET_: 20, Record.INSTANTIATES_: 3})
+        database.db[TableNames.FEATURE_PROFILE].update_one({Record.DATASET_: 10, Record.INSTANTIATES_: 1}, {"$set": {"marker": True}})
+        profile_computation = FeatureProfileComputation(database=database, engine=engine, datasets=[20, 30])
+        profile_computation.compute_features_profiles()
+        assert database.count_documents(table_name=TableNames.FEATURE_PROFILE, filter_dict={}) == 4
+        # the profiles of dataset 10 are left in place
+        assert self.get_profile(database=database, dataset=10, feature=1) == first_profile | {"marker": True}
+        # the profile of feature 3 in dataset 20 does not exist anymore, and dataset 30 has a new profile
+        assert database.count_documents(table_name=TableNames.FEATURE_PROFILE, filter_dict={Record.DATASET_: 20, Record.INSTANTIATES_: 3}) == 0
+        profile = self.get_profile(database=database, dataset=30, feature=1)
+        assert profile["mean_value"] == 42
+        assert profile[Resource.TIMESTAMP_] >= first_profile[Resource.TIMESTAMP_]
+
+    def test_pearson_blocks(self):
+        # same coefficients as pandas, which also uses pairwise-complete observations
+        rng = np.random.default_rng(seed=42)
+        matrix = rng.normal(size=(500, 6))
+        matrix[:, 1] = 2 * matrix[:, 0] + rng.normal(scale=0.5, size=500)
+        matrix[:, 2] = 7  # a constant feature
+        matrix[rng.random(size=(500, 6)) < 0.3] = np.nan
+        # blocks of 4 features, the last block having only 2 features
+        blocks = list(FeatureProfileComputation.pearson_blocks(matrix=matrix, block_size=4, chunk_size=64))
+        assert [first_feature for first_feature, _, _ in blocks] == [0, 4]
+        coefficients = np.vstack([block_coefficients for _, block_coefficients, _ in blocks])
+        counts = np.vstack([block_counts for _, _, block_counts in blocks])
+        expected_coefficients = DataFrame(matrix).corr(method="pearson").to_numpy()
+        expected_counts = (~np.isnan(matrix)).astype(int).T @ (~np.isnan(matrix)).astype(int)
+        assert (counts == expected_counts).all()
+        for a in range(6):
+            for b in range(6):
+                if a == 2 or b == 2:
+                    assert coefficients[a, b] == 0
+                else:
+                    assert math.isclose(coefficients[a, b], expected_coefficients[a, b], abs_tol=1e-9)
+        assert coefficients[0, 1] > 0.9
+
+    def test_pearson_correlations(self):
+        for engine in ProfileEngines.values():
+            with self.subTest(engine=engine):
+                database = self.create_database()
+                # feature 3 (float) for the 4 patients of dataset 10, paired to feature 1 by patient (not by record order)
+                database.insert_many_tuples(table_name=TableNames.RECORD, tuples=[
+                    {Record.DATASET_: 10, Record.INSTANTIATES_: 3, Record.SUBJECT_: patient_id, Record.VALUE_: value, Resource.ENTITY_TYPE_: f"{Profile.PHENOTYPIC}{TableNames.RECORD}"}
+                    for patient_id, value in zip([4, 3, 2, 1, 5], [-20.0, -4.0, -4.0, -2.0, 100.0])
+                ])
+                profile_computation = FeatureProfileComputation(database=database, engine=engine)
+                profile_computation.compute_features_profiles()
+                assert math.isclose(self.get_profile(database=database, dataset=10, feature=1)["pearson"]["3"]["coefficient"], -1)
+                # dataset 20 has values for features 1 and 3, but never for the same sample
+                assert "pearson" not in self.get_profile(database=database, dataset=20, feature=1)
+
+    def test_pearson_correlations_per_dataset(self):
+        # the numeric records are read (and pivoted) one dataset at a time
+        database = self.create_database()
+        profile_computation = FeatureProfileComputation(database=database, engine=ProfileEngines.SINGLE_PASS)
+        find = profile_computation.records.find
+        filters = []
+        profile_computation.records.find = lambda filter_dict, projection: filters.append(filter_dict) or find(filter_dict=filter_dict, projection=projection)
+        profile_computation.compute_pearson_correlations_with_matrix()
+        assert sorted(filter_dict[Record.DATASET_] for filter_dict in filters) == [10, 20]
+
+    def test_bucket_layout(self):
+        for engine in ProfileEngines.values():
+            with self.subTest(engine=engine):
+                self.check_bucket_layout(engine=engine)
+
+    def check_bucket_layout(self, engine: str):
+        database = self.create_database()
+        database.insert_many_tuples(table_name=TableNames.RECORD, tuples=[
+            {Record.DATASET_: 10, Record.INSTANTIATES_: 3, Record.SUBJECT_: patient_id, Record.VALUE_: value, Resource.ENTITY_TYPE_: f"{Profile.PHENOTYPIC}{TableNames.RECORD}"}
+            for patient_id, value in zip([4, 3, 2, 1, 5], [-20.0, -4.0, -4.0, -2.0, 100.0])
+        ])
+        records = list(database.find_operation(table_name=TableNames.RECORD, filter_dict={}, projection={"_id": 0}))
+        for identifier, record in enumerate(records):
+            record[Resource.IDENTIFIER_] = identifier
+        FeatureProfileComputation(database=database, engine=engine).compute_features_profiles()
+        expected_profiles = list(database.find_operation(table_name=TableNames.FEATURE_PROFILE, filter_dict={}, projection={"_id": 0, Resource.TIMESTAMP_: 0}))
+
+        # the same records, stored by buckets of (at most) 2 records of a (dataset, feature) pair
+        buckets = []
+        for record in records:
+            shared_fields = {field: record[field] for field in RecordBuckets.SHARED_FIELDS if field in record}
+            if len(buckets) == 0 or {field: buckets[-1].get(field) for field in shared_fields} != shared_fields or len(buckets[-1][Resource.IDENTIFIER_]) == 2:
+                buckets.append(shared_fields | {field: [] for field in RecordBuckets.ARRAY_FIELDS + RecordBuckets.OPTIONAL_ARRAY_FIELDS})
+            for field in RecordBuckets.ARRAY_FIELDS + RecordBuckets.OPTIONAL_ARRAY_FIELDS:
+                buckets[-1][field].append(record.get(field))
+        for bucket in buckets:
+            for field in RecordBuckets.OPTIONAL_ARRAY_FIELDS:
+                if all(element is None for element in bucket[field]):
+                    bucket.pop(field)  # as when records are transformed, a bucket has an optional field only if some of its records have it
+        database.drop_table(table_name=TableNames.RECORD)
+        database.drop_table(table_name=TableNames.FEATURE_PROFILE)
+        database.insert_many_tuples(table_name=TableNames.RECORD_BUCKET, tuples=buckets)
+        assert database.count_documents(table_name=TableNames.RECORD_BUCKET, filter_dict={}) < len(records)
+
+        # buckets are expanded in the same records, thus profiles and statistics are the same
+        record_reader = RecordReader(database=database, layout=RecordLayouts.BUCKETS)
+        assert list(record_reader.find(filter_dict={}, projection={})) == records
+        assert record_reader.count(filter_dict={Record.INSTANTIATES_: 1}) == len([record for record in records if record[Record.INSTANTIATES_] == 1])
+        assert sorted(record_reader.find_distinct(key=Record.SUBJECT_, filter_dict={Record.DATASET_: 10})) == [1, 2, 3, 4, 5]
+        FeatureProfileComputation(database=database, engine=engine, record_layout=RecordLayouts.BUCKETS).compute_features_profiles()
+        profiles = list(database.find_operation(table_name=TableNames.FEATURE_PROFILE, filter_dict={}, projection={"_id": 0, Resource.TIMESTAMP_: 0}))
+        assert profiles == expected_profiles
+        db_stats = DatabaseStatistics(record_stats=True)
+        db_stats.compute_counts_instances(database=database, records=record_reader)
+        db_stats.compute_unknown_feat_refs_in_records(records=record_reader)
+        assert db_stats.counts_instances[TableNames.RECORD] == len(records)
+        assert db_stats.unknown_feat_refs_in_records["size"] == 0  # all records instantiate a Feature of the test database
+
+    def test_compact_values(self):
+        for engine in ProfileEngines.values():
+            with self.subTest(engine=engine):
+                self.check_compact_values(engine=engine)
+
+    def check_compact_values(self, engine: str):
+        database = self.create_database()
+        records = list(database.find_operation(table_name=TableNames.RECORD, filter_dict={}, projection={"_id": 0}))
+        FeatureProfileComputation(database=database, engine=engine).compute_features_profiles()
+        expected_profiles = list(database.find_operation(table_name=TableNames.FEATURE_PROFILE, filter_dict={}, projection={"_id": 0, Resource.TIMESTAMP_: 0}))
+
+        # the same records, whose categorical values are the index of their category in the Feature
+        database.update_one_tuple(table_name=TableNames.FEATURE, filter_dict={Resource.IDENTIFIER_: 2}, update={Feature.CATEGORIES_: [MALE, FEMALE]})
+        for index, category in enumerate([MALE, FEMALE]):
+            database.db[TableNames.RECORD].update_many({Record.INSTANTIATES_: 2, Record.VALUE_: category}, {"$set": {Record.VALUE_: index}})
+        assert database.count_documents(table_name=TableNames.RECORD, filter_dict={Record.VALUE_: 1}) == 4  # three females, and an integer value
+
+        # records are expanded in the same records, and conditions on values apply to expanded values
+        record_reader = RecordReader(database=database, layout=RecordLayouts.DOCUMENTS, expand_values=True)
+        assert list(record_reader.find(filter_dict={}, projection={"_id": 0})) == records
+        assert record_reader.count(filter_dict={Record.INSTANTIATES_: 2, Record.VALUE_: FEMALE}) == 3
+        assert record_reader.count(filter_dict={Record.VALUE_: 1}) == 1
+
+        # compact values are grouped, then expanded, thus profiles are the same
+        FeatureProfileComputation(database=database, engine=engine, value_encoding=ValueEncodings.COMPACT).compute_features_profiles()
+        profiles = list(database.find_operation(table_name=TableNames.FEATURE_PROFILE, filter_dict={}, projection={"_id": 0, Resource.TIMESTAMP_: 0}))
+        assert profiles == expected_profiles
+
+    def test_approximate_profile(self):
+        rng = np.random.default_rng(seed=42)
+        values = [float(value) for value in rng.normal(loc=70, scale=15, size=20000)] + [int(value) for value in rng.integers(0, 100, size=10000)]
+        exact_profile = FeatureProfileComputation.numeric_profile(values=values)
+        sketch = NumericSketch(rank_error=0.01)
+        for value in values:
+            sketch.add(value=value)
+        approximate_profile = FeatureProfileComputation.numeric_profile_from_sketch(sketch=sketch)
+        # moments are exact
+        for statistic in ["min_value", "max_value", "mean_value", "std_value", "skewness", "kurtosis"]:
+            assert math.isclose(exact_profile[statistic], approximate_profile[statistic], rel_tol=1e-9), statistic
+        # quantiles are estimated within the rank error, which is reported
+        assert approximate_profile["rank_error"] == 0.01
+        rank = np.searchsorted(np.sort(values), approximate_profile["median_value"]) / len(values)
+        assert abs(rank - 0.5) <= 0.01
+        assert math.isclose(exact_profile["ema"], approximate_profile["ema"], rel_tol=0.05)
+        assert math.isclose(exact_profile["iqr"], approximate_profile["iqr"], rel_tol=0.05)
+        # the sketch is much smaller than the values
+        assert sum(len(level) for level in approximate_profile["sketch"]["quantiles"]["levels"]) < len(values) / 20
+
+    def test_merge_sketches(self):
+        rng = np.random.default_rng(seed=42)
+        values1 = [float(value) for value in rng.exponential(scale=10, size=15000)]
+        values2 = [float(value) for value in rng.normal(loc=50, scale=5, size=5000)]
+        sketch1, sketch2 = NumericSketch(rank_error=0.01), NumericSketch(rank_error=0.01)
+        for value in values1:
+            sketch1.add(value=value)
+        for value in values2:
+            sketch2.add(value=value)
+        # a sketch is merged after being stored
+        sketch = NumericSketch.from_json(the_json=sketch1.to_json())
+        sketch.merge(other=sketch2)
+        merged_profile = FeatureProfileComputation.numeric_profile_from_sketch(sketch=sketch)
+        exact_profile = FeatureProfileComputation.numeric_profile(values=values1 + values2)
+        assert merged_profile["sketch"]["moments"]["n"] == 20000
+        for statistic in ["min_value", "max_value", "mean_value", "std_value", "skewness", "kurtosis"]:
+            assert math.isclose(exact_profile[statistic], merged_profile[statistic], rel_tol=1e-9), statistic
+        rank = np.searchsorted(np.sort(values1 + values2), merged_profile["median_value"]) / 20000
+        assert abs(rank - 0.5) <= merged_profile["rank_error"]
+
+    def test_approximate_incremental(self):
+        database = Database(execution=TestFeatureProfileComputation.execution)
+        database.insert_many_tuples(table_name=TableNames.FEATURE, tuples=[{Resource.IDENTIFIER_: 1, Feature.DT_: DataTypes.INTEGER}])
+
+        def insert_records(identifiers: range) -> None:
+            database.insert_many_tuples(table_name=TableNames.RECORD, tuples=[
+                {Resource.IDENTIFIER_: identifier, Record.DATASET_: 10, Record.INSTANTIATES_: 1, Record.SUBJECT_: identifier, Record.VALUE_: identifier - 1,
+                 Resource.ENTITY_TYPE_: f"{Profile.PHENOTYPIC}{TableNames.RECORD}"} for identifier in identifiers
+            ])
+
+        def compute_profiles() -> list:
+            # the filters of the records read for the profiles
+            profile_computation = FeatureProfileComputation(database=database, engine=ProfileEngines.SINGLE_PASS, datasets=[10], approximate=True, rank_error=0.01)
+            find = profile_computation.records.find
+            filters = []
+            profile_computation.records.find = lambda filter_dict, projection: filters.append(filter_dict) or find(filter_dict=filter_dict, projection=projection)
+            profile_computation.compute_features_profiles()
+            return filters
+
+        insert_records(identifiers=range(1, 101))
+        compute_profiles()
+        profile = self.get_profile(database=database, dataset=10, feature=1)
+        assert profile["rank_error"] == 0.01
+        assert profile["sketch"]["nb_records"] == 100 and profile["sketch"]["last_identifier"] == 100
+
+        # new records: the stored sketch is merged with the sketch of the new records, which are the only ones to be read
+        insert_records(identifiers=range(101, 151))
+        filters = compute_profiles()
+        assert filters[0]["$or"][1:] == [{Record.DATASET_: 10, Resource.IDENTIFIER_: {"$gt": 100}}]
+        profile = self.get_profile(database=database, dataset=10, feature=1)
+        assert profile["sketch"]["nb_records"] == 150 and profile["sketch"]["last_identifier"] == 150
+        assert profile["mean_value"] == 74.5 and profile["max_value"] == 149 and profile["missing_percentage"] == 0
+        assert len(profile["values_and_counts"]) == 150 and profile["uniqueness"] == 1
+
+        # a record has been written again (thus with a new identifier): the profile is computed from all the records
+        database.db[TableNames.RECORD].update_one({Resource.IDENTIFIER_: 1}, {"$set": {Resource.IDENTIFIER_: 151, Record.VALUE_: 1000}})
+        filters = compute_profiles()
+        assert filters[0] == {Record.INSTANTIATES_: 1, Record.DATASET_: {"$in": [10]}}
+        profile = self.get_profile(database=database, dataset=10, feature=1)
+        assert profile["sketch"]["nb_records"] == 150 and profile["max_value"] == 1000 and profile["min_value"] == 1
+
+    def test_count_values(self):
+        # values are grouped as in MongoDB
+        distinct_values, counts = FeatureProfileComputation.count_values(values=[1, 1.0, True, float("nan"), float("nan"), {"a": 1}, {"a": 1.0}, "1"])
+        assert distinct_values[0] == 1
+        assert distinct_values[1] is True
+        assert math.isnan(distinct_values[2])
+        assert distinct_values[3:] == [{"a": 1}, "1"]
+        assert counts == [2, 1, 2, 2, 1]
@@ -0,0 +1,80 @@
+import unittest
+
+from catalogue.FeatureProfileComputation import FeatureProfileComputation
+from constants.structure import TEST_DB_NAME
+from database.Database import Database
+from database.Execution import Execution
+from database.IndexAdvisor import IndexAdvisor
+from entities.Feature import Feature
+from entities.Record import Record
+from entities.Resource import Resource
+from enums.DataTypes import DataTypes
+from enums.HospitalNames import HospitalNames
+from enums.ParameterKeys import ParameterKeys
+from enums.Profile import Profile
+from enums.TableNames import TableNames
+from utils.test_utils import set_env_variables_from_dict
+
+
+class TestIndexAdvisor(unittest.TestCase):
+    execution = Execution()
+
+    def setUp(self):
+        # before each test, get back to the original test configuration
+        args = {
+            ParameterKeys.DB_NAME: TEST_DB_NAME,
+            ParameterKeys.DB_DROP: "True",
+            ParameterKeys.HOSPITAL_NAME: HospitalNames.TEST_H1
+        }
+        set_env_variables_from_dict(env_vars=args)
+        TestIndexAdvisor.execution.internals_set_up()
+        TestIndexAdvisor.execution.file_set_up(setup_files=False)
+
+    def create_database(self) -> Database:
+        database = Database(execution=TestIndexAdvisor.execution)
+        database.insert_many_tuples(table_name=TableNames.FEATURE, tuples=[
+            {Resource.IDENTIFIER_: 1, Feature.DT_: DataTypes.INTEGER},
+            {Resource.IDENTIFIER_: 2, Feature.DT_: DataTypes.CATEGORY}
+        ], acknowledged=True)
+        database.insert_many_tuples(table_name=TableNames.RECORD, tuples=[
+            {Record.DATASET_: "d1", Record.INSTANTIATES_: i % 2 + 1, Record.SUBJECT_: i, Record.VALUE_: i, Resource.ENTITY_TYPE_: f"{Profile.PHENOTYPIC}{TableNames.RECORD}"}
+            for i in range(100)
+        ] + [
+            {Record.DATASET_: "d2", Record.INSTANTIATES_: 1, Record.SUBJECT_: i, Record.BASE_ID_: f"s{i}", Record.VALUE_: i, Resource.ENTITY_TYPE_: f"{Profile.CLINICAL}{TableNames.RECORD}"}
+            for i in range(100)
+        ], acknowledged=True)
+        for columns in IndexAdvisor.RECORD_INDEXES:
+            database.create_non_unique_index(table_name=TableNames.RECORD, columns=columns)
+        return database
+
+    def test_uses_index(self):
+        index_scan = {"queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "instantiates_1_dataset_1_value_1"}},
+                                       "rejectedPlans": [{"stage": "COLLSCAN"}]}}
+        assert IndexAdvisor.get_plan_stages(explanation=index_scan) == ["FETCH", "IXSCAN"]
+        assert IndexAdvisor.uses_index(explanation=index_scan) is True
+        aggregation_scan = {"stages": [{"$cursor": {"queryPlanner": {"winningPlan": {"queryPlan": {"stage": "PROJECTION_COVERED", "inputStage": {"stage": "IXSCAN"}}}}}},
+                                       {"$group": {}}]}
+        assert IndexAdvisor.uses_index(explanation=aggregation_scan) is True
+        collection_scan = {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}
+        assert IndexAdvisor.uses_index(explanation=collection_scan) is False
+
+    def test_index_build_times(self):
+        database = self.create_database()
+        assert len(database.index_build_times) == len(IndexAdvisor.RECORD_INDEXES)
+        assert f"{TableNames.RECORD}.instantiates_1_dataset_1_value_1" in database.index_build_times
+
+    def test_profile_queries_use_indexes(self):
+        database = self.create_database()
+        profile_computation = FeatureProfileComputation(database=database, datasets=["d1"])
+        # single-pass profiles and Pearson correlations
+        explanation = database.explain_find(table_name=TableNames.RECORD, filter_dict=profile_computation.feature_records_filter(feature_id=1), projection={"_id": 0})
+        assert IndexAdvisor.uses_index(explanation=explanation)
+        explanation = database.explain_find(table_name=TableNames.RECORD, filter_dict={Record.INSTANTIATES_: {"$in": [1]}} | profile_computation.datasets_filter(), projection={"_id": 0})
+        assert IndexAdvisor.uses_index(explanation=explanation)
+        # aggregation profiles, without the final $out and $merge stages, which write in other tables
+        for operations in [profile_computation.counts_patients_query()[:-1],
+                           profile_computation.counts_samples_query()[:-1],
+                           profile_computation.values_and_counts_query(features_ids=[1, 2]),
+                           profile_computation.min_max_mean_median_std_query(features_ids=[1], compute_min=True, compute_max=True, compute_mean=True, compute_median=False, compute_std=True)]:
+            explanation = database.explain_aggregate(table_name=TableNames.RECORD, operations=operations)
+            assert IndexAdvisor.uses_index(explanation=explanation), operations
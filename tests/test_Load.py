@@ -5,6 +5,7 @@ from constants.structure import TEST_DB_NAME
 from database.Database import Database
 from entities.Dataset import Dataset
 from database.Execution import Execution
+from database.IndexAdvisor import IndexAdvisor
 from database.Operators import Operators
 from entities.Feature import Feature
 from entities.Hospital import Hospital
@@ -158,11 +159,12 @@ class TestLoad(unittest.TestCase):
                             # this is the index created for upserts
                             count_indexes += 1
                             assert index["unique"] is True
+                        elif dict(index_keys) in IndexAdvisor.RECORD_INDEXES:
+                            # the compound indexes for profiles and statistics
+                            count_indexes += 1
+                            assert "unique" not in index
                         elif len(index_keys) == 1:
-                            if Record.INSTANTIATES_ in index_keys:
-                                count_indexes += 1
-                                assert "unique" not in index
-                            elif Record.SUBJECT_ in index_keys:
+                            if Record.SUBJECT_ in index_keys:
                                 count_indexes += 1
                                 assert "unique" not in index
                             elif Resource.DATASET_ in index_keys:
@@ -187,7 +189,7 @@ class TestLoad(unittest.TestCase):
             if table_name == TableNames.FEATURE:
                 assert count_indexes == 5  # (_id, identifier, timestamp, entity_type, <onto.name, onto.code>)
             elif table_name == TableNames.RECORD:
-                assert count_indexes == 8  # (_id, identifier, timestamp, entity_type, instantiates, has_subject, dataset, registered_by, <instantiates, has_subject, dataset, registered_by, entity type, base_id>)
+                assert count_indexes == 10  # (_id, identifier, timestamp, entity_type, has_subject, dataset, <instantiates, has_subject, dataset, registered_by, entity type, base_id>, and the 3 compound indexes of IndexAdvisor)
             elif table_name == TableNames.DATASET:
                 assert count_indexes == 4  # (_id, identifier, timestamp, global_identifier)
             elif table_name == TableNames.HOSPITAL:
@@ -0,0 +1,131 @@
+import threading
+import unittest
+
+import pytest
+
+from constants.structure import TEST_DB_NAME
+from database.Database import Database
+from database.Execution import Execution
+from enums.HospitalNames import HospitalNames
+from enums.ParameterKeys import ParameterKeys
+from enums.TableNames import TableNames
+from enums.TimerKeys import TimerKeys
+from etl.LoadPipeline import LoadPipeline
+from statistics.TimeStatistics import TimeStatistics
+from utils.test_utils import set_env_variables_from_dict
+
+
+class SlowDatabase:
+    # a database whose loads are blocked until the test releases them
+    def __init__(self, database: Database):
+        self.database = database
+        self.can_load = threading.Event()
+
+    def load_tuples_in_table(self, table_name: str, unique_variables: list[str], tuples: list[dict], ordered: bool) -> None:
+        self.can_load.wait()
+        self.database.load_tuples_in_table(table_name=table_name, unique_variables=unique_variables, tuples=tuples, ordered=ordered)
+
+
+class ReorderingDatabase:
+    # a database where the first batch is loaded after the second one, as may happen with several loader threads
+    def __init__(self, database: Database):
+        self.database = database
+        self.nb_batches = 0
+        self.second_loaded = threading.Event()
+        self.lock = threading.Lock()
+
+    def load_tuples_in_table(self, table_name: str, unique_variables: list[str], tuples: list[dict], ordered: bool) -> None:
+        with self.lock:
+            self.nb_batches += 1
+            batch_number = self.nb_batches
+        if batch_number == 1:
+            self.second_loaded.wait()
+        self.database.load_tuples_in_table(table_name=table_name, unique_variables=unique_variables, tuples=tuples, ordered=ordered)
+        if batch_number == 2:
+            self.second_loaded.set()
+
+
+class TestLoadPipeline(unittest.TestCase):
+    execution = Execution()
+
+    def setUp(self):
+        args = {
+            ParameterKeys.DB_NAME: TEST_DB_NAME,
+            ParameterKeys.DB_DROP: "True",
+            ParameterKeys.HOSPITAL_NAME: HospitalNames.TEST_H1
+        }
+        set_env_variables_from_dict(env_vars=args)
+        TestLoadPipeline.execution.internals_set_up()
+        TestLoadPipeline.execution.file_set_up(setup_files=False)
+
+    def test_load_batches(self):
+        database = Database(execution=TestLoadPipeline.execution)
+        time_stats = TimeStatistics(record_stats=True)
+        load_pipeline = LoadPipeline(database=database, nb_loaders=2, queue_size=2, time_stats=time_stats)
+        load_pipeline.start()
+        for i in range(10):
+            load_pipeline.put_batch(dataset=None, table_name=TableNames.TEST, unique_variables=["id"],
+                                    tuples=[{"id": 10*i+j, "value": j} for j in range(10)])
+        load_pipeline.wait_until_loaded()
+        assert database.count_documents(table_name=TableNames.TEST, filter_dict={}) == 100
+        # loading the same batch again does not create duplicates
+        load_pipeline.put_batch(dataset=None, table_name=TableNames.TEST, unique_variables=["id"],
+                                tuples=[{"id": j, "value": j} for j in range(10)])
+        load_pipeline.stop()
+        assert database.count_documents(table_name=TableNames.TEST, filter_dict={}) == 100
+        assert len(load_pipeline.loaders) == 0
+        for key in [TimerKeys.TRANSFORM_BLOCKED_TIME, TimerKeys.LOAD_BUSY_TIME, TimerKeys.LOAD_IDLE_TIME]:
+            assert key in time_stats.stats["ALL"]
+            assert time_stats.stats["ALL"][key]["cumulated_time"] >= 0
+
+    def test_backpressure(self):
+        database = SlowDatabase(database=Database(execution=TestLoadPipeline.execution))
+        load_pipeline = LoadPipeline(database=database, nb_loaders=1, queue_size=1, time_stats=TimeStatistics(record_stats=True))
+        load_pipeline.start()
+        # the loader takes the first batch (and waits), the second batch fills the queue, thus the third one has to wait
+        load_pipeline.put_batch(dataset=None, table_name=TableNames.TEST, unique_variables=["id"], tuples=[{"id": 1}])
+        load_pipeline.put_batch(dataset=None, table_name=TableNames.TEST, unique_variables=["id"], tuples=[{"id": 2}])
+        producer = threading.Thread(target=load_pipeline.put_batch, kwargs={"dataset": None, "table_name": TableNames.TEST, "unique_variables": ["id"], "tuples": [{"id": 3}]})
+        producer.start()
+        producer.join(timeout=0.5)
+        assert producer.is_alive(), "The producer should wait while the queue is full."
+        database.can_load.set()
+        producer.join()
+        load_pipeline.stop()
+        assert database.database.count_documents(table_name=TableNames.TEST, filter_dict={}) == 3
+
+    def test_load_error(self):
+        database = Database(execution=TestLoadPipeline.execution)
+        load_pipeline = LoadPipeline(database=database, nb_loaders=1, queue_size=1, time_stats=TimeStatistics(record_stats=True))
+        load_pipeline.start()
+        # tuples without the unique variable cannot be upserted
+        load_pipeline.put_batch(dataset=None, table_name=TableNames.TEST, unique_variables=["id"], tuples=[None])
+        with pytest.raises(RuntimeError):
+            load_pipeline.wait_until_loaded()
+        with pytest.raises(RuntimeError):
+            load_pipeline.stop()
+
+    def test_fast_initial_load_duplicates(self):
+        set_env_variables_from_dict(env_vars={ParameterKeys.FAST_INITIAL_LOAD: "True"})
+        TestLoadPipeline.execution.internals_set_up()
+        database = ReorderingDatabase(database=Database(execution=TestLoadPipeline.execution))
+        load_pipeline = LoadPipeline(database=database, nb_loaders=2, queue_size=2, time_stats=TimeStatistics(record_stats=True))
+        load_pipeline.start()
+        # the same (subject, feature) pair in both batches, and a pair without base_id, which is the same as a null base_id
+        unique_variables = ["has_subject", "instantiates", "base_id"]
+        load_pipeline.put_batch(dataset=None, table_name=TableNames.RECORD, unique_variables=unique_variables, tuples=[
+            {"identifier": 1, "has_subject": 1, "instantiates": 1, "value": "first"},
+            {"identifier": 2, "has_subject": 2, "instantiates": 1, "value": "a"}
+        ])
+        load_pipeline.put_batch(dataset=None, table_name=TableNames.RECORD, unique_variables=unique_variables, tuples=[
+            {"identifier": 3, "has_subject": 1, "instantiates": 1, "base_id": None, "value": "last"},
+            {"identifier": 4, "has_subject": 2, "instantiates": 1, "base_id": "s1", "value": "b"}
+        ])
+        load_pipeline.stop()
+        # the first batch has been inserted last, but the record kept is the last one of the data (the one with the largest identifier)
+        assert database.nb_batches == 2
+        assert database.database.build_deferred_unique_indexes() == {TableNames.RECORD: 1}
+        docs = list(database.database.db[TableNames.RECORD].find({}, {"_id": 0, "identifier": 1, "value": 1}).sort({"identifier": 1}))
+        assert docs == [{"identifier": 2, "value": "a"}, {"identifier": 3, "value": "last"}, {"identifier": 4, "value": "b"}]
+        set_env_variables_from_dict(env_vars={ParameterKeys.FAST_INITIAL_LOAD: "False"})
+        TestLoadPipeline.execution.internals_set_up()
@@ -0,0 +1,61 @@
+import numpy as np
+
+from enums.TimerKeys import TimerKeys
+from etl.MemoryBudget import MemoryBudget
+from statistics.TimeStatistics import TimeStatistics
+
+
+class TestMemoryBudget:
+    def test_adapt_batch_size(self):
+        # no budget: the batch size never changes
+        memory_budget = MemoryBudget(max_memory_mb=0, max_batch_size=4000)
+        assert memory_budget.adapt_batch_size() == 4000
+
+        # a budget far below the RSS of the process: the batch size is halved down to MIN_BATCH_SIZE
+        memory_budget = MemoryBudget(max_memory_mb=1, max_batch_size=4000)
+        assert memory_budget.is_over_budget() is True
+        assert memory_budget.adapt_batch_size() == 2000
+        assert memory_budget.adapt_batch_size() == 1000
+        assert memory_budget.adapt_batch_size() == MemoryBudget.MIN_BATCH_SIZE
+        assert memory_budget.adapt_batch_size() == MemoryBudget.MIN_BATCH_SIZE
+
+        # a budget far above the RSS of the process: the batch size is doubled up to max_batch_size
+        memory_budget.max_memory_mb = 10 ** 9
+        assert memory_budget.is_over_budget() is False
+        assert memory_budget.adapt_batch_size() == 1000
+        assert memory_budget.adapt_batch_size() == 2000
+        assert memory_budget.adapt_batch_size() == 4000
+        assert memory_budget.adapt_batch_size() == 4000
+
+    def test_spill_array(self, tmp_path):
+        array = np.arange(300000, dtype=np.int64)  # 2.4 MB
+
+        # no budget, or an array that is small compared to the budget: the array is kept in memory
+        assert MemoryBudget(max_memory_mb=0, spill_dir=str(tmp_path)).spill_array(array=array) is array
+        assert MemoryBudget(max_memory_mb=10 ** 9, spill_dir=str(tmp_path)).spill_array(array=array) is array
+
+        # over the budget: the array is copied to a memory-mapped file, whose file has already been removed
+        memory_budget = MemoryBudget(max_memory_mb=1, spill_dir=str(tmp_path))
+        spilled_array = memory_budget.spill_array(array=array)
+        assert isinstance(spilled_array, np.memmap)
+        assert np.array_equal(spilled_array, array)
+        assert memory_budget.nb_spilled_arrays == 1
+        assert list(tmp_path.iterdir()) == []
+
+    def test_get_chunk_size(self):
+        assert MemoryBudget(max_memory_mb=100).get_chunk_size(row_memory=1024) == int(MemoryBudget.CHUNK_FRACTION * 100 * 1024)
+        assert MemoryBudget(max_memory_mb=1).get_chunk_size(row_memory=10 ** 6) == MemoryBudget.MIN_BATCH_SIZE
+
+    def test_record_peak_rss(self):
+        MemoryBudget.reset_peak_rss()
+        peak_rss_mb = MemoryBudget.get_peak_rss_mb()
+        assert peak_rss_mb > 0 and peak_rss_mb >= MemoryBudget.get_rss_mb() - 1
+
+        # the peak of a stage is the highest peak recorded for it, kept along with its time
+        time_stats = TimeStatistics(record_stats=True)
+        time_stats.start(dataset="1", key=TimerKeys.TRANSFORM_TIME)
+        time_stats.increment(dataset="1", key=TimerKeys.TRANSFORM_TIME)
+        time_stats.record_peak_rss(peak_rss_mb=100.0, dataset="1", key=TimerKeys.TRANSFORM_TIME)
+        time_stats.record_peak_rss(peak_rss_mb=50.0, dataset="1", key=TimerKeys.TRANSFORM_TIME)
+        assert time_stats.stats["1"][TimerKeys.TRANSFORM_TIME]["peak_rss_mb"] == 100.0
+        assert "cumulated_time" in time_stats.stats["1"][TimerKeys.TRANSFORM_TIME]
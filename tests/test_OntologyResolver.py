@@ -0,0 +1,88 @@
+import threading
+import time
+import unittest
+
+import pandas as pd
+
+from database.OntologyLabelCache import OntologyLabelCache
+from entities.OntologyResource import OntologyResource
+from enums.MetadataColumns import MetadataColumns
+from enums.Ontologies import Ontologies
+from etl.OntologyResolver import OntologyResolver
+from statistics.QualityStatistics import QualityStatistics
+
+
+class FakeResolver(OntologyResolver):
+    # a resolver querying a fake API, which fails once for each (system, code) pair whose code starts with "retry"
+    def __init__(self, nb_threads: int, max_per_api: int):
+        super().__init__(nb_threads=nb_threads, max_per_api=max_per_api)
+        self.lock = threading.Lock()
+        self.nb_calls = {}  # { (system, code): number of calls }
+        self.nb_running_calls = {}  # { system: number of running calls }
+        self.max_running_calls = {}  # { system: max number of running calls }
+
+    def query_api(self, system: str, single_code: str, quality_stats: QualityStatistics) -> str:
+        with self.lock:
+            self.nb_calls[(system, single_code)] = self.nb_calls.get((system, single_code), 0) + 1
+            self.nb_running_calls[system] = self.nb_running_calls.get(system, 0) + 1
+            self.max_running_calls[system] = max(self.max_running_calls.get(system, 0), self.nb_running_calls[system])
+            nb_calls = self.nb_calls[(system, single_code)]
+        time.sleep(0.05)
+        with self.lock:
+            self.nb_running_calls[system] -= 1
+        if single_code.startswith("unknown"):
+            quality_stats.add_failed_api_call(system=system, code=single_code, api_error=OntologyResource.get_not_found_error(single_code=single_code))
+            return ""
+        elif single_code.startswith("retry") and nb_calls == 1:
+            quality_stats.add_failed_api_call(system=system, code=single_code, api_error="Failed connection to the API.")
+            return ""
+        else:
+            return f"label of {single_code}"
+
+
+class TestOntologyResolver(unittest.TestCase):
+    def test_add_metadata(self):
+        metadata = pd.DataFrame({
+            MetadataColumns.ONTO_NAME: ["snomed ct", "LOINC", "", "snomedct"],
+            MetadataColumns.ONTO_CODE: ["365471004 |finding of details of relatives| :247591002", "1234-5", "", ""],
+            MetadataColumns.JSON_VALUES: ["", "", "", '[{"value": "m", "snomed_ct": "248153007"}, {"value": "x", "explanation": "unknown"}, {"value": "f", "loinc": "LA3-6"}]']
+        })
+        resolver = OntologyResolver(nb_threads=2, max_per_api=1)
+        resolver.add_metadata(metadata=metadata)
+        resolver.add_api_value(value="snomedct:422549004")
+        resolver.add_api_value(value="no ontology")
+        assert resolver.codes == {
+            (Ontologies.SNOMEDCT["url"], "365471004"), (Ontologies.SNOMEDCT["url"], "247591002"), (Ontologies.LOINC["url"], "1234-5"),
+            (Ontologies.SNOMEDCT["url"], "248153007"), (Ontologies.LOINC["url"], "LA3-6"), (Ontologies.SNOMEDCT["url"], "422549004")
+        }
+
+    def test_run(self):
+        OntologyLabelCache.set_up(filepath=None, ttl_days=0, offline=False)  # in memory only
+        try:
+            OntologyResolver.BACKOFF_TIME = 0
+            resolver = FakeResolver(nb_threads=8, max_per_api=2)
+            for code in ["1", "2", "3", "retry4", "unknown5"]:
+                resolver.add_code(ontology=Ontologies.SNOMEDCT, full_code=code)
+                resolver.add_code(ontology=Ontologies.LOINC, full_code=code)
+            resolver.run()
+            label_cache = OntologyLabelCache.current
+            assert label_cache.get_label(system=Ontologies.SNOMEDCT["url"], code="1") == ("label of 1", None)
+            assert label_cache.get_label(system=Ontologies.LOINC["url"], code="retry4") == ("label of retry4", None)
+            assert label_cache.get_label(system=Ontologies.LOINC["url"], code="unknown5") == (None, "Resource unknown5 not found.")
+            # failed connections are retried, but not codes that are not found
+            for system in [Ontologies.SNOMEDCT["url"], Ontologies.LOINC["url"]]:
+                assert [resolver.nb_calls[(system, code)] for code in ["1", "2", "3", "retry4", "unknown5"]] == [1, 1, 1, 2, 1]
+            # there are at most 2 concurrent calls to each API
+            assert resolver.max_running_calls[Ontologies.SNOMEDCT["url"]] <= 2
+            assert resolver.max_running_calls[Ontologies.LOINC["url"]] <= 2
+
+            # resolved labels are used by OntologyResources, thus the API is not queried again
+            quality_stats = QualityStatistics(record_stats=True)
+            onto_resource = OntologyResource(system=Ontologies.SNOMEDCT, code="1", label=None, quality_stats=quality_stats)
+            assert onto_resource.label == "label of 1"
+            assert quality_stats.label_cache_lookups == {"hits": 1}
+            resolver.run()
+            assert resolver.nb_calls[(Ontologies.SNOMEDCT["url"], "1")] == 1
+        finally:
+            OntologyResolver.BACKOFF_TIME = 1
+            OntologyLabelCache.current = None
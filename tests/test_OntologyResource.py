@@ -1,7 +1,11 @@
+import os
+import tempfile
 import unittest
 
+from database.OntologyLabelCache import OntologyLabelCache
 from entities.OntologyResource import OntologyResource
 from enums.Ontologies import Ontologies
+from statistics.QualityStatistics import QualityStatistics
 
 
 class TestOntologyResource(unittest.TestCase):
@@ -32,3 +36,36 @@ class TestOntologyResource(unittest.TestCase):
         assert o2.label == "Fluorescence polarization immunoassay technique:Intensity change"
         assert o3.label == "Details of relatives:Affecting=(Known present=Genetic disease)"
         assert o4.label == "alternative mRNA splicing via spliceosome"  # removed comma between splicing and via because this is a snomed operator
+
+    def test_label_cache(self):
+        with tempfile.TemporaryDirectory() as folder:
+            filepath = os.path.join(folder, "labels.sqlite")
+            cache = OntologyLabelCache(filepath=filepath, ttl_days=30, offline=False)
+            cache.add_label(system=Ontologies.SNOMEDCT["url"], code="422549004", label="patient-related identification code")
+            cache.add_not_found(system=Ontologies.SNOMEDCT["url"], code="123", error=OntologyResource.get_not_found_error(single_code="123"))
+            assert cache.get_label(system=Ontologies.SNOMEDCT["url"], code="422549004") == ("patient-related identification code", None)
+            assert cache.get_label(system=Ontologies.SNOMEDCT["url"], code="123") == (None, "Resource 123 not found.")
+            assert cache.get_label(system=Ontologies.LOINC["url"], code="422549004") is None
+            cache.close()
+            # expired entries are queried again, except in offline mode
+            for offline in [False, True]:
+                cache = OntologyLabelCache(filepath=filepath, ttl_days=0, offline=offline)
+                assert (cache.get_label(system=Ontologies.SNOMEDCT["url"], code="422549004") is not None) == offline
+                cache.close()
+
+            # in offline mode, labels are only taken from the cache (thus, this does not query any API)
+            OntologyLabelCache.set_up(filepath=filepath, ttl_days=30, offline=True)
+            try:
+                quality_stats = QualityStatistics(record_stats=True)
+                o1 = OntologyResource(system=Ontologies.SNOMEDCT, code="422549004:123", label=None, quality_stats=quality_stats)
+                o2 = OntologyResource(system=Ontologies.SNOMEDCT, code="1234", label=None, quality_stats=quality_stats)
+            finally:
+                OntologyLabelCache.current.close()
+                OntologyLabelCache.current = None
+            assert o1.label == "patient-related identification code:"
+            assert o2.label == ""
+            assert quality_stats.label_cache_lookups == {"hits": 2, "misses": 1}
+            assert quality_stats.failed_api_calls == {
+                f"{Ontologies.SNOMEDCT['url']}/123": "Resource 123 not found.",
+                f"{Ontologies.SNOMEDCT['url']}/1234": "No cached label for resource 1234 in offline mode."
+            }
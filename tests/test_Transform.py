@@ -3,6 +3,8 @@ import os
 import re
 import time
 import unittest
+from unittest import mock
+from datetime import datetime
 
 import pandas as pd
 import pytest
@@ -13,6 +15,8 @@ from database.Counter import Counter
 from database.Database import Database
 from entities.Dataset import Dataset
 from database.Execution import Execution
+from database.RecordReader import RecordReader
+from entities.ClinicalRecord import ClinicalRecord
 from entities.Feature import Feature
 from entities.Hospital import Hospital
 from entities.OntologyResource import OntologyResource
@@ -24,9 +28,12 @@ from enums.MetadataColumns import MetadataColumns
 from enums.Ontologies import Ontologies
 from enums.ParameterKeys import ParameterKeys
 from enums.Profile import Profile
+from enums.RecordLayouts import RecordLayouts
 from enums.TableNames import TableNames
 from enums.TheTestFiles import TheTestFiles
+from enums.ValueEncodings import ValueEncodings
 from enums.Visibility import Visibility
+from etl.Load import Load
 from etl.Transform import Transform
 from statistics.QualityStatistics import QualityStatistics
 from utils.cast_utils import cast_str_to_datetime
@@ -175,10 +182,14 @@ class TestTransform(unittest.TestCase):
         counter.set_with_database(database=transform.database)
 
         assert transform.counter.resource_id == 0
+        # the database only contains the hospital created in my_setup
+        assert counter.resource_id == 1
 
-        # when some tables already contain resources, it should not be 0
+        # when some tables already contain resources, but there is no identifier counter yet
+        # (e.g., the database has been created before it existed), it should start after the max identifier
         # I manually insert some resources in the database
         database = Database(execution=TestTransform.execution)
+        database.drop_table(table_name=TableNames.COUNTER)
         my_tuples = [
             {"identifier": 1},
             {"identifier": 2},
@@ -191,8 +202,24 @@ class TestTransform(unittest.TestCase):
         ]
         database.insert_many_tuples(table_name=TableNames.FEATURE, tuples=my_tuples)
         time.sleep(2)
-        counter.set_with_database(database=transform.database)
-        assert counter.resource_id == 125
+        counter.set_with_database(database=database)
+        assert counter.resource_id == 124
+        assert counter.increment() == 125
+
+        # identifiers are reserved in the database, thus they are shared by all counters
+        other_counter = Counter()
+        other_counter.set_with_database(database=database)
+        assert other_counter.resource_id == 125
+        assert other_counter.increment() == 126
+        assert counter.reserve(nb_ids=10) == 127
+        assert counter.resource_id == 136
+
+        # a reserved block is handed out by increment() without reserving again, until it is exhausted
+        counter.reserve_block(nb_ids=3)
+        with mock.patch.object(database, "reserve_identifiers", side_effect=AssertionError("the block should be used")):
+            assert [counter.increment() for _ in range(3)] == [137, 138, 139]
+        assert other_counter.increment() == 140
+        assert counter.increment() == 141
 
     def test_phenotypic_data(self):
         transform = my_setup(hospital_name=HospitalNames.TEST_H1, profile=Profile.PHENOTYPIC,
@@ -390,6 +417,213 @@ class TestTransform(unittest.TestCase):
         assert get_field_value_for_patient(records=records, features=features, patient_id=transform.patient_ids_mapping["999999990"], column_name="molecule_b") is None  # no value, thus no Record
     # TODO Nelly: check there are no duplicates for SamFeature instances
 
+    def test_generate_records(self):
+        transform = my_setup(hospital_name=HospitalNames.TEST_H1, profile=Profile.CLINICAL,
+                             extracted_metadata_path=TheTestFiles.EXTR_METADATA_CLINICAL_PATH,
+                             extracted_data_paths=TheTestFiles.EXTR_CLINICAL_DATA_PATH,
+                             extracted_column_to_categorical_path=TheTestFiles.EXTR_CLINICAL_COL_CAT_PATH,
+                             extracted_column_unit_path=TheTestFiles.EXTR_CLINICAL_UNITS_PATH,
+                             extracted_domain_path=TheTestFiles.EXTR_CLINICAL_DOMAIN_PATH,
+                             extracted_column_type_path=TheTestFiles.EXTR_CLINICAL_TYPE_PATH,
+                             extracted_patient_ids_mapping_path=TheTestFiles.EXTR_FILLED_PIDS_PATH)
+        transform.load_patient_id_mapping()
+        transform.create_patients()
+        transform.counter.set_with_database(database=transform.database)
+        transform.create_features()
+        mapping_column_to_feature_id = transform.database.retrieve_mapping(table_name=TableNames.FEATURE, key_fields=Feature.NAME_,
+                                                                           value_fields=Resource.IDENTIFIER_, filter_dict={})
+
+        # records built column by column should be the same (and in the same order) as records built cell by cell
+        transform.counter.set(new_value=100)
+        records = []
+        for batch_of_records in transform.generate_records(mapping_column_to_feature_id=mapping_column_to_feature_id, hospital_id=1):
+            records.extend(batch_of_records)
+        assert transform.counter.resource_id == 100 + len(records)
+
+        counter = Counter()
+        counter.set(new_value=100)
+        expected_records = []
+        for _, row in transform.data.iterrows():
+            for column_name in transform.data.columns:
+                if row[column_name] != "" and column_name in mapping_column_to_feature_id:
+                    expected_records.append(ClinicalRecord(identifier=NO_ID, instantiates=mapping_column_to_feature_id[column_name],
+                                                           has_subject=transform.patient_ids_mapping[row[transform.execution.patient_id_column_name]], registered_by=1,
+                                                           value=transform.fairify_value(column_name=column_name, value=row[column_name]),
+                                                           base_id=row[transform.execution.sample_id_column_name], counter=counter, dataset=None).to_json())
+        assert len(records) == len(expected_records)
+        for record, expected_record in zip(records, expected_records):
+            record.pop(Resource.TIMESTAMP_)
+            expected_record.pop(Resource.TIMESTAMP_)
+            assert record == expected_record
+
+    def test_generate_records_in_workers(self):
+        transform = my_setup(hospital_name=HospitalNames.TEST_H1, profile=Profile.PHENOTYPIC,
+                             extracted_metadata_path=TheTestFiles.EXTR_METADATA_PHENOTYPIC_PATH,
+                             extracted_data_paths=TheTestFiles.EXTR_PHENOTYPIC_DATA_PATH,
+                             extracted_column_to_categorical_path=TheTestFiles.EXTR_PHENOTYPIC_COL_CAT_PATH,
+                             extracted_column_unit_path=TheTestFiles.EXTR_PHENOTYPIC_UNITS_PATH,
+                             extracted_domain_path=TheTestFiles.EXTR_PHENOTYPIC_DOMAIN_PATH,
+                             extracted_column_type_path=TheTestFiles.EXTR_PHENOTYPIC_TYPE_PATH,
+                             extracted_patient_ids_mapping_path=TheTestFiles.EXTR_EMPTY_PIDS_PATH)
+        transform.load_patient_id_mapping()
+        transform.create_patients()
+        transform.counter.set_with_database(database=transform.database)
+        transform.create_features()
+        mapping_column_to_feature_id = transform.database.retrieve_mapping(table_name=TableNames.FEATURE, key_fields=Feature.NAME_,
+                                                                           value_fields=Resource.IDENTIFIER_, filter_dict={})
+
+        # records created by several workers should be the same (and in the same order) as records created in a single process
+        records = {}
+        quality_stats = {}
+        for nb_workers in [1, 3]:
+            transform.execution.nb_workers = nb_workers
+            transform.quality_stats = QualityStatistics(record_stats=True)
+            transform.counter.set(new_value=100)
+            records[nb_workers] = []
+            for batch_of_records in transform.generate_records(mapping_column_to_feature_id=mapping_column_to_feature_id, hospital_id=1):
+                records[nb_workers].extend(batch_of_records)
+            assert transform.counter.resource_id == 100 + len(records[nb_workers])
+            for record in records[nb_workers]:
+                record.pop(Resource.TIMESTAMP_)
+            quality_stats[nb_workers] = transform.quality_stats.to_json()
+            quality_stats[nb_workers].pop("timestamp")
+        transform.execution.nb_workers = 1
+        assert len(records[1]) > 0
+        # NaN values are not equal to each other, thus we compare the string representations
+        assert str(records[3]) == str(records[1])
+        assert quality_stats[3] == quality_stats[1]
+
+    def test_create_records_direct_load(self):
+        transform = my_setup(hospital_name=HospitalNames.TEST_H1, profile=Profile.PHENOTYPIC,
+                             extracted_metadata_path=TheTestFiles.EXTR_METADATA_PHENOTYPIC_PATH,
+                             extracted_data_paths=TheTestFiles.EXTR_PHENOTYPIC_DATA_PATH,
+                             extracted_column_to_categorical_path=TheTestFiles.EXTR_PHENOTYPIC_COL_CAT_PATH,
+                             extracted_column_unit_path=TheTestFiles.EXTR_PHENOTYPIC_UNITS_PATH,
+                             extracted_domain_path=TheTestFiles.EXTR_PHENOTYPIC_DOMAIN_PATH,
+                             extracted_column_type_path=TheTestFiles.EXTR_PHENOTYPIC_TYPE_PATH,
+                             extracted_patient_ids_mapping_path=TheTestFiles.EXTR_EMPTY_PIDS_PATH)
+        transform.load_patient_id_mapping()
+        transform.create_patients()
+        transform.counter.set_with_database(database=transform.database)
+        transform.create_features()
+        transform.counter.set_with_database(database=transform.database)
+        first_counter = transform.counter.resource_id
+        unique_variables = Load.get_record_unique_variables(profile=Profile.PHENOTYPIC)
+        projection = {"_id": 0, Resource.TIMESTAMP_: 0}
+
+        # 1. records are written in a file, which is loaded in the database
+        transform.create_records()
+        transform.database.load_json_in_table(table_name=TableNames.RECORD, unique_variables=unique_variables, dataset_id=transform.dataset_id)
+        records_from_file = list(transform.database.find_operation(table_name=TableNames.RECORD, filter_dict={}, projection=projection).sort(Resource.IDENTIFIER_))
+        nb_records_in_file = len(get_transform_records(profile=Profile.PHENOTYPIC))
+
+        # 2. records are directly loaded in the database, without audit files
+        transform.database.drop_table(table_name=TableNames.RECORD)
+        transform.counter.set(new_value=first_counter)
+        TestTransform.execution.direct_load = True
+        try:
+            transform.create_records()
+        finally:
+            TestTransform.execution.direct_load = False
+        records_direct = list(transform.database.find_operation(table_name=TableNames.RECORD, filter_dict={}, projection=projection).sort(Resource.IDENTIFIER_))
+
+        assert len(records_direct) == len(records_from_file) == nb_records_in_file
+        assert len(get_transform_records(profile=Profile.PHENOTYPIC)) == nb_records_in_file  # no record has been appended to the file
+        for record_direct, record_from_file in zip(records_direct, records_from_file):
+            assert str(record_direct) == str(record_from_file)  # str() because NaN != NaN
+        assert any(isinstance(record[Record.VALUE_], datetime) for record in records_direct)
+
+    def test_create_records_buckets(self):
+        transform = my_setup(hospital_name=HospitalNames.TEST_H1, profile=Profile.PHENOTYPIC,
+                             extracted_metadata_path=TheTestFiles.EXTR_METADATA_PHENOTYPIC_PATH,
+                             extracted_data_paths=TheTestFiles.EXTR_PHENOTYPIC_DATA_PATH,
+                             extracted_column_to_categorical_path=TheTestFiles.EXTR_PHENOTYPIC_COL_CAT_PATH,
+                             extracted_column_unit_path=TheTestFiles.EXTR_PHENOTYPIC_UNITS_PATH,
+                             extracted_domain_path=TheTestFiles.EXTR_PHENOTYPIC_DOMAIN_PATH,
+                             extracted_column_type_path=TheTestFiles.EXTR_PHENOTYPIC_TYPE_PATH,
+                             extracted_patient_ids_mapping_path=TheTestFiles.EXTR_EMPTY_PIDS_PATH)
+        transform.load_patient_id_mapping()
+        transform.create_patients()
+        transform.counter.set_with_database(database=transform.database)
+        transform.create_features()
+        transform.counter.set_with_database(database=transform.database)
+        first_counter = transform.counter.resource_id
+        projection = {"_id": 0, Resource.TIMESTAMP_: 0}
+
+        # 1. records are directly loaded in the Record table
+        TestTransform.execution.direct_load = True
+        try:
+            transform.create_records()
+            records = list(RecordReader(database=transform.database, layout=RecordLayouts.DOCUMENTS).find(filter_dict={}, projection=projection).sort(Resource.IDENTIFIER_))
+
+            # 2. the same records are directly loaded by buckets in the RecordBucket table
+            transform.counter.set(new_value=first_counter)
+            TestTransform.execution.record_layout = RecordLayouts.BUCKETS
+            try:
+                transform.create_records()
+            finally:
+                TestTransform.execution.record_layout = RecordLayouts.DOCUMENTS
+        finally:
+            TestTransform.execution.direct_load = False
+        buckets = list(transform.database.find_operation(table_name=TableNames.RECORD_BUCKET, filter_dict={}, projection={}))
+        records_from_buckets = list(RecordReader(database=transform.database, layout=RecordLayouts.BUCKETS).find(filter_dict={}, projection=projection))
+        records_from_buckets.sort(key=lambda record: record[Resource.IDENTIFIER_])
+
+        # there is one bucket per feature (each having less than BUCKET_SIZE records), and buckets expand in the same records
+        assert len(buckets) == len({record[Record.INSTANTIATES_] for record in records}) < len(records)
+        assert len(records_from_buckets) == len(records)
+        for record_from_buckets, record in zip(records_from_buckets, records):
+            assert str(dict(sorted(record_from_buckets.items()))) == str(dict(sorted(record.items())))  # str() because NaN != NaN
+
+    def test_create_records_compact_values(self):
+        transform = my_setup(hospital_name=HospitalNames.TEST_H1, profile=Profile.PHENOTYPIC,
+                             extracted_metadata_path=TheTestFiles.EXTR_METADATA_PHENOTYPIC_PATH,
+                             extracted_data_paths=TheTestFiles.EXTR_PHENOTYPIC_DATA_PATH,
+                             extracted_column_to_categorical_path=TheTestFiles.EXTR_PHENOTYPIC_COL_CAT_PATH,
+                             extracted_column_unit_path=TheTestFiles.EXTR_PHENOTYPIC_UNITS_PATH,
+                             extracted_domain_path=TheTestFiles.EXTR_PHENOTYPIC_DOMAIN_PATH,
+                             extracted_column_type_path=TheTestFiles.EXTR_PHENOTYPIC_TYPE_PATH,
+                             extracted_patient_ids_mapping_path=TheTestFiles.EXTR_EMPTY_PIDS_PATH)
+        transform.load_patient_id_mapping()
+        transform.create_patients()
+        transform.counter.set_with_database(database=transform.database)
+        transform.create_features()
+        transform.counter.set_with_database(database=transform.database)
+        first_counter = transform.counter.resource_id
+        projection = {"_id": 0, Resource.TIMESTAMP_: 0}
+
+        # 1. records are directly loaded with verbose values
+        TestTransform.execution.direct_load = True
+        try:
+            transform.create_records()
+            records = list(transform.database.find_operation(table_name=TableNames.RECORD, filter_dict={}, projection=projection).sort(Resource.IDENTIFIER_))
+
+            # 2. the same records are directly loaded with compact values
+            transform.database.drop_table(table_name=TableNames.RECORD)
+            transform.counter.set(new_value=first_counter)
+            TestTransform.execution.value_encoding = ValueEncodings.COMPACT
+            try:
+                transform.create_records()
+            finally:
+                TestTransform.execution.value_encoding = ValueEncodings.VERBOSE
+        finally:
+            TestTransform.execution.direct_load = False
+        compact_records = list(transform.database.find_operation(table_name=TableNames.RECORD, filter_dict={}, projection=projection).sort(Resource.IDENTIFIER_))
+        expanded_records = list(RecordReader(database=transform.database, layout=RecordLayouts.DOCUMENTS, expand_values=True).find(filter_dict={}, projection=projection))
+        expanded_records.sort(key=lambda record: record[Resource.IDENTIFIER_])
+
+        # categorical values are stored as the index of their category, and expanded in the same records
+        categories_per_feature = {feature[Resource.IDENTIFIER_]: feature[Feature.CATEGORIES_] for feature in transform.database.find_operation(table_name=TableNames.FEATURE, filter_dict={Feature.CATEGORIES_: {"$exists": 1}}, projection={})}
+        nb_categorical_values = 0
+        for compact_record, record in zip(compact_records, records):
+            if compact_record[Record.INSTANTIATES_] in categories_per_feature and isinstance(record[Record.VALUE_], dict):
+                nb_categorical_values += 1
+                assert categories_per_feature[compact_record[Record.INSTANTIATES_]][compact_record[Record.VALUE_]] == record[Record.VALUE_]
+        assert nb_categorical_values > 0
+        assert len(expanded_records) == len(records)
+        for expanded_record, record in zip(expanded_records, records):
+            assert str(dict(sorted(expanded_record.items()))) == str(dict(sorted(record.items())))  # str() because NaN != NaN
+
     def test_create_patients_without_pid(self):
         transform = my_setup(hospital_name=HospitalNames.TEST_H1, profile=Profile.PHENOTYPIC,
                              extracted_metadata_path=TheTestFiles.EXTR_METADATA_PHENOTYPIC_PATH,
@@ -539,6 +773,29 @@ class TestTransform(unittest.TestCase):
         assert pd.isnull(transform.fairify_value(column_name="molecule_g", value=transform.data.iloc[6][4]))
         assert pd.isnull(transform.fairify_value(column_name="molecule_g", value=transform.data.iloc[7][4]))
 
+    def test_fairify_clin_values(self):
+        transform = my_setup(hospital_name=HospitalNames.TEST_H1, profile=Profile.CLINICAL,
+                             extracted_metadata_path=TheTestFiles.EXTR_METADATA_CLINICAL_PATH,
+                             extracted_data_paths=TheTestFiles.EXTR_CLINICAL_DATA_PATH,
+                             extracted_column_to_categorical_path=TheTestFiles.EXTR_CLINICAL_COL_CAT_PATH,
+                             extracted_column_type_path=TheTestFiles.EXTR_CLINICAL_TYPE_PATH,
+                             extracted_column_unit_path=TheTestFiles.EXTR_CLINICAL_UNITS_PATH,
+                             extracted_domain_path=TheTestFiles.EXTR_CLINICAL_DOMAIN_PATH,
+                             extracted_patient_ids_mapping_path=TheTestFiles.EXTR_EMPTY_PIDS_PATH)
+
+        # fairifying a whole column should give the same values (with the same types) as fairifying each of its values
+        for column_name in transform.data.columns:
+            values = transform.data[column_name][transform.data[column_name] != ""]
+            fairified_values = transform.fairify_values(column_name=column_name, values=values)
+            expected_values = [transform.fairify_value(column_name=column_name, value=value) for value in values]
+            assert len(fairified_values) == len(expected_values)
+            for fairified_value, expected_value in zip(fairified_values, expected_values):
+                assert type(fairified_value) is type(expected_value)
+                assert (pd.isnull(fairified_value) and pd.isnull(expected_value)) or fairified_value == expected_value
+        # and values with a unit are cast only when the unit is the expected one
+        transform.mapping_column_to_unit["molecule_b"] = "mg"
+        assert transform.fairify_values(column_name="molecule_b", values=pd.Series(["100 mg", "100 g", "100"])) == [100, "100 g", 100]
+
     def test_load_empty_patient_id_mapping(self):
         extract = my_setup(hospital_name=HospitalNames.TEST_H1, profile=Profile.CLINICAL,
                              extracted_metadata_path=TheTestFiles.EXTR_METADATA_CLINICAL_PATH,
@@ -0,0 +1,68 @@
+import numpy as np
+
+from enums.TimerKeys import TimerKeys
+from etl.ValueCache import ValueCache
+from statistics.TimeStatistics import TimeStatistics
+
+
+class TestValueCache:
+    @staticmethod
+    def compute_upper(computed: list):
+        # a computation recording the values it has been called with
+        def compute(raw_values: list) -> list:
+            computed.extend(raw_values)
+            return [value.upper() if isinstance(value, str) else value for value in raw_values]
+        return compute
+
+    def test_map_values(self):
+        value_cache = ValueCache(max_size=10)
+        computed = []
+        values = np.array(["a", "b", "a", np.nan, "a", "b"], dtype=object)
+        results = value_cache.map_values(column_name="col", values=values, compute=TestValueCache.compute_upper(computed))
+        assert results[0:3] == ["A", "B", "A"] and np.isnan(results[3]) and results[4:6] == ["A", "B"]
+        assert computed[0:2] == ["a", "b"] and len(computed) == 3  # each distinct value is computed once
+
+        # cached values are not computed again, other values than str are never cached
+        computed.clear()
+        results = value_cache.map_values(column_name="col", values=np.array(["b", "c", np.nan], dtype=object), compute=TestValueCache.compute_upper(computed))
+        assert results[0:2] == ["B", "C"]
+        assert computed[0] == "c" and len(computed) == 2
+        assert value_cache.counts["col"] == [9, 5]
+
+        # values of another variant are cached separately
+        computed.clear()
+        value_cache.map_values(column_name="col", values=np.array(["b"], dtype=object), compute=TestValueCache.compute_upper(computed), variant=True)
+        assert computed == ["b"]
+
+    def test_lru_eviction(self):
+        value_cache = ValueCache(max_size=2)
+        computed = []
+        for value in ["a", "b", "a", "c", "a", "b"]:
+            value_cache.map_values(column_name="col", values=np.array([value], dtype=object), compute=TestValueCache.compute_upper(computed))
+        # "b" is the least recently used value when "c" is cached, and "c" when "b" is cached again
+        assert computed == ["a", "b", "c", "b"]
+        assert list(value_cache.caches[("col", None)].keys()) == ["a", "b"]
+
+    def test_disable_high_cardinality_columns(self):
+        value_cache = ValueCache(max_size=100000)
+        computed = []
+        identifiers = np.array([f"id{i}" for i in range(ValueCache.MIN_LOOKUPS)], dtype=object)
+        categories = np.array(["f", "m"] * (ValueCache.MIN_LOOKUPS // 2), dtype=object)
+        value_cache.map_values(column_name="id", values=identifiers, compute=TestValueCache.compute_upper(computed))
+        value_cache.map_values(column_name="sex", values=categories, compute=TestValueCache.compute_upper(computed))
+        assert value_cache.disabled_columns == {"id"}
+        assert ("id", None) not in value_cache.caches and ("sex", None) in value_cache.caches
+
+        # values of disabled columns are always computed
+        computed.clear()
+        results = value_cache.map_values(column_name="id", values=identifiers[0:2], compute=TestValueCache.compute_upper(computed))
+        assert results == ["ID0", "ID1"]
+        assert computed == ["id0", "id1"]
+
+    def test_report(self):
+        value_cache = ValueCache(max_size=10)
+        value_cache.map_values(column_name="col", values=np.array(["a", "a", "a", "b"], dtype=object), compute=TestValueCache.compute_upper([]))
+        value_cache.merge_counts(counts={"col": [4, 0]})
+        time_stats = TimeStatistics(record_stats=True)
+        value_cache.report(time_stats=time_stats, dataset=None, key=TimerKeys.FAIRIFICATION_CACHE)
+        assert time_stats.stats["ALL"][TimerKeys.FAIRIFICATION_CACHE]["col"] == {"lookups": 8, "hits": 6, "hit_rate": 0.75, "disabled": False}